@@ -0,0 +1,499 @@
+import asyncio
+import collections
+import contextlib
+import hashlib
+import inspect
+import math
+import threading
+import time
+import uuid
+
+import redis
+
+import tracing
+
+# --- ADMISSION CONTROL ---
+# Every chat turn first takes its session's lock, so two turns of one conversation never run
+# the agent (and write the Redis history) at the same time. Turns that need the agent then take
+# one of this process's agent slots, queueing behind the others up to a limit; past that they
+# are turned away straight away with a 429 and a Retry-After, instead of slowing everyone down.
+LOCK_KEY_PREFIX = "chat_lock:"
+RESULT_KEY_PREFIX = "chat_result:"
+
+# How often a turn waiting on its session (or on the agent queue, when async) checks again.
+POLL_SECONDS = 0.05
+
+# KEYS: lock, result. ARGV: "<token> " (the lock value's prefix), publish ("1"/"0"), answer, dedupe seconds.
+RELEASE_SCRIPT = """
+if ARGV[2] == '1' then
+    redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[4])
+end
+local held = redis.call('GET', KEYS[1])
+if held and string.sub(held, 1, #ARGV[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS: lock. ARGV: "<token> ", lock ttl in milliseconds.
+RENEW_SCRIPT = """
+local held = redis.call('GET', KEYS[1])
+if held and string.sub(held, 1, #ARGV[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class Overloaded(Exception):
+    """
+    A turn that can't be admitted. `retry_after` is a suggested wait in whole seconds.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+def message_hash(message):
+    # Whitespace and case differences still count as the same message.
+    return hashlib.sha1(" ".join(message.split()).lower().encode()).hexdigest()[:16]
+
+
+async def _resolve(value):
+    # Lets one code path drive both the sync and the asyncio Redis clients.
+    return await value if inspect.isawaitable(value) else value
+
+
+# --- PER-SESSION TURNS ---
+class SessionTurn:
+    """
+    One admitted turn. `duplicate` is the answer to an identical request that was already in
+    flight, in which case the caller returns it instead of running the turn. Otherwise, set
+    `response` once the turn is answered so duplicates waiting on it get the same answer.
+    """
+
+    def __init__(self, session_id, digest, token=None, duplicate=None):
+        self.session_id = session_id
+        self.digest = digest
+        self.token = token
+        self.duplicate = duplicate
+        self.response = None
+        self.holds_lock = False
+
+
+class SessionTurns:
+    """
+    Serializes the turns of each session across every worker process with a Redis lock, and
+    collapses duplicates.
+
+    The lock's value names the turn holding it and a hash of its message. A request for the
+    same session waits for the lock; if the holder is answering the same message (a double-send,
+    or the widget retrying a request that is still running), the waiter takes the holder's
+    answer when it is published instead of running the agent a second time. Answers are only
+    kept for `dedupe_seconds`, long enough for the waiters, so the same message sent again
+    later (another "yes") is a new turn.
+
+    Uncontended, taking the lock is one round trip, and releasing it (publishing the answer and
+    deleting the lock if it is still ours) is one more: a single Lua script. While a turn runs its
+    lock is extended every third of `lock_ttl`, so it only expires if the worker dies mid-turn.
+    A request that has waited `wait_seconds` gives up with Overloaded. Redis servers without
+    scripting fall back to a WATCH/MULTI transaction for releasing and renewing.
+    """
+
+    def __init__(self, lock_ttl=120, wait_seconds=30, dedupe_seconds=10):
+        self.lock_ttl = lock_ttl
+        self.wait_seconds = wait_seconds
+        self.dedupe_seconds = dedupe_seconds
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+        self._scripting = True
+
+    def _queue_try(self, pipe, session_id, value, awaited):
+        pipe.set(LOCK_KEY_PREFIX + session_id, value, nx=True, px=int(self.lock_ttl * 1000))
+        pipe.get(LOCK_KEY_PREFIX + session_id)
+        if awaited:
+            pipe.get(RESULT_KEY_PREFIX + awaited)
+
+    def _attempt(self, results, turn, awaited):
+        """
+        Reads one attempt's results. Returns the token of a turn answering the same message
+        (the one to wait for) and whether `turn` is now settled: holding the lock, or a duplicate.
+        """
+        acquired, holder = results[0], results[1]
+        answer = results[2] if awaited else None
+        turn.holds_lock = bool(acquired)
+        if answer is not None:
+            turn.duplicate = answer.decode() if isinstance(answer, bytes) else answer
+            return awaited, True
+        if acquired:
+            return awaited, True
+        if holder:
+            holder_token, _, holder_digest = (holder.decode() if isinstance(holder, bytes) else holder).partition(" ")
+            if holder_digest == turn.digest:
+                awaited = holder_token
+        return awaited, False
+
+    def _settled(self, turn, waited):
+        if turn.duplicate is not None:
+            self._count("duplicates")
+        elif waited:
+            self._count("waited")
+        self._count("turns")
+        return turn
+
+    def _timed_out(self):
+        self._count("timeouts")
+        tracing.ADMISSION_REJECTIONS.labels("session_busy").inc()
+        return Overloaded("Still working on your previous message. Please try again in a moment.", 5)
+
+    def acquire(self, client, session_id, message):
+        turn = SessionTurn(session_id, message_hash(message), token=uuid.uuid4().hex)
+        value = f"{turn.token} {turn.digest}"
+        awaited = None
+        attempts = 0
+        started = time.monotonic()
+        with tracing.span("admission", "session_lock") as attrs:
+            while True:
+                attempts += 1
+                pipe = client.pipeline(transaction=False)
+                self._queue_try(pipe, session_id, value, awaited)
+                awaited, settled = self._attempt(pipe.execute(), turn, awaited)
+                if settled:
+                    break
+                if time.monotonic() - started > self.wait_seconds:
+                    raise self._timed_out()
+                time.sleep(POLL_SECONDS)
+            attrs["duplicate"] = turn.duplicate is not None
+        if turn.duplicate is not None and turn.holds_lock:
+            self.release(client, turn)  # Taken just as the answer was published; nothing of ours to store.
+        return self._settled(turn, attempts > 1)
+
+    async def aacquire(self, client, session_id, message):
+        """
+        acquire() for async callers. Works with either client: a sync one blocks the event loop
+        for each round trip, which is fine where the loop serves a single request (the Flask stream).
+        """
+        turn = SessionTurn(session_id, message_hash(message), token=uuid.uuid4().hex)
+        value = f"{turn.token} {turn.digest}"
+        awaited = None
+        attempts = 0
+        started = time.monotonic()
+        with tracing.span("admission", "session_lock") as attrs:
+            while True:
+                attempts += 1
+                pipe = client.pipeline(transaction=False)
+                self._queue_try(pipe, session_id, value, awaited)
+                awaited, settled = self._attempt(await _resolve(pipe.execute()), turn, awaited)
+                if settled:
+                    break
+                if time.monotonic() - started > self.wait_seconds:
+                    raise self._timed_out()
+                await asyncio.sleep(POLL_SECONDS)
+            attrs["duplicate"] = turn.duplicate is not None
+        if turn.duplicate is not None and turn.holds_lock:
+            await self.arelease(client, turn)
+        return self._settled(turn, attempts > 1)
+
+    def _release_args(self, turn):
+        publish = turn.response is not None and turn.duplicate is None
+        keys = [LOCK_KEY_PREFIX + turn.session_id, RESULT_KEY_PREFIX + turn.token]
+        return keys + [f"{turn.token} ", "1" if publish else "0", turn.response if publish else "", self.dedupe_seconds]
+
+    def _no_scripting(self, error):
+        if "unknown command" not in str(error).lower():
+            raise error
+        print("Redis has no scripting; session locks fall back to WATCH/MULTI.")
+        self._scripting = False
+
+    def release(self, client, turn):
+        """
+        Publishes the turn's answer for any duplicates waiting on it, then frees the lock if
+        this turn still holds it (it may have expired and been taken by another turn).
+        """
+        if self._scripting:
+            try:
+                client.eval(RELEASE_SCRIPT, 2, *self._release_args(turn))
+                return
+            except redis.ResponseError as e:
+                self._no_scripting(e)
+        with client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(LOCK_KEY_PREFIX + turn.session_id)
+                held = pipe.get(LOCK_KEY_PREFIX + turn.session_id)
+                pipe.multi()
+                self._queue_release(pipe, turn, held)
+                pipe.execute()
+            except redis.WatchError:
+                pass
+
+    async def arelease(self, client, turn):
+        if self._scripting:
+            try:
+                await _resolve(client.eval(RELEASE_SCRIPT, 2, *self._release_args(turn)))
+                return
+            except redis.ResponseError as e:
+                self._no_scripting(e)
+        pipe = client.pipeline(transaction=True)
+        try:
+            await _resolve(pipe.watch(LOCK_KEY_PREFIX + turn.session_id))
+            held = await _resolve(pipe.get(LOCK_KEY_PREFIX + turn.session_id))
+            pipe.multi()
+            self._queue_release(pipe, turn, held)
+            await _resolve(pipe.execute())
+        except redis.WatchError:
+            pass
+        finally:
+            await _resolve(pipe.reset())
+
+    def _queue_release(self, pipe, turn, held):
+        if turn.response is not None and turn.duplicate is None:
+            pipe.set(RESULT_KEY_PREFIX + turn.token, turn.response, ex=self.dedupe_seconds)
+        if _holds(held, turn):
+            pipe.delete(LOCK_KEY_PREFIX + turn.session_id)
+
+    def _renew(self, client, turn):
+        """
+        Extends the turn's lock to a full `lock_ttl` if it still holds it. Returns whether it did.
+        """
+        key = LOCK_KEY_PREFIX + turn.session_id
+        if self._scripting:
+            try:
+                return bool(client.eval(RENEW_SCRIPT, 1, key, f"{turn.token} ", int(self.lock_ttl * 1000)))
+            except redis.ResponseError as e:
+                self._no_scripting(e)
+        with client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(key)
+                if not _holds(pipe.get(key), turn):
+                    return False
+                pipe.multi()
+                pipe.pexpire(key, int(self.lock_ttl * 1000))
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    async def _arenew(self, client, turn):
+        key = LOCK_KEY_PREFIX + turn.session_id
+        if self._scripting:
+            try:
+                return bool(await _resolve(client.eval(RENEW_SCRIPT, 1, key, f"{turn.token} ", int(self.lock_ttl * 1000))))
+            except redis.ResponseError as e:
+                self._no_scripting(e)
+        pipe = client.pipeline(transaction=True)
+        try:
+            await _resolve(pipe.watch(key))
+            if not _holds(await _resolve(pipe.get(key)), turn):
+                return False
+            pipe.multi()
+            pipe.pexpire(key, int(self.lock_ttl * 1000))
+            await _resolve(pipe.execute())
+            return True
+        except redis.WatchError:
+            return False
+        finally:
+            await _resolve(pipe.reset())
+
+    def _keep_alive(self, client, turn, stop):
+        # Runs on its own thread for the length of a sync turn.
+        while not stop.wait(self.lock_ttl / 3):
+            try:
+                if not self._renew(client, turn):
+                    return
+            except Exception as e:
+                print(f"Couldn't extend the lock of session {turn.session_id}: {e}")
+
+    async def _akeep_alive(self, client, turn):
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            try:
+                if not await self._arenew(client, turn):
+                    return
+            except Exception as e:
+                print(f"Couldn't extend the lock of session {turn.session_id}: {e}")
+
+    @contextlib.contextmanager
+    def turn(self, client, session_id, message):
+        turn = self.acquire(client, session_id, message)
+        if turn.duplicate is not None:
+            yield turn
+            return
+        stop = threading.Event()
+        threading.Thread(target=self._keep_alive, args=(client, turn, stop), daemon=True).start()
+        try:
+            yield turn
+        finally:
+            stop.set()
+            self.release(client, turn)
+
+    @contextlib.asynccontextmanager
+    async def aturn(self, client, session_id, message):
+        turn = await self.aacquire(client, session_id, message)
+        if turn.duplicate is not None:
+            yield turn
+            return
+        keep_alive = asyncio.create_task(self._akeep_alive(client, turn))
+        try:
+            yield turn
+        finally:
+            keep_alive.cancel()
+            await self.arelease(client, turn)
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+def _holds(held, turn):
+    return held is not None and (held.decode() if isinstance(held, bytes) else held).partition(" ")[0] == turn.token
+
+
+# --- AGENT SLOTS ---
+class _Ticket:
+    def __init__(self):
+        self.granted = threading.Event()
+        self.queued_at = time.monotonic()
+        self.started_at = None
+
+
+class AgentSlots:
+    """
+    Caps the agent turns (and so the Gemini and tool calls) running at once in this process.
+
+    Up to `max_active` turns run; the next `max_queue` wait first-in first-out, for at most
+    `max_wait` seconds. A turn arriving with the queue full is refused at once. Retry-After
+    estimates are based on a moving average of how long agent turns take. The limits are per
+    worker process: the whole deployment runs up to workers x max_active agent turns.
+    """
+
+    def __init__(self, max_active=16, max_queue=32, max_wait=20.0):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = collections.deque()
+        self._average_turn = 5.0
+        self._counts = collections.Counter()
+
+    def full(self):
+        with self._lock:
+            return self._active >= self.max_active and len(self._waiting) >= self.max_queue
+
+    def retry_after(self):
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self):
+        turns_ahead = len(self._waiting) + 1
+        return max(1, math.ceil(self._average_turn * turns_ahead / self.max_active))
+
+    def enter(self):
+        """
+        Returns a ticket that is either running already or queued; raises Overloaded if the queue is full.
+        """
+        ticket = _Ticket()
+        with self._lock:
+            if self._active < self.max_active and not self._waiting:
+                self._grant(ticket)
+            elif len(self._waiting) < self.max_queue:
+                self._waiting.append(ticket)
+                self._counts["queued"] += 1
+            else:
+                self._counts["rejected"] += 1
+                tracing.ADMISSION_REJECTIONS.labels("queue_full").inc()
+                raise Overloaded("We're very busy right now. Please try again in a few seconds.", self._retry_after())
+        return ticket
+
+    def _grant(self, ticket):
+        self._active += 1
+        self._counts["admitted"] += 1
+        ticket.started_at = time.monotonic()
+        ticket.granted.set()
+
+    def position(self, ticket):
+        """
+        The ticket's place in the queue, 1 for next; 0 once it is running.
+        """
+        with self._lock:
+            if ticket.granted.is_set():
+                return 0
+            try:
+                return self._waiting.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    def _give_up(self, ticket):
+        # The wait ran out; unless the ticket was granted just now, it leaves the queue.
+        with self._lock:
+            if ticket.granted.is_set():
+                return
+            self._waiting.remove(ticket)
+            self._counts["timed_out"] += 1
+            tracing.ADMISSION_REJECTIONS.labels("queue_timeout").inc()
+            retry_after = self._retry_after()
+        raise Overloaded("We're very busy right now. Please try again in a few seconds.", retry_after)
+
+    def wait(self, ticket):
+        if ticket.granted.is_set():
+            return
+        with tracing.span("admission", "agent_queue"):
+            if not ticket.granted.wait(self.max_wait):
+                self._give_up(ticket)
+
+    async def await_turn(self, ticket):
+        """
+        Waits for a queued ticket without blocking the event loop, yielding its queue position
+        each time it changes (for the stream's status messages).
+        """
+        if ticket.granted.is_set():
+            return
+        with tracing.span("admission", "agent_queue"):
+            reported = None
+            while not ticket.granted.is_set():
+                if time.monotonic() - ticket.queued_at > self.max_wait:
+                    self._give_up(ticket)
+                    break
+                position = self.position(ticket)
+                if position and position != reported:
+                    reported = position
+                    yield position
+                await asyncio.sleep(POLL_SECONDS)
+
+    def leave(self, ticket):
+        with self._lock:
+            if not ticket.granted.is_set():
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                return
+            self._active -= 1
+            # An exponential moving average over recent turns, for Retry-After.
+            self._average_turn = 0.9 * self._average_turn + 0.1 * (time.monotonic() - ticket.started_at)
+            if self._waiting and self._active < self.max_active:
+                self._grant(self._waiting.popleft())
+
+    @contextlib.contextmanager
+    def slot(self):
+        ticket = self.enter()
+        try:
+            self.wait(ticket)
+            yield
+        finally:
+            self.leave(ticket)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_active": self.max_active,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "waiting": len(self._waiting),
+                "average_turn_s": round(self._average_turn, 2),
+                **self._counts,
+            }
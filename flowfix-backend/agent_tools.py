@@ -0,0 +1,150 @@
+import datetime
+import time as time_module
+
+from langchain_core.tools import tool
+
+import calendar_utils
+import hybrid_retrieval
+import runtime
+
+# --- AGENT TOOLS DEFINITION ---
+
+@tool
+def get_general_information(query: str) -> str:
+    """
+    Use this tool to answer general questions about FlowFix Plumbers, such as their services, service area, business hours, or qualifications.
+    """
+    rag_chain = runtime.get_rag_chain()
+    if not rag_chain:
+        return "The knowledge base is not available."
+    faq_cache = runtime.get_faq_cache()
+    # Read before the lookup, so an answer from a knowledge base replaced meanwhile isn't cached.
+    cache_version = faq_cache.version
+    try:
+        cached_answer, query_vector = faq_cache.lookup(query)
+    except Exception as e:
+        print(f"FAQ cache lookup failed: {e}")
+        cached_answer, query_vector = None, None
+    if cached_answer is not None:
+        return cached_answer
+
+    try:
+        started = time_module.perf_counter()
+        with hybrid_retrieval.query_embedding(query, query_vector):
+            response = rag_chain.invoke({"input": query})
+        faq_cache.store(query, query_vector, response['answer'], time_module.perf_counter() - started, cache_version)
+        return response['answer']
+    except Exception as e:
+        return f"Error querying knowledge base: {e}"
+
+@tool
+def check_emergency_availability(postcode: str) -> str:
+    """
+    Checks if a plumber is available for an immediate emergency call-out in a specific postcode. Use this for urgent requests like "burst pipe", "major leak", or "no heating".
+    """
+    config = runtime.config
+    coverage_index = runtime.get_coverage_index()
+    area = coverage_index.lookup(postcode)
+    if area is None:
+        return f"'{postcode}' doesn't look like a valid UK postcode. Please ask the user to confirm their postcode."
+    if not area.emergency:
+        return f"I'm sorry, {area.postcode} is outside our primary service area of {coverage_index.describe_core_area()}. We are unable to attend this emergency."
+
+    is_blocked = calendar_utils.check_for_emergency_blocks(hours_to_check=2)
+    if is_blocked:
+        return "I'm very sorry, but the plumber is currently on another emergency job and is not immediately available. Please try another service."
+    else:
+        return f"The plumber appears to be available for an emergency call-out. The fee is {config['emergency_info']['fee']}, which includes the first hour of labour. Please call {config['business_phone_number']} immediately to confirm and provide your full address. This line is for emergencies only."
+
+@tool
+def find_available_appointment_slots(date: str, end_date: str = "", duration_minutes: int = 60, max_results: int = 0) -> str:
+    """
+    Finds available appointment slots for non-emergency jobs. Dates must be in 'YYYY-MM-DD' format. Pass only `date` to check a single day, or also pass `end_date` to search a range of days (for example "sometime next week"). `duration_minutes` is the expected job length (default 60) and `max_results` limits how many of the earliest slots are returned (0 means all).
+    """
+    try:
+        slots = calendar_utils.find_available_slots(
+            date,
+            duration_minutes=duration_minutes,
+            end_date_str=end_date or None,
+            limit=max_results or None,
+        )
+        if not slots:
+            if end_date:
+                return f"Sorry, there are no available slots between {date} and {end_date}. Please try other dates."
+            return f"Sorry, there are no available slots on {date}. Please try another day."
+
+        slots_by_day = {}
+        for s in slots:
+            slot = datetime.datetime.fromisoformat(s)
+            slots_by_day.setdefault(slot.strftime('%A %Y-%m-%d'), []).append(slot.strftime('%I:%M %p'))
+
+        if not end_date:
+            return f"Available slots on {date}: {', '.join(slots_by_day.popitem()[1])}"
+        return "Available slots: " + "; ".join(f"{day}: {', '.join(times)}" for day, times in slots_by_day.items())
+    except Exception as e:
+        return f"There was an error finding slots: {e}"
+    
+@tool
+def book_appointment(date: str, time: str, service_needed: str, customer_name: str, customer_phone: str, postcode: str = "") -> str:
+    """
+    Books a non-emergency plumbing appointment in the calendar. You MUST have the exact date (in 'YYYY-MM-DD' format), time (in 'HH:MM AM/PM' or 'HH:MM' 24-hour format), a description of the service needed, the customer's full name, and their phone number before using this tool. If you are missing any of this information, you must ask the user for it. Pass the customer's `postcode` if they have given it; jobs outside our area are refused and jobs in the extended area carry a travel surcharge.
+    """
+    area = None
+    if postcode:
+        area = runtime.get_coverage_index().lookup(postcode)
+        if area is None:
+            return f"'{postcode}' doesn't look like a valid UK postcode. Please confirm the postcode with the user."
+        if not area.covered:
+            return f"I'm sorry, {area.postcode} is outside the area we travel to, so we can't book this job."
+
+    try:
+        start_datetime_obj = datetime.datetime.strptime(f"{date} {time}", "%Y-%m-%d %I:%M %p")
+    except ValueError:
+        try:
+            start_datetime_obj = datetime.datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
+        except ValueError:
+            return "Invalid date or time format. Please confirm the time with the user and provide it in 'HH:MM AM/PM' or 'HH:MM' (24-hour) format."
+
+    end_datetime_obj = start_datetime_obj + datetime.timedelta(hours=1)
+    
+    start_time_iso = start_datetime_obj.isoformat()
+    end_time_iso = end_datetime_obj.isoformat()
+
+    distance_to = None
+    if area is not None:
+        coverage_index = runtime.get_coverage_index()
+        distance_to = lambda engineer: coverage_index.distance_between(engineer.base_postcode, area.postcode)
+    try:
+        engineer = calendar_utils.assign_engineer(start_time_iso, end_time_iso, distance_to=distance_to)
+    except Exception as e:
+        # Calendar, auth or cache failures: tell the user rather than failing the whole turn.
+        print(f"Engineer assignment failed: {e}")
+        return f"Sorry, I couldn't check the calendar to make the booking: {e}"
+    if engineer is None:
+        return f"Sorry, {time} on {date} is no longer available. Please check availability again and offer the user another slot."
+
+    summary = f"Plumbing: {service_needed} for {customer_name}"
+    description = f"Service: {service_needed} for {customer_name} ({customer_phone})."
+    if area is not None:
+        distance = f", {area.distance_miles} miles from base" if area.distance_miles is not None else ""
+        description += f"\nPostcode: {area.postcode} ({area.zone} zone{distance})."
+
+    result = calendar_utils.create_appointment(
+        summary=summary,
+        description=description,
+        start_time_str=start_time_iso,
+        end_time_str=end_time_iso,
+        customer_name=customer_name,
+        customer_phone=customer_phone,
+        engineer=engineer,
+    )
+    if area is not None and area.surcharge and result.startswith("Booking confirmed"):
+        result += f" Please let the customer know that {area.postcode} is in our extended area, so {area.surcharge} applies."
+    return result
+
+TOOLS = [
+    get_general_information,
+    check_emergency_availability,
+    find_available_appointment_slots,
+    book_appointment
+]
@@ -1,236 +1,373 @@
 import os
 import json
+import time
+import asyncio
+import contextvars
 import datetime
-from dotenv import load_dotenv
+import inspect
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 
-# LangChain components for building an Agent
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.agents import AgentExecutor, create_tool_calling_agent
-from langchain_core.tools import tool
-# --- MODIFIED: Import RedisChatMessageHistory ---
-from langchain_community.chat_message_histories import RedisChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.messages import AIMessage
-
-# Our existing components
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-
-import calendar_utils
+import admission
+import runtime
+import tool_memo
+import tracing
+from stats import LatencyStats
 
 # --- PROXY CONFIGURATION FOR PYTHONANYWHERE ---
 proxy_url = 'http://proxy.server:3128'
 os.environ['HTTP_PROXY'] = proxy_url
 os.environ['HTTPS_PROXY'] = proxy_url
 
-# --- GET ABSOLUTE PATHS ---
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CONFIG_PATH = os.path.join(BASE_DIR, 'config.json')
-FAISS_INDEX_PATH = os.path.join(BASE_DIR, "faiss_index")
-
-# --- INITIALIZATION ---
-load_dotenv()
-app = Flask(__name__)
-CORS(app)
-
-# --- NEW: GET REDIS URL FROM ENVIRONMENT VARIABLES ---
-# This is crucial for connecting to your PythonAnywhere Redis instance.
-REDIS_URL = os.getenv("REDIS_URL")
-if not REDIS_URL:
-    raise ValueError("REDIS_URL environment variable not set.")
-
-
-with open(CONFIG_PATH, 'r') as f:
-    config = json.load(f)
-
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.6)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-
-# --- KNOWLEDGE BASE (RAG) TOOL ---
-try:
-    vector_store = FAISS.load_local(
-        FAISS_INDEX_PATH,
-        embeddings,
-        allow_dangerous_deserialization=True
-    )
-    retriever = vector_store.as_retriever(search_kwargs={"k": 3})
-    
-    rag_prompt = ChatPromptTemplate.from_template("""Answer the user's question based only on the following context. If the context doesn't contain the answer, say you don't have that information.
-
-Context:
-{context}
-
-Question: {input}""")
-    
-    question_answer_chain = create_stuff_documents_chain(llm, rag_prompt)
-    rag_chain = create_retrieval_chain(retriever, question_answer_chain)
-    print("Knowledge base loaded successfully from local faiss_index.")
-except Exception as e:
-    print(f"CRITICAL Error loading knowledge base from local index: {e}")
-    rag_chain = None
-
-# --- AGENT TOOLS DEFINITION ---
-# No changes are needed in the tools themselves.
-
-@tool
-def get_general_information(query: str) -> str:
-    """
-    Use this tool to answer general questions about FlowFix Plumbers, such as their services, service area, business hours, or qualifications.
-    """
-    if not rag_chain:
-        return "The knowledge base is not available."
-    try:
-        response = rag_chain.invoke({"input": query})
-        return response['answer']
-    except Exception as e:
-        return f"Error querying knowledge base: {e}"
+# LangChain, Gemini, FAISS and the Google Calendar client are loaded lazily by runtime.py,
+# so importing this module (and starting a worker) is cheap. See create_app() below.
+
+def answer_fast_path(user_message, session_id):
+    """
+    Returns a direct answer and records the turn in the session history, or None if the agent is needed.
+    """
+    router = runtime.get_fast_path_router()
+    if router.intent(user_message) is None:
+        router.route(user_message)  # Counted as falling through without loading the history.
+        return None
+    from langchain_core.messages import AIMessage, HumanMessage
+    history = runtime.get_redis_session_history(session_id)
+    # Loads the session first, so a new one still gets its greeting saved.
+    answer = router.route(user_message, previous=last_assistant_message(history.messages))
+    if answer is None:
+        return None
+    history.add_messages([HumanMessage(content=user_message), AIMessage(content=answer)])
+    return answer
 
-@tool
-def check_emergency_availability(postcode: str) -> str:
+def last_assistant_message(messages):
     """
-    Checks if a plumber is available for an immediate emergency call-out in a specific postcode. Use this for urgent requests like "burst pipe", "major leak", or "no heating".
+    The text of the assistant's most recent message, or None.
     """
-    if not any(p in postcode.upper() for p in config["service_area_postcodes"]):
-        return f"I'm sorry, you appear to be outside our primary service area of {', '.join(config['service_area_postcodes'])}. We are unable to attend this emergency."
+    for message in reversed(messages):
+        if message.type == "ai" and isinstance(message.content, str):
+            return message.content
+    return None
+
+# --- STREAMING CHAT ---
+# Short progress messages shown in the chat widget while a tool is running.
+TOOL_STATUS_MESSAGES = {
+    "get_general_information": "Looking that up…",
+    "check_emergency_availability": "Checking emergency availability…",
+    "find_available_appointment_slots": "Checking the calendar…",
+    "book_appointment": "Booking your appointment…",
+}
+
+# Shown while a streamed turn waits for an agent slot.
+QUEUED_STATUS_MESSAGE = "We're busy right now, you're number {position} in the queue…"
+
+# Time-to-first-token and total time for streamed replies.
+stream_stats = LatencyStats()
 
-    is_blocked = calendar_utils.check_for_emergency_blocks(hours_to_check=2)
-    if is_blocked:
-        return "I'm very sorry, but the plumber is currently on another emergency job and is not immediately available. Please try another service."
-    else:
-        return f"The plumber appears to be available for an emergency call-out. The fee is {config['emergency_info']['fee']}, which includes the first hour of labour. Please call {config['business_phone_number']} immediately to confirm and provide your full address. This line is for emergencies only."
+def _chunk_text(chunk):
+    # Gemini may return content as a plain string or as a list of parts.
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
 
-@tool
-def find_available_appointment_slots(date: str) -> str:
+async def _agent_events(agent, user_message, session_id, callbacks):
     """
-    Finds available appointment slots on a specific date for non-emergency jobs. The date must be in 'YYYY-MM-DD' format.
+    Runs the agent with astream_events and yields (event, data) pairs for the SSE stream.
+    Only tokens from the agent's own LLM calls are forwarded; the model calls made inside
+    tools (e.g. the RAG chain) are hidden behind a status message instead.
     """
+    tools_running = 0
+    output = None
+    async for event in agent.astream_events(
+        {"input": user_message},
+        config={"configurable": {"session_id": session_id}, "callbacks": callbacks},
+        version="v2",
+    ):
+        kind = event["event"]
+        if kind == "on_tool_start":
+            tools_running += 1
+            yield "status", {"tool": event["name"], "message": TOOL_STATUS_MESSAGES.get(event["name"], "Working on it…")}
+        elif kind == "on_tool_end":
+            tools_running -= 1
+        elif kind == "on_chat_model_stream" and tools_running == 0:
+            text = _chunk_text(event["data"]["chunk"])
+            if text:
+                yield "token", {"text": text}
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            output = event["data"].get("output")
+    if isinstance(output, dict):
+        yield "final", {"response": output.get("output", "")}
+
+async def sse_chat_stream(get_agent, fast_path, user_message, session_id, redis_client):
+    """
+    Yields the Server-Sent Events for one streamed chat turn. Shared by the Flask and ASGI apps.
+    `fast_path(user_message, session_id)` (sync or async) is tried first; the agent returned by
+    `get_agent()` only runs if it returns None. The turn holds its session's lock (taken through
+    `redis_client`, sync or async) throughout, and waits for an agent slot, reporting its place
+    in the queue as status events.
+    """
+    started = time.perf_counter()
+    ttft = None
+    streamed = []
+    with tracing.turn("chat_stream", session_id) as trace:
+        try:
+            async with runtime.get_session_turns().aturn(redis_client, session_id, user_message) as session_turn:
+                if session_turn.duplicate is not None:
+                    trace.route = "duplicate"
+                    yield _sse("token", {"text": session_turn.duplicate})
+                    yield _sse("done", {"response": session_turn.duplicate, "ttft_ms": 0.0, "total_ms": 0.0})
+                    return
+
+                answer = fast_path(user_message, session_id)
+                if inspect.isawaitable(answer):
+                    answer = await answer
+                if answer is not None:
+                    trace.route = "fast_path"
+                    session_turn.response = answer
+                    yield _sse("token", {"text": answer})
+                    yield _sse("done", {"response": answer, "ttft_ms": 0.0, "total_ms": 0.0})
+                    return
+
+                slots = runtime.get_agent_slots()
+                ticket = slots.enter()
+                try:
+                    async for position in slots.await_turn(ticket):
+                        yield _sse("status", {"queue_position": position, "message": QUEUED_STATUS_MESSAGE.format(position=position)})
+                    with tool_memo.session(session_id):
+                        async for event, payload in _agent_events(get_agent(), user_message, session_id, [trace.callback()]):
+                            if event == "token":
+                                if ttft is None:
+                                    ttft = time.perf_counter() - started
+                                    stream_stats.record("time_to_first_token", ttft)
+                                streamed.append(payload["text"])
+                                yield _sse("token", payload)
+                            elif event == "status":
+                                yield _sse("status", payload)
+                            elif event == "final":
+                                streamed = [payload["response"]]
+                finally:
+                    slots.leave(ticket)
+                session_turn.response = "".join(streamed)
+        except admission.Overloaded as e:
+            trace.route = "rejected"
+            yield _sse("error", {"error": e.message, "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            print(f"Error while streaming chat response: {e}")
+            trace.route = "error"
+            yield _sse("error", {"error": "Sorry, something went wrong. Please try again."})
+            return
+
+    total = time.perf_counter() - started
+    stream_stats.record("total", total)
+    yield _sse("done", {
+        "response": "".join(streamed),
+        "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+        "total_ms": round(total * 1000, 1),
+    })
+
+def _iter_async(async_gen):
+    """
+    Drives an async generator from synchronous code, so Flask can stream it.
+    Every step runs in the same context, so context variables (e.g. the current trace) carry over.
+    """
+    loop = asyncio.new_event_loop()
+    context = contextvars.copy_context()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(loop.create_task(async_gen.__anext__(), context=context))
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(loop.create_task(async_gen.aclose(), context=context))
+        loop.close()
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Headers for SSE responses; stops proxies from buffering the stream.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def availability_response(args):
+    """
+    Builds the /availability payload and status code from the query-string arguments.
+    """
+    # e.g. /availability?start=2025-06-02&end=2025-06-06&duration=90&limit=5
+    start_date = args.get("start")
+    end_date = args.get("end") or start_date
+    duration = args.get("duration", 60, type=int)
+    limit = args.get("limit", type=int)
+
+    if not start_date:
+        return {"error": "No start date provided"}, 400
+    if duration <= 0:
+        return {"error": "duration must be a positive number of minutes"}, 400
+    if limit is not None and limit < 1:
+        return {"error": "limit must be a positive number of slots"}, 400
+
+    import calendar_utils
     try:
-        slots = calendar_utils.find_available_slots(date)
-        if not slots:
-            return f"Sorry, there are no available slots on {date}. Please try another day."
-        
-        formatted_slots = [datetime.datetime.fromisoformat(s).strftime('%I:%M %p') for s in slots]
-        return f"Available slots on {date}: {', '.join(formatted_slots)}"
+        slots = calendar_utils.find_engineer_slots(
+            start_date, duration_minutes=duration, end_date_str=end_date, limit=limit
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
     except Exception as e:
-        return f"There was an error finding slots: {e}"
-    
-@tool
-def book_appointment(date: str, time: str, service_needed: str, customer_name: str, customer_phone: str) -> str:
+        return {"error": f"Could not check calendar availability: {e}"}, 502
+
+    return {
+        "start": start_date,
+        "end": end_date,
+        "duration_minutes": duration,
+        "slots": [
+            {
+                "start": slot.isoformat(),
+                "end": (slot + datetime.timedelta(minutes=duration)).isoformat(),
+                "engineers": [engineer.name for engineer in free],
+            }
+            for slot, free in slots
+        ],
+    }, 200
+
+def overloaded_response(error):
     """
-    Books a non-emergency plumbing appointment in the calendar. You MUST have the exact date (in 'YYYY-MM-DD' format), time (in 'HH:MM AM/PM' or 'HH:MM' 24-hour format), a description of the service needed, the customer's full name, and their phone number before using this tool. If you are missing any of this information, you must ask the user for it.
+    The 429 payload, status code and headers for a turn refused by admission control.
     """
+    return {"error": error.message, "retry_after": error.retry_after}, 429, {"Retry-After": str(error.retry_after)}
+
+def stream_admission_check(user_message):
+    """
+    Refuses a streamed turn up front, with a real 429, when the agent queue is already full and
+    the fast path can't answer it. Returns an admission.Overloaded, or None to go ahead.
+    """
+    slots = runtime.get_agent_slots()
+    if slots.full() and runtime.get_fast_path_router().intent(user_message) is None:
+        tracing.ADMISSION_REJECTIONS.labels("queue_full").inc()
+        return admission.Overloaded("We're very busy right now. Please try again in a few seconds.", slots.retry_after())
+    return None
+
+def _component_stats(getter):
+    # Components that haven't been built in this worker yet have nothing to report.
+    return getter().stats() if getter.is_built() else None
+
+def stats_payload():
+    # Per-call latency of the external services used by this worker process.
+    import calendar_utils
     try:
-        start_datetime_obj = datetime.datetime.strptime(f"{date} {time}", "%Y-%m-%d %I:%M %p")
-    except ValueError:
-        try:
-            start_datetime_obj = datetime.datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-        except ValueError:
-            return "Invalid date or time format. Please confirm the time with the user and provide it in 'HH:MM AM/PM' or 'HH:MM' (24-hour) format."
-
-    end_datetime_obj = start_datetime_obj + datetime.timedelta(hours=1)
-    
-    start_time_iso = start_datetime_obj.isoformat()
-    end_time_iso = end_datetime_obj.isoformat()
-
-    summary = f"Plumbing: {service_needed} for {customer_name}"
-    description = f"Service: {service_needed} for {customer_name} ({customer_phone})."
-
-    result = calendar_utils.create_appointment(
-        summary=summary,
-        description=description,
-        start_time_str=start_time_iso,
-        end_time_str=end_time_iso,
-        customer_name=customer_name,
-        customer_phone=customer_phone
-    )
-    return result
-
-tools = [
-    get_general_information,
-    check_emergency_availability,
-    find_available_appointment_slots,
-    book_appointment
-]
-
-# --- AGENT SETUP ---
-agent_prompt = ChatPromptTemplate.from_messages([
-    ("system", """
-    Your Persona: You are Vern, a helpful and friendly AI assistant for FlowFix Plumbers.
-    
-    Your Goal: Help users get information, check availability, and book appointments. Be conversational and clear.
-    
-     Interaction Rules:
-    1.  **One Question at a Time:** When you need information from a user (like their name, phone number, or a date), you MUST ask for only ONE piece of information at a time. Do not ask multiple questions in a single message. However approaching each question with conversational aspects in encouraged.
-    2.  **Confirm Before Action:** Before you use the `book_appointment` tool, you MUST first state what service you believe the user wants. Then, you MUST summarize all the other details (date, time, name, phone number) and ask the user for a final confirmation, like "Does all of that look correct?". Only proceed with the booking after the user confirms.
-    3.  **No Repeat Introductions:** You MUST introduce yourself in your very first message. In all subsequent messages, you MUST NOT introduce yourself or mention that you are an AI. Get straight to the point.
-    4. **All Natural Language Responses:** All responses you give to the user must be in natural language format, ie no asterics (*) to be inclued in your answers.
-    5. **Emergency Situations:** If a user mentions an emergency (like a burst pipe or no heating), first you must always clarify whether the situation is an emergency, if the user specifies it is a non emergency then you are to go about the normal booking procedure. However if the user specifies it is an emergency you MUST use the `check_emergency_availability` tool to check if the plumber is available. If they are, you MUST instruct the user to call the emergency phone number immediately. If they are not available, you MUST apologize and inform the user that they will need to try another service or wait until a plumber is available, and give them the closest possible appointment time.
-    """),
-    ("placeholder", "{chat_history}"),
-    ("human", "{input}"),
-    ("placeholder", "{agent_scratchpad}"),
-])
-
-agent = create_tool_calling_agent(llm, tools, agent_prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
-
-# --- DELETED: OLD MEMORY MANAGEMENT ---
-# The global session_histories dictionary and get_session_history function have been removed.
-# --- NEW: REDIS-BACKED MEMORY MANAGEMENT ---
-# This function factory creates a new Redis-backed history object for each unique session_id.
-# All worker processes connect to the same Redis server, so the history is shared.
-def get_redis_session_history(session_id: str) -> RedisChatMessageHistory:
-    """
-    Gets the chat history for a given session ID from the central Redis store.
-    If the session is new, it pre-loads the AI's initial greeting into the history.
-    """
-    history = RedisChatMessageHistory(session_id, url=REDIS_URL, ttl=7200)
-    
-    # If the history is empty, it's a new session.
-    if not history.messages:
-        # Pre-load the history with the initial greeting to match the front-end.
-        # This ensures the agent knows it has already introduced itself and won't repeat the greeting.
-        initial_message = "Hi! I am Vern, the FlowFix AI assistant. How can I help with your plumbing today?"
-        history.add_message(AIMessage(content=initial_message))
-        
-    return history
-# This wraps our agent and connects it to our new Redis history function
-conversational_agent = RunnableWithMessageHistory(
-    agent_executor,
-    get_redis_session_history, # <-- Use our new Redis function here
-    input_messages_key="input",
-    history_messages_key="chat_history",
-)
-# --- END NEW MEMORY SECTION ---
-
-# --- FLASK API ENDPOINT ---
-# Note: A small change is made here to handle the initial greeting more robustly.
-@app.route("/chat", methods=["POST"])
-def chat():
-    data = request.json
-    user_message = data.get("message")
-    session_id = data.get("session_id")
-    
-    if not user_message or not session_id:
-        return jsonify({"error": "No message or session_id provided"}), 400
-
-    # The front-end now controls the initial greeting. The backend just responds.
-    # This simplifies the logic and ensures Redis isn't touched until the first user message.
-    response = conversational_agent.invoke(
-        {"input": user_message},
-        config={"configurable": {"session_id": session_id}}
-    )
-    
-    ai_response = response['output']
-    return jsonify({"response": ai_response})
+        snapshot = calendar_utils.emergency_watcher.snapshot()
+    except Exception:
+        snapshot = None
+    return {
+        "emergency_snapshot_age_s": round(time.time() - snapshot["checked_at"], 1) if snapshot else None,
+        "calendar": calendar_utils.get_call_stats(),
+        "chat_stream": stream_stats.snapshot(),
+        "redis_history": _component_stats(runtime.get_history_store),
+        "faq_cache": _component_stats(runtime.get_faq_cache),
+        "fast_path": _component_stats(runtime.get_fast_path_router),
+        "session_turns": _component_stats(runtime.get_session_turns),
+        "agent_slots": _component_stats(runtime.get_agent_slots),
+        "tool_memo": _component_stats(runtime.get_tool_memo),
+        "startup": runtime.startup_stats.snapshot(),
+    }
+
+# --- APPLICATION FACTORY ---
+def create_app(warm_up=False):
+    """
+    Builds the Flask app. Nothing heavy is loaded here; the agent, knowledge base and clients
+    are created on first use. Pass warm_up=True (or call runtime.warm_up() in a preforking
+    master) to load the heavy modules and the FAISS index up front.
+    """
+    if not runtime.REDIS_URL:
+        raise ValueError("REDIS_URL environment variable not set.")
+    if warm_up:
+        runtime.warm_up()
+
+    flask_app = Flask(__name__)
+    CORS(flask_app)
+
+    @flask_app.before_request
+    def start_background_tasks():
+        runtime.start_background_tasks()
+
+    @flask_app.route("/chat", methods=["POST"])
+    def chat():
+        data = request.json
+        user_message = data.get("message")
+        session_id = data.get("session_id")
+
+        if not user_message or not session_id:
+            return jsonify({"error": "No message or session_id provided"}), 400
+
+        redis_client = runtime.get_history_store().client
+        with tracing.turn("chat", session_id) as trace:
+            try:
+                with runtime.get_session_turns().turn(redis_client, session_id, user_message) as session_turn:
+                    if session_turn.duplicate is not None:
+                        trace.route = "duplicate"
+                        return jsonify({"response": session_turn.duplicate})
+
+                    fast_answer = answer_fast_path(user_message, session_id)
+                    if fast_answer is not None:
+                        trace.route = "fast_path"
+                        session_turn.response = fast_answer
+                        return jsonify({"response": fast_answer})
+
+                    # The front-end controls the initial greeting. The backend just responds.
+                    with runtime.get_agent_slots().slot(), tool_memo.session(session_id):
+                        response = runtime.get_conversational_agent().invoke(
+                            {"input": user_message},
+                            config={"configurable": {"session_id": session_id}, "callbacks": [trace.callback()]}
+                        )
+                    session_turn.response = response['output']
+            except admission.Overloaded as e:
+                trace.route = "rejected"
+                payload, status, headers = overloaded_response(e)
+                return jsonify(payload), status, headers
+
+        ai_response = response['output']
+        return jsonify({"response": ai_response})
+
+    @flask_app.route("/chat/stream", methods=["POST"])
+    def chat_stream():
+        data = request.json
+        user_message = data.get("message")
+        session_id = data.get("session_id")
+
+        if not user_message or not session_id:
+            return jsonify({"error": "No message or session_id provided"}), 400
+
+        overloaded = stream_admission_check(user_message)
+        if overloaded is not None:
+            payload, status, headers = overloaded_response(overloaded)
+            return jsonify(payload), status, headers
+
+        events = sse_chat_stream(
+            runtime.get_conversational_agent, answer_fast_path, user_message, session_id,
+            runtime.get_history_store().client,
+        )
+        return Response(stream_with_context(_iter_async(events)), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+    @flask_app.route("/availability", methods=["GET"])
+    def get_availability():
+        payload, status = availability_response(request.args)
+        return jsonify(payload), status
+
+    @flask_app.route("/stats", methods=["GET"])
+    def stats():
+        return jsonify(stats_payload())
+
+    @flask_app.route("/metrics", methods=["GET"])
+    def metrics():
+        body, content_type = tracing.metrics_response()
+        return Response(body, content_type=content_type)
+
+    return flask_app
+
+
+# FLOWFIX_WARM_UP=1 loads everything at import, e.g. for a WSGI server that forks after loading the app.
+app = create_app(warm_up=os.getenv("FLOWFIX_WARM_UP") == "1")
 
 if __name__ == "__main__":
-    app.run(port=5000, debug=True)
\ No newline at end of file
+    app.run(port=5000, debug=True)
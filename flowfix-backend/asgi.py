@@ -0,0 +1,162 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import redis.asyncio as aioredis
+from quart import Quart, request, jsonify, Response
+from quart_cors import cors
+
+# The agent, tools and knowledge base are shared with the Flask app.
+import admission
+import app as flowfix
+import runtime
+import tool_memo
+import tracing
+
+# --- ASYNC SERVING MODE ---
+# Run with:  hypercorn asgi:app --bind 0.0.0.0:5000
+# One process serves many concurrent chats: the agent runs via ainvoke, so a chat waiting on
+# Gemini or Redis doesn't hold a thread. The Google Calendar client and the FAISS retriever are
+# synchronous, so LangChain runs those tool calls on the event loop's default executor; it is
+# sized here so hundreds of in-flight chats aren't queued behind a handful of threads.
+ASYNC_THREAD_POOL_SIZE = int(os.getenv("ASYNC_THREAD_POOL_SIZE", "64"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
+
+app = cors(Quart(__name__))
+redis_client = None
+
+
+@app.before_serving
+async def startup():
+    global redis_client
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=ASYNC_THREAD_POOL_SIZE, thread_name_prefix="flowfix-io"))
+    redis_client = aioredis.Redis.from_url(runtime.REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+    runtime.start_background_tasks()
+    # Load the heavy modules and the FAISS index in the background; the server is already accepting.
+    loop.run_in_executor(None, runtime.warm_up)
+
+
+@app.after_serving
+async def shutdown():
+    await redis_client.aclose()
+
+
+def get_async_session_history(session_id: str):
+    """
+    Gets the chat history for a session, read and written through the shared async Redis client.
+    """
+    return runtime.get_history_store().history(session_id, async_client=redis_client)
+
+
+async def answer_fast_path(user_message, session_id):
+    """
+    Async version of app.answer_fast_path, recording the turn through the async Redis client.
+    """
+    router = runtime.get_fast_path_router()
+    if router.intent(user_message) is None:
+        router.route(user_message)
+        return None
+    from langchain_core.messages import AIMessage, HumanMessage
+    history = get_async_session_history(session_id)
+    messages = await history.aget_messages()
+    answer = router.route(user_message, previous=flowfix.last_assistant_message(messages))
+    if answer is None:
+        return None
+    await history.aadd_messages([HumanMessage(content=user_message), AIMessage(content=answer)])
+    return answer
+
+
+@runtime.lazy
+def get_conversational_agent():
+    from langchain_core.runnables.history import RunnableWithMessageHistory
+    return RunnableWithMessageHistory(
+        runtime.get_agent_executor(),
+        get_async_session_history,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+    )
+
+
+# --- API ENDPOINTS ---
+# Same contract as the Flask app.
+@app.route("/chat", methods=["POST"])
+async def chat():
+    data = await request.get_json()
+    user_message = data.get("message")
+    session_id = data.get("session_id")
+
+    if not user_message or not session_id:
+        return jsonify({"error": "No message or session_id provided"}), 400
+
+    with tracing.turn("chat", session_id) as trace:
+        try:
+            async with runtime.get_session_turns().aturn(redis_client, session_id, user_message) as session_turn:
+                if session_turn.duplicate is not None:
+                    trace.route = "duplicate"
+                    return jsonify({"response": session_turn.duplicate})
+
+                fast_answer = await answer_fast_path(user_message, session_id)
+                if fast_answer is not None:
+                    trace.route = "fast_path"
+                    session_turn.response = fast_answer
+                    return jsonify({"response": fast_answer})
+
+                slots = runtime.get_agent_slots()
+                ticket = slots.enter()
+                try:
+                    async for _ in slots.await_turn(ticket):
+                        pass
+                    with tool_memo.session(session_id):
+                        response = await get_conversational_agent().ainvoke(
+                            {"input": user_message},
+                            config={"configurable": {"session_id": session_id}, "callbacks": [trace.callback()]}
+                        )
+                finally:
+                    slots.leave(ticket)
+                session_turn.response = response['output']
+        except admission.Overloaded as e:
+            trace.route = "rejected"
+            payload, status, headers = flowfix.overloaded_response(e)
+            return jsonify(payload), status, headers
+    return jsonify({"response": response['output']})
+
+
+@app.route("/chat/stream", methods=["POST"])
+async def chat_stream():
+    data = await request.get_json()
+    user_message = data.get("message")
+    session_id = data.get("session_id")
+
+    if not user_message or not session_id:
+        return jsonify({"error": "No message or session_id provided"}), 400
+
+    overloaded = flowfix.stream_admission_check(user_message)
+    if overloaded is not None:
+        payload, status, headers = flowfix.overloaded_response(overloaded)
+        return jsonify(payload), status, headers
+
+    response = Response(
+        flowfix.sse_chat_stream(get_conversational_agent, answer_fast_path, user_message, session_id, redis_client),
+        mimetype="text/event-stream",
+        headers=flowfix.SSE_HEADERS,
+    )
+    response.timeout = None  # Agent turns can outlast Quart's default response timeout.
+    return response
+
+
+@app.route("/availability", methods=["GET"])
+async def get_availability():
+    payload, status = await asyncio.to_thread(flowfix.availability_response, request.args)
+    return jsonify(payload), status
+
+
+@app.route("/stats", methods=["GET"])
+async def stats():
+    return jsonify(flowfix.stats_payload())
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    body, content_type = tracing.metrics_response()
+    return Response(body, content_type=content_type)
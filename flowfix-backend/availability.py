@@ -0,0 +1,99 @@
+import datetime
+import math
+
+
+def parse_busy_intervals(busy_intervals):
+    """
+    Parses Google free/busy intervals once and returns them as sorted, merged (start, end)
+    tuples of POSIX timestamps. Comparing plain floats keeps the sweep cheap; comparing
+    timezone-aware datetimes calls utcoffset() on every comparison.
+    """
+    parsed = [
+        (datetime.datetime.fromisoformat(b["start"]).timestamp(), datetime.datetime.fromisoformat(b["end"]).timestamp())
+        for b in busy_intervals
+    ]
+    return merge_intervals(parsed)
+
+
+def merge_intervals(intervals):
+    """
+    Sorts intervals by start time and merges any that overlap or touch.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _localize(tz, naive):
+    # pytz zones need localize(); zoneinfo zones can simply be attached.
+    if hasattr(tz, "localize"):
+        return tz.localize(naive)
+    return naive.replace(tzinfo=tz)
+
+
+def find_free_slots(
+    busy,
+    tz,
+    start_date,
+    end_date,
+    business_start,
+    business_end,
+    duration_minutes=60,
+    step_minutes=30,
+    limit=None,
+    not_before=None,
+):
+    """
+    Sweeps merged busy intervals against business hours for every day from start_date to
+    end_date (inclusive) and returns the free slot start times as aware datetimes, in order.
+
+    Candidate slots start every step_minutes from the opening time. `busy` must be the sorted,
+    merged output of parse_busy_intervals, and is walked with a single pointer, so the whole
+    range costs O(days + slots + busy) rather than re-checking every interval for every slot.
+    """
+    duration = duration_minutes * 60
+    step = step_minutes * 60
+    earliest = not_before.timestamp() if not_before else None
+    slots = []
+    i = 0
+
+    day = start_date
+    while day <= end_date:
+        window_start = _localize(tz, datetime.datetime.combine(day, business_start))
+        opens = window_start.timestamp()
+        closes = _localize(tz, datetime.datetime.combine(day, business_end)).timestamp()
+
+        candidate = opens
+        if earliest and candidate < earliest:
+            candidate = _align(opens, earliest, step)
+
+        while candidate + duration <= closes:
+            # Skip busy periods that finish before this candidate starts.
+            while i < len(busy) and busy[i][1] <= candidate:
+                i += 1
+
+            if i < len(busy) and busy[i][0] < candidate + duration:
+                # Clash: jump straight to the first aligned start after this busy period.
+                candidate = _align(opens, busy[i][1], step)
+                continue
+
+            slots.append(window_start + datetime.timedelta(seconds=candidate - opens))
+            if limit and len(slots) >= limit:
+                return slots
+            candidate += step
+
+        day += datetime.timedelta(days=1)
+
+    return slots
+
+
+def _align(opens, moment, step):
+    """
+    Returns the first slot start at or after `moment` on the step grid that begins at `opens`.
+    """
+    return opens + math.ceil((moment - opens) / step) * step
@@ -0,0 +1,136 @@
+"""
+Micro-benchmarks for the availability engine.
+
+Compares the sort-and-sweep engine in availability.py with the original per-slot loop
+(which re-parsed every busy interval for every candidate slot) on synthetic calendars
+with hundreds of events.
+
+On one fully booked day (the last case) the legacy loop is faster. Almost all of the sweep's
+time there is parse_busy_intervals turning every interval into timestamps (about 1 µs each,
+mostly datetime.timestamp() on an offset-aware value). The legacy loop stops at the first
+clash for each slot, and on a day that is booked solid it finds one within the first few
+intervals, so it never parses most of them. The "parsing only" line shows this. Both stay
+under a millisecond, far below the freebusy round trip that fetches the intervals, so the
+engine doesn't fall back to the legacy loop. On multi-day searches the legacy loop's
+slots x intervals cost takes over.
+
+Run from the flowfix-backend directory:
+    python benchmarks/bench_availability.py
+"""
+import datetime
+import os
+import random
+import sys
+import timeit
+
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import availability
+
+LONDON_TZ = pytz.timezone("Europe/London")
+OPEN = datetime.time(9, 0)
+CLOSE = datetime.time(17, 0)
+START_DATE = datetime.date(2025, 6, 2)
+
+
+def make_busy(events, days, seed=42):
+    """
+    Generates `events` random 30-120 minute bookings spread across `days` days of business hours.
+    """
+    rng = random.Random(seed)
+    busy = []
+    for _ in range(events):
+        day = START_DATE + datetime.timedelta(days=rng.randrange(days))
+        start = LONDON_TZ.localize(datetime.datetime.combine(day, OPEN)) + datetime.timedelta(minutes=15 * rng.randrange(32))
+        end = start + datetime.timedelta(minutes=rng.choice([30, 60, 90, 120]))
+        busy.append({"start": start.isoformat(), "end": end.isoformat()})
+    return busy
+
+
+def legacy_slots(busy_intervals, start_date, end_date, duration_minutes=60):
+    """
+    The original algorithm from calendar_utils.find_available_slots, applied day by day.
+    """
+    available_slots = []
+    day = start_date
+    while day <= end_date:
+        day_start = LONDON_TZ.localize(datetime.datetime.combine(day, datetime.time.min))
+        potential_slot_start = day_start.replace(hour=OPEN.hour, minute=OPEN.minute)
+        business_day_end = day_start.replace(hour=CLOSE.hour, minute=CLOSE.minute)
+        while potential_slot_start < business_day_end:
+            potential_slot_end = potential_slot_start + datetime.timedelta(minutes=duration_minutes)
+            if potential_slot_end > business_day_end:
+                break
+            is_free = True
+            for busy_period in busy_intervals:
+                busy_start = datetime.datetime.fromisoformat(busy_period["start"])
+                busy_end = datetime.datetime.fromisoformat(busy_period["end"])
+                if potential_slot_start < busy_end and potential_slot_end > busy_start:
+                    is_free = False
+                    break
+            if is_free:
+                available_slots.append(potential_slot_start)
+            potential_slot_start += datetime.timedelta(minutes=30)
+        day += datetime.timedelta(days=1)
+    return available_slots
+
+
+def sweep_slots(busy_intervals, start_date, end_date, duration_minutes=60, limit=None):
+    return availability.find_free_slots(
+        availability.parse_busy_intervals(busy_intervals),
+        LONDON_TZ,
+        start_date,
+        end_date,
+        OPEN,
+        CLOSE,
+        duration_minutes=duration_minutes,
+        limit=limit,
+    )
+
+
+def bench(label, fn, number):
+    seconds = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print(f"  {label:<32} {seconds * 1000:9.3f} ms")
+    return seconds
+
+
+def busy_within(busy, start_date, days):
+    """
+    Keeps only the intervals the free/busy cache would return for the searched days.
+    """
+    window_start = LONDON_TZ.localize(datetime.datetime.combine(start_date, datetime.time.min))
+    window_end = window_start + datetime.timedelta(days=days)
+    return [
+        b for b in busy
+        if datetime.datetime.fromisoformat(b["start"]) < window_end
+        and datetime.datetime.fromisoformat(b["end"]) > window_start
+    ]
+
+
+def main():
+    cases = [
+        # (events on the calendar, days they are spread over, days searched)
+        (200, 28, 1),
+        (200, 28, 7),
+        (200, 28, 28),
+        (600, 28, 7),
+        (600, 28, 28),
+        (300, 1, 1),  # worst case: one fully booked day
+    ]
+    for events, calendar_days, days in cases:
+        busy = busy_within(make_busy(events, calendar_days), START_DATE, days)
+        end_date = START_DATE + datetime.timedelta(days=days - 1)
+        assert legacy_slots(busy, START_DATE, end_date) == sweep_slots(busy, START_DATE, end_date)
+
+        print(f"{events} events over {calendar_days} day(s), searching {days} day(s) ({len(busy)} busy intervals):")
+        number = 5 if len(busy) * days > 1000 else 20
+        legacy = bench("legacy per-slot loop", lambda: legacy_slots(busy, START_DATE, end_date), number)
+        sweep = bench("sort-and-sweep", lambda: sweep_slots(busy, START_DATE, end_date), number)
+        bench("  of which parsing only", lambda: availability.parse_busy_intervals(busy), number)
+        bench("sort-and-sweep, first 5 x 90min", lambda: sweep_slots(busy, START_DATE, end_date, 90, 5), number)
+        print(f"  speed-up: {legacy / sweep:.1f}x\n")
+
+
+if __name__ == "__main__":
+    main()
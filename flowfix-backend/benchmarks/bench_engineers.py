@@ -0,0 +1,84 @@
+"""
+Availability search latency as engineers are added.
+
+Runs calendar_utils.find_available_slots over 1 to 32 engineer calendars against a simulated
+Google Calendar (benchmarks/fakes.py) with a fixed round-trip latency, starting from a cold
+free/busy cache each time. Compares the batched search (one freebusy query with every engineer
+as an item) with querying each calendar in turn.
+
+Run from the flowfix-backend directory:
+    python benchmarks/bench_engineers.py [--latency-ms 80] [--days 7]
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.pop("REDIS_URL", None)  # The free/busy cache uses its in-process backend.
+
+import calendar_utils
+import engineers
+import fakes
+from freebusy_cache import FreeBusyCache
+
+ENGINEER_COUNTS = (1, 2, 4, 8, 16, 32)
+
+
+def install(count, latency_ms, counter):
+    calendar = fakes.FakeCalendar(latency_ms=latency_ms, counter=counter)
+    team = [engineers.Engineer(f"Engineer {i + 1}", f"engineer-{i + 1}@flowfix.test") for i in range(count)]
+    for i, engineer in enumerate(team):
+        calendar.seed_bookings(engineer.calendar_id, per_day=4, seed=i)
+    calendar_utils.calendar_client = fakes.FakeCalendarClient(calendar)
+    calendar_utils.ENGINEERS = team
+
+
+def one_query_per_calendar(calendar_ids, time_min, time_max):
+    busy = {}
+    for calendar_id in calendar_ids:
+        busy.update(calendar_utils.query_busy_intervals([calendar_id], time_min, time_max))
+    return busy
+
+
+def run(count, args, fetch_busy):
+    counter = fakes.CallCounter()
+    install(count, args.latency_ms, counter)
+    start = datetime.date.today() + datetime.timedelta(days=1)
+    end = start + datetime.timedelta(days=args.days - 1)
+    timings = []
+    for _ in range(args.runs):
+        calendar_utils.freebusy_cache = FreeBusyCache(
+            fetch_busy, calendar_utils.freebusy_cache.tz, prefetch_days=calendar_utils.FREEBUSY_PREFETCH_DAYS,
+        )
+        started = time.perf_counter()
+        slots = calendar_utils.find_available_slots(start.isoformat(), end_date_str=end.isoformat())
+        timings.append(time.perf_counter() - started)
+    queries = counter.snapshot().get("calendar.freebusy.query", 0) / args.runs
+    return statistics.median(timings), queries, len(slots)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="simulated Calendar API round trip")
+    parser.add_argument("--days", type=int, default=7, help="days searched")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Cold-cache search over {args.days} day(s), {args.latency_ms:.0f} ms per Calendar round trip (median of {args.runs}):")
+    print(f"  {'engineers':>9}  {'batched':>12} {'queries':>8}  {'per calendar':>12} {'queries':>8}  {'slots':>6}")
+    for count in ENGINEER_COUNTS:
+        batched, batched_queries, slots = run(count, args, calendar_utils.query_busy_intervals)
+        serial, serial_queries, serial_slots = run(count, args, one_query_per_calendar)
+        assert slots == serial_slots
+        print(
+            f"  {count:>9}  {batched * 1000:9.1f} ms {batched_queries:>8.0f}  "
+            f"{serial * 1000:9.1f} ms {serial_queries:>8.0f}  {slots:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
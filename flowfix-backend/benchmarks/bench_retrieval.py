@@ -0,0 +1,186 @@
+"""
+Recall and latency of knowledge base retrieval, per embedding backend and retrieval mode.
+
+Splits the knowledge base into small chunks, indexes them with every available embedding
+backend (see embedding_backends.py) and runs the questions in retrieval_eval.json through
+FAISS alone ("dense"), BM25 alone ("lexical") and both fused ("hybrid"). A question counts
+as recalled at k when a chunk containing its expected text is among the first k results.
+Latency is per question, including embedding it.
+
+Backends that can't run here are skipped: "google" needs GOOGLE_API_KEY and network access,
+"fastembed" needs `pip install -r requirements-fastembed.txt` (its model is downloaded on first use).
+
+Run from the flowfix-backend directory:
+    python benchmarks/bench_retrieval.py [--backends google fastembed] [--chunk-size 200 400] [--record]
+
+Each recorded line says whether the app's default configuration (EMBEDDING_BACKEND and
+RETRIEVAL_MODE) was among the backends measured; if it wasn't, that line is no evidence for it.
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv
+from langchain.text_splitter import CharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+import create_vectorstore
+import embedding_backends
+import index_builds
+from hybrid_retrieval import MODES, HybridRetriever
+
+EVAL_PATH = os.path.join(BENCH_DIR, "retrieval_eval.json")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results", "retrieval.jsonl")
+RECALL_AT = (1, 3)
+
+
+def available(backend):
+    if backend == "google":
+        return bool(os.getenv("GOOGLE_API_KEY")), "GOOGLE_API_KEY is not set"
+    if backend == "fastembed":
+        return importlib.util.find_spec("fastembed") is not None, "fastembed is not installed"
+    return False, "unknown backend"
+
+
+def load_chunks(chunk_size):
+    """
+    The knowledge base documents create_vectorstore.py indexes, re-split into smaller chunks
+    so a question has one right answer among several candidates.
+    """
+    splitter = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0, separator="\n")
+    chunks = {}
+    for doc in create_vectorstore.load_chunks().values():
+        for text in splitter.split_text(doc.page_content):
+            chunks[index_builds.chunk_hash(doc.metadata["source"], text)] = (text, doc.metadata)
+    return chunks
+
+
+def build_store(backend, chunks):
+    embeddings = embedding_backends.create(backend, embedding_backends.BACKENDS[backend])
+    hashes = list(chunks)
+    started = time.perf_counter()
+    vectors = embeddings.embed_documents([chunks[h][0] for h in hashes])
+    seconds = time.perf_counter() - started
+    store = FAISS.from_embeddings(
+        [(chunks[h][0], v) for h, v in zip(hashes, vectors)], embeddings,
+        metadatas=[chunks[h][1] for h in hashes], ids=hashes,
+    )
+    return store, seconds
+
+
+def evaluate(retriever, questions):
+    recalled = {k: 0 for k in RECALL_AT}
+    timings = []
+    retriever.k = max(RECALL_AT)
+    retriever.invoke(questions[0]["question"])  # First call loads models and warms caches.
+    for q in questions:
+        started = time.perf_counter()
+        docs = retriever.invoke(q["question"])
+        timings.append(time.perf_counter() - started)
+        ranks = [i for i, doc in enumerate(docs, start=1) if q["expected"] in doc.page_content]
+        for k in RECALL_AT:
+            recalled[k] += bool(ranks and ranks[0] <= k)
+    timings.sort()
+    return {
+        **{f"recall@{k}": round(recalled[k] / len(questions), 3) for k in RECALL_AT},
+        "p50_ms": round(statistics.median(timings) * 1000, 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 2),
+    }
+
+
+def run(backends, chunk_size, questions):
+    """
+    Evaluates every available backend and mode at one chunk size. Returns the result rows and
+    {backend: reason} for the backends that were skipped.
+    """
+    chunks = load_chunks(chunk_size)
+    print(f"{len(questions)} questions over {len(chunks)} chunks of up to {chunk_size} characters.\n")
+    print(f"  {'backend':<10} {'mode':<8} {'recall@1':>9} {'recall@3':>9} {'p50':>10} {'p95':>10}")
+
+    results = []
+    skipped = {}
+    lexical_done = False
+    for backend in backends:
+        ok, reason = available(backend)
+        if ok:
+            try:
+                store, index_seconds = build_store(backend, chunks)
+            except Exception as e:
+                ok, reason = False, f"could not embed the chunks: {str(e).splitlines()[0]}"
+        if not ok:
+            skipped[backend] = reason
+            print(f"  {backend:<10} skipped: {reason}")
+            continue
+        for mode in MODES:
+            if mode == "lexical" and lexical_done:
+                continue  # BM25 doesn't depend on the embedding backend.
+            result = evaluate(HybridRetriever.from_vector_store(store, mode=mode), questions)
+            label = "-" if mode == "lexical" else backend
+            results.append({"backend": label, "mode": mode, "index_seconds": round(index_seconds, 2), **result})
+            print(f"  {label:<10} {mode:<8} {result['recall@1']:>9.0%} {result['recall@3']:>9.0%} "
+                  f"{result['p50_ms']:>7.2f} ms {result['p95_ms']:>7.2f} ms")
+        lexical_done = True
+
+    if not lexical_done:
+        # No embedding backend here: BM25 alone still runs, over a store no query is sent to.
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        hashes = list(chunks)
+        store = FAISS.from_texts([chunks[h][0] for h in hashes], DeterministicFakeEmbedding(size=8), ids=hashes)
+        result = evaluate(HybridRetriever.from_vector_store(store, mode="lexical"), questions)
+        results.append({"backend": "-", "mode": "lexical", **result})
+        print(f"  {'-':<10} {'lexical':<8} {result['recall@1']:>9.0%} {result['recall@3']:>9.0%} "
+              f"{result['p50_ms']:>7.2f} ms {result['p95_ms']:>7.2f} ms")
+    print()
+    return results, skipped, len(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(embedding_backends.BACKENDS))
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[200], help="one run per size")
+    parser.add_argument("--eval", default=EVAL_PATH, help="questions with the text their answer contains")
+    parser.add_argument("--record", action="store_true", help=f"append the results to {os.path.relpath(RESULTS_PATH, BACKEND_DIR)}")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(BACKEND_DIR, ".env"))
+    import runtime  # After the .env is loaded, so RETRIEVAL_MODE and EMBEDDING_BACKEND come from it.
+    default = {"backend": embedding_backends.configured()[0], "mode": runtime.RETRIEVAL_MODE}
+    with open(args.eval, "r") as f:
+        questions = json.load(f)
+
+    records = []
+    for chunk_size in args.chunk_size:
+        results, skipped, chunk_count = run(args.backends, chunk_size, questions)
+        measured = any(r["backend"] == default["backend"] and r["mode"] == default["mode"] for r in results)
+        if not measured:
+            print(f"The app's default retrieval ({default['backend']} {default['mode']}) was not measured.\n")
+        records.append({
+            "recorded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "questions": len(questions),
+            "chunks": chunk_count,
+            "chunk_size": chunk_size,
+            # The configuration the app runs with, and whether this run has a row for it.
+            "default": {**default, "measured": measured},
+            "skipped": skipped,
+            "results": results,
+        })
+
+    if args.record:
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        with open(RESULTS_PATH, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        print(f"Recorded to {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Startup benchmark for the web app.
+
+Measures, each in a fresh interpreter:
+  - import_app:        `import app` (the Flask app factory runs at import)
+  - first_agent_lazy:  building the conversational agent on first use, without a warm-up
+  - warm_up:           runtime.warm_up(), as run once in a preforking master
+  - first_agent_warm:  building the agent in a process that has already been warmed up
+and lists the slowest imports behind `import app` (python -X importtime).
+
+No network calls are made; dummy REDIS_URL / GOOGLE_API_KEY values are used when unset.
+
+Run from the flowfix-backend directory:
+    python benchmarks/bench_startup.py            # print the figures and the change since the last record
+    python benchmarks/bench_startup.py --record   # also append them to benchmarks/results/startup.jsonl
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(BACKEND_DIR, "benchmarks", "results", "startup.jsonl")
+
+# Runs in the child interpreter and prints its timings as JSON.
+CHILD_SCRIPT = """
+import json, resource, sys, time
+timings = {}
+started = time.perf_counter()
+import app
+import runtime
+timings["import_app"] = time.perf_counter() - started
+if sys.argv[1] == "warm":
+    started = time.perf_counter()
+    runtime.warm_up()
+    timings["warm_up"] = time.perf_counter() - started
+started = time.perf_counter()
+runtime.get_conversational_agent()
+timings["first_agent_" + sys.argv[1]] = time.perf_counter() - started
+timings["maxrss_mb_" + sys.argv[1]] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps(timings))
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    env.setdefault("GOOGLE_API_KEY", "benchmark-dummy-key")
+    return env
+
+
+def run_child(mode):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, mode],
+        cwd=BACKEND_DIR, env=child_env(), capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(top):
+    """
+    Returns the `top` modules imported directly by app.py with the largest cumulative import time.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BACKEND_DIR, env=child_env(), capture_output=True, text=True, check=True,
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Each level of nesting adds two spaces; a module is printed after everything it imports.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == "app":
+                break
+            modules = []
+        elif depth == 1:
+            modules.append((int(cumulative), name.strip()))
+    return [{"module": name, "ms": round(us / 1000, 1)} for us, name in sorted(modules, reverse=True)[:top]]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def last_record():
+    try:
+        with open(RESULTS_PATH, "r") as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per mode (the median is reported)")
+    parser.add_argument("--record", action="store_true", help=f"append the result to {os.path.relpath(RESULTS_PATH, BACKEND_DIR)}")
+    args = parser.parse_args()
+
+    samples = {}
+    for mode in ("lazy", "warm"):
+        for _ in range(args.runs):
+            for name, value in run_child(mode).items():
+                samples.setdefault(name, []).append(value)
+
+    metrics = {}
+    for name, values in samples.items():
+        median = statistics.median(values)
+        metrics[name] = round(median, 1) if name.startswith("maxrss") else round(median * 1000, 1)
+
+    previous = last_record()
+    print(f"Startup over {args.runs} run(s) per mode (median):")
+    for name, value in metrics.items():
+        unit = "MB" if name.startswith("maxrss") else "ms"
+        change = ""
+        if previous and name in previous["metrics"]:
+            change = f"   ({value - previous['metrics'][name]:+.1f} since {previous.get('commit') or 'last record'})"
+        print(f"  {name:<22} {value:9.1f} {unit}{change}")
+
+    imports = slowest_imports(top=8)
+    print("\nSlowest imports in app.py:")
+    for item in imports:
+        print(f"  {item['module']:<40} {item['ms']:8.1f} ms")
+
+    if args.record:
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        record = {
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "runs": args.runs,
+            "metrics": metrics,
+            "slowest_imports": imports,
+        }
+        with open(RESULTS_PATH, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"\nRecorded to {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""
+Local stand-ins for Gemini, Google Calendar and Redis, used by the load-test harness.
+
+- ScriptedChatModel replays tool-call scripts keyed by the user's message, with configurable latency.
+- FakeCalendar implements the freebusy.query / events.insert / events.list calls the app makes.
+- Redis is fakeredis (or a real local server); count_redis_round_trips() counts what is sent.
+
+Every stand-in reports into a shared CallCounter, so a turn's external calls can be counted.
+"""
+import asyncio
+import collections
+import datetime
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Any
+
+import pytz
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import tracing
+from stats import LatencyStats
+
+LONDON_TZ = pytz.timezone("Europe/London")
+
+# The retrieval chain's prompt starts with this; those calls get a canned answer.
+RAG_PROMPT_PREFIX = "Answer the user's question based only on the following context."
+
+
+class CallCounter:
+    """
+    Thread-safe counts of external calls by name, e.g. "llm", "calendar.freebusy.query", "redis".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+
+    def add(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    @staticmethod
+    def diff(after, before):
+        return {k: v - before.get(k, 0) for k, v in after.items() if v - before.get(k, 0)}
+
+
+def _delay(latency_ms, jitter_ms, rng):
+    return max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000
+
+
+def _approx_tokens(text):
+    return max(1, len(text) // 4)
+
+
+# --- GEMINI ---
+class ScriptedChatModel(BaseChatModel):
+    """
+    A chat model that plays back scripted turns instead of calling Gemini.
+
+    `scripts` maps a user message to {"tool_calls": [...], "reply": str}. Each entry of
+    tool_calls is one model step: a single call {"name", "args"} or a list of calls made
+    together. The step is chosen from how many tool-calling messages already follow the
+    user's message, so one shared model serves any number of concurrent conversations.
+    Messages with no script get `default_reply`.
+    """
+
+    scripts: dict = {}
+    default_reply: str = "Is there anything else I can help you with?"
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    chunk_ms: float = 0.0
+    counter: Any = None
+    seed: int = 0
+
+    _rng: Any = None
+
+    @property
+    def _llm_type(self):
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _next_message(self, messages):
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        prompt_text = " ".join(str(m.content) for m in messages)
+        human_index = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+        text = messages[human_index].content if human_index >= 0 else ""
+
+        if isinstance(text, str) and text.startswith(RAG_PROMPT_PREFIX):
+            kind, message = "llm.rag", AIMessage(content=_rag_answer(text))
+        else:
+            kind = "llm.agent"
+            script = self.scripts.get(text, {})
+            steps = script.get("tool_calls", [])
+            step = sum(1 for m in messages[human_index + 1:] if isinstance(m, AIMessage) and m.tool_calls)
+            if step < len(steps):
+                calls = steps[step] if isinstance(steps[step], list) else [steps[step]]
+                message = AIMessage(content="", tool_calls=[
+                    {"name": c["name"], "args": c.get("args", {}), "id": f"call_{uuid.uuid4().hex[:12]}"} for c in calls
+                ])
+            else:
+                message = AIMessage(content=script.get("reply", self.default_reply))
+
+        input_tokens = _approx_tokens(prompt_text)
+        output_tokens = _approx_tokens(str(message.content)) + 10 * len(message.tool_calls)
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        if self.counter is not None:
+            self.counter.add("llm")
+            self.counter.add(kind)
+            self.counter.add("llm.input_tokens", input_tokens)
+        return message
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._next_message(messages)
+        time.sleep(_delay(self.latency_ms, self.jitter_ms, self._rng))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._next_message(messages)
+        await asyncio.sleep(_delay(self.latency_ms, self.jitter_ms, self._rng))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._next_message(messages)
+        time.sleep(_delay(self.latency_ms, self.jitter_ms, self._rng))
+        for i, chunk in enumerate(_chunks(message)):
+            if i and self.chunk_ms:
+                time.sleep(self.chunk_ms / 1000)
+            if run_manager and chunk.text:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._next_message(messages)
+        await asyncio.sleep(_delay(self.latency_ms, self.jitter_ms, self._rng))
+        for i, chunk in enumerate(_chunks(message)):
+            if i and self.chunk_ms:
+                await asyncio.sleep(self.chunk_ms / 1000)
+            if run_manager and chunk.text:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def _chunks(message):
+    if message.tool_calls:
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ],
+            usage_metadata=message.usage_metadata,
+        ))
+        return
+    words = message.content.split(" ")
+    for i, word in enumerate(words):
+        last = i == len(words) - 1
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content=word if last else word + " ",
+            usage_metadata=message.usage_metadata if last else None,
+        ))
+
+
+def _rag_answer(prompt):
+    # Answer with the first line of the retrieved context, like a grounded model would.
+    context = prompt.split("Context:", 1)[-1].split("Question:", 1)[0]
+    lines = [line.strip("- ").strip() for line in context.splitlines() if line.strip().startswith("-")]
+    return lines[0] if lines else "I don't have that information."
+
+
+# --- GOOGLE CALENDAR ---
+class _Request:
+    def __init__(self, calendar, name, handler, kwargs):
+        self.calendar = calendar
+        self.name = name
+        self.handler = handler
+        self.kwargs = kwargs
+
+    def execute(self, http=None, num_retries=0):
+        return self.calendar.call(self.name, self.handler, self.kwargs)
+
+
+class _BatchRequest:
+    # googleapiclient's BatchHttpRequest: the added requests share one round trip.
+    def __init__(self, calendar, callback):
+        self.calendar = calendar
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self, http=None):
+        def run_all():
+            for request_id, request, callback in self.requests:
+                try:
+                    response, exception = request.handler(**request.kwargs), None
+                except Exception as e:
+                    response, exception = None, e
+                callback(request_id, response, exception)
+        self.calendar.call("batch", run_all, {})
+
+
+class _Resource:
+    def __init__(self, calendar, prefix, handlers):
+        self.calendar = calendar
+        self.prefix = prefix
+        self.handlers = handlers
+
+    def __getattr__(self, method):
+        handler = self.handlers[method]
+        return lambda **kwargs: _Request(self.calendar, f"{self.prefix}.{method}", handler, kwargs)
+
+
+class FakeCalendar:
+    """
+    In-memory stand-in for the googleapiclient Calendar v3 service: freebusy().query(),
+    events().insert(), events().list() and batch requests on any number of calendar ids, with a
+    simulated round-trip latency.
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, counter=None, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.counter = counter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._events = collections.defaultdict(list)  # calendar id -> [(start, end, summary, id)]
+        self._ids = itertools.count(1)
+
+    def seed_bookings(self, calendar_id="primary", days=28, per_day=4, business_start=9, business_end=17, seed=42):
+        """
+        Adds `per_day` random 1-2 hour bookings to each of the next `days` days.
+        """
+        rng = random.Random(seed)
+        today = datetime.date.today()
+        for offset in range(days):
+            day = today + datetime.timedelta(days=offset)
+            for _ in range(per_day):
+                start = LONDON_TZ.localize(datetime.datetime.combine(day, datetime.time(business_start))) + \
+                    datetime.timedelta(minutes=30 * rng.randrange((business_end - business_start) * 2 - 2))
+                end = start + datetime.timedelta(minutes=rng.choice([60, 90, 120]))
+                self.add_event(calendar_id, start, end, "Plumbing: existing booking")
+
+    def add_event(self, calendar_id, start, end, summary):
+        with self._lock:
+            event_id = f"evt{next(self._ids)}"
+            self._events[calendar_id].append((start, end, summary, event_id))
+        return event_id
+
+    # --- googleapiclient-style resources ---
+    def freebusy(self):
+        return _Resource(self, "freebusy", {"query": self._freebusy_query})
+
+    def events(self):
+        return _Resource(self, "events", {"insert": self._events_insert, "list": self._events_list})
+
+    def new_batch_http_request(self, callback=None):
+        return _BatchRequest(self, callback)
+
+    def call(self, name, handler, kwargs):
+        if self.counter is not None:
+            self.counter.add("calendar")
+            self.counter.add(f"calendar.{name}")
+        time.sleep(_delay(self.latency_ms, self.jitter_ms, self._rng))
+        return handler(**kwargs)
+
+    def _overlapping(self, calendar_id, time_min, time_max):
+        with self._lock:
+            events = list(self._events.get(calendar_id, []))
+        return sorted((e for e in events if e[0] < time_max and e[1] > time_min), key=lambda e: e[0])
+
+    def _freebusy_query(self, body):
+        time_min = _parse_time(body["timeMin"])
+        time_max = _parse_time(body["timeMax"])
+        return {
+            "kind": "calendar#freeBusy",
+            "calendars": {
+                item["id"]: {"busy": [
+                    {"start": s.astimezone(pytz.utc).isoformat(), "end": e.astimezone(pytz.utc).isoformat()}
+                    for s, e, _, _ in self._overlapping(item["id"], time_min, time_max)
+                ]}
+                for item in body["items"]
+            },
+        }
+
+    def _events_insert(self, calendarId, body):
+        start = _parse_time(body["start"]["dateTime"])
+        end = _parse_time(body["end"]["dateTime"])
+        event_id = self.add_event(calendarId, start, end, body.get("summary", ""))
+        return {"id": event_id, "status": "confirmed", **body}
+
+    def _events_list(self, calendarId, timeMin, timeMax, q=None, **kwargs):
+        events = self._overlapping(calendarId, _parse_time(timeMin), _parse_time(timeMax))
+        return {"items": [
+            {"id": i, "summary": summary, "start": {"dateTime": s.isoformat()}, "end": {"dateTime": e.isoformat()}}
+            for s, e, summary, i in events
+            if not q or q.lower() in summary.lower()
+        ]}
+
+
+def _parse_time(value):
+    moment = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return moment if moment.tzinfo else LONDON_TZ.localize(moment)
+
+
+class FakeCalendarClient:
+    """
+    Drop-in for calendar_client.CalendarClient that serves a FakeCalendar.
+    """
+
+    def __init__(self, calendar):
+        self.calendar = calendar
+        self._stats = LatencyStats()
+
+    def service(self):
+        return self.calendar
+
+    def execute(self, name, request):
+        started = time.perf_counter()
+        try:
+            with tracing.span("calendar", name):
+                return request.execute()
+        finally:
+            self._stats.record(name, time.perf_counter() - started)
+
+    def stats(self):
+        return self._stats.snapshot()
+
+    def close(self):
+        pass
+
+
+# --- REDIS ---
+def count_redis_round_trips(counter):
+    """
+    Counts every command or pipeline written to a Redis connection (sync and asyncio clients,
+    fakeredis or a real server) as one round trip.
+    """
+    import redis.asyncio.connection
+    import redis.connection
+
+    sync_send = redis.connection.AbstractConnection.send_packed_command
+    async_send = redis.asyncio.connection.AbstractConnection.send_packed_command
+
+    def send_packed_command(self, *args, **kwargs):
+        counter.add("redis")
+        return sync_send(self, *args, **kwargs)
+
+    async def async_send_packed_command(self, *args, **kwargs):
+        counter.add("redis")
+        return await async_send(self, *args, **kwargs)
+
+    redis.connection.AbstractConnection.send_packed_command = send_packed_command
+    redis.asyncio.connection.AbstractConnection.send_packed_command = async_send_packed_command
+
+
+def use_fakeredis():
+    """
+    Points every Redis client the app creates at one in-process fakeredis server.
+    """
+    import fakeredis
+    import redis
+    import redis.asyncio as aioredis
+
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server))
+    redis.ConnectionPool.from_url = classmethod(
+        lambda cls, url, **kwargs: redis.ConnectionPool(connection_class=fakeredis.FakeRedisConnection, server=server)
+    )
+    aioredis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeAsyncRedis(server=server))
+    return server
@@ -0,0 +1,435 @@
+"""
+Offline load test for the chat endpoints.
+
+Drives the Flask app (or the ASGI app) in-process with scripted multi-turn conversations,
+against local stand-ins instead of the real services (see fakes.py):
+  - Gemini:           ScriptedChatModel, with configurable latency and tool-call scripts
+  - Google Calendar:  FakeCalendar (freebusy / events), pre-seeded with bookings
+  - Redis:            fakeredis, or a real server with --redis-url
+  - Knowledge base:   a FAISS index of knowledge_base.md built with deterministic fake embeddings
+
+It first plays every scenario once, on its own, and reports the external calls each turn makes
+(Gemini, Calendar, Redis round trips). It then runs the requested number of conversations
+concurrently and reports p50/p95/p99 latency, requests per second and calls per turn.
+
+Run from the flowfix-backend directory:
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --target asgi --conversations 400 --concurrency 50 --llm-latency-ms 800
+    python benchmarks/loadtest.py --stream --scenarios my_scenarios.json --record
+    FLOWFIX_TRACE_DIR=/tmp/traces python benchmarks/loadtest.py   # also keep a JSON trace of every turn
+    python benchmarks/loadtest.py --double-send 0.3   # post 30% of turns twice at once, as a double-click would
+
+Turns refused by admission control (429, or an SSE error with retry_after) are counted as rejected.
+
+Scenario files are JSON lists of {"name", "weight", "turns"}; each turn has a "user" message and,
+for turns the agent handles, the model's "tool_calls" and final "reply". "{date+N}" in any string
+is replaced with the date N days from today. User messages must be unique across scenarios.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+DEFAULT_SCENARIOS_PATH = os.path.join(BENCH_DIR, "scenarios.json")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results", "loadtest.jsonl")
+DATE_PLACEHOLDER = re.compile(r"\{date\+(\d+)\}")
+
+
+# --- SCENARIOS ---
+def load_scenarios(path):
+    with open(path, "r") as f:
+        return _expand_dates(json.load(f), datetime.date.today())
+
+
+def _expand_dates(value, today):
+    if isinstance(value, str):
+        return DATE_PLACEHOLDER.sub(lambda m: (today + datetime.timedelta(days=int(m.group(1)))).isoformat(), value)
+    if isinstance(value, list):
+        return [_expand_dates(v, today) for v in value]
+    if isinstance(value, dict):
+        return {k: _expand_dates(v, today) for k, v in value.items()}
+    return value
+
+
+def model_scripts(scenarios):
+    scripts = {}
+    for scenario in scenarios:
+        for turn in scenario["turns"]:
+            if turn["user"] in scripts:
+                raise ValueError(f"User message used twice across scenarios: {turn['user']!r}")
+            scripts[turn["user"]] = {k: v for k, v in turn.items() if k != "user"}
+    return scripts
+
+
+# --- STAND-INS ---
+def install_fakes(args, scenarios):
+    """
+    Swaps Gemini, the embeddings, Google Calendar and Redis for local stand-ins before the app
+    builds anything. Returns the shared CallCounter.
+    """
+    os.environ["REDIS_URL"] = args.redis_url or "redis://localhost:6379/0"
+    os.environ.setdefault("GOOGLE_API_KEY", "loadtest-dummy-key")
+    # The clients share one app; size its agent limits (see runtime.py) so none is turned away.
+    os.environ.setdefault("WORKER_THREADS", str(args.concurrency + 2))
+
+    import fakes
+    counter = fakes.CallCounter()
+    fakes.count_redis_round_trips(counter)
+    if not args.redis_url:
+        fakes.use_fakeredis()
+
+    import calendar_utils
+    import runtime
+
+    model = fakes.ScriptedChatModel(
+        scripts=model_scripts(scenarios),
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_jitter_ms,
+        chunk_ms=args.llm_chunk_ms,
+        counter=counter,
+    )
+
+    @runtime.lazy
+    def get_llm():
+        return model
+
+    embeddings = build_fake_knowledge_base(runtime)
+
+    @runtime.lazy
+    def get_embeddings():
+        return embeddings
+
+    runtime.get_llm = get_llm
+    runtime.get_embeddings = get_embeddings
+
+    calendar = fakes.FakeCalendar(latency_ms=args.calendar_latency_ms, jitter_ms=args.calendar_latency_ms / 4, counter=counter)
+    if args.engineers > 1:
+        import engineers
+        calendar_utils.ENGINEERS = [
+            engineers.Engineer(f"Engineer {i + 1}", f"engineer-{i + 1}@flowfix.test") for i in range(args.engineers)
+        ]
+    for i, engineer in enumerate(calendar_utils.ENGINEERS):
+        calendar.seed_bookings(engineer.calendar_id, per_day=args.bookings_per_day, seed=42 + i)
+    calendar_utils.calendar_client = fakes.FakeCalendarClient(calendar)
+
+    # Start the background watcher now, so its first poll isn't counted against a turn.
+    runtime.start_background_tasks()
+    deadline = time.monotonic() + 5
+    while calendar_utils.emergency_watcher.snapshot() is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return counter
+
+
+def build_fake_knowledge_base(runtime):
+    """
+    Indexes knowledge_base.md with deterministic fake embeddings into a temporary build,
+    so get_general_information runs real FAISS retrieval without the embeddings API.
+    """
+    from langchain.text_splitter import CharacterTextSplitter
+    from langchain_community.document_loaders import TextLoader
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    import index_builds
+
+    embeddings = DeterministicFakeEmbedding(size=256)
+    documents = TextLoader(os.path.join(BACKEND_DIR, "knowledge_base.md")).load()
+    chunks = CharacterTextSplitter(chunk_size=1000, chunk_overlap=100).split_documents(documents)
+
+    index_root = tempfile.mkdtemp(prefix="flowfix-loadtest-")
+    build_id, build_dir = index_builds.new_build_dir(index_root)
+    FAISS.from_documents(chunks, embeddings).save_local(build_dir)
+    index_builds.publish_build(index_root, build_id)
+    runtime.FAISS_INDEX_PATH = index_root
+    return embeddings
+
+
+# --- TARGETS ---
+class FlaskTarget:
+    """
+    Posts turns to the Flask app through its test client, one client per worker thread.
+    """
+
+    def __init__(self, stream, seed=0):
+        import app
+        self.app = app.app
+        self.path = "/chat/stream" if stream else "/chat"
+        self.stream = stream
+        self.double_send = 0.0  # Fraction of turns posted twice at once.
+        self._rng = random.Random(seed)
+        self._local = threading.local()
+
+    def run(self, conversations, concurrency, on_turn):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda c: self.converse(c, on_turn), conversations))
+
+    def converse(self, scenario, on_turn):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        session_id = f"loadtest-{uuid.uuid4().hex}"
+        for i, turn in enumerate(scenario["turns"]):
+            body = {"message": turn["user"], "session_id": session_id}
+            duplicate = None
+            if self._rng.random() < self.double_send:
+                duplicate = threading.Thread(target=lambda: self.app.test_client().post(self.path, json=body).get_data())
+                duplicate.start()
+            started = time.perf_counter()
+            ttft = None
+            response = client.post(self.path, json=body, buffered=False)
+            status = "ok" if response.status_code == 200 else "rejected" if response.status_code == 429 else "error"
+            if self.stream:
+                for chunk in response.response:
+                    chunk = chunk if isinstance(chunk, bytes) else chunk.encode()
+                    if ttft is None and b"event: token" in chunk:
+                        ttft = time.perf_counter() - started
+                    if b"event: error" in chunk:
+                        status = "rejected" if b"retry_after" in chunk else "error"
+            else:
+                response.get_data()
+            response.close()
+            if duplicate is not None:
+                duplicate.join()
+            on_turn(scenario["name"], i, time.perf_counter() - started, ttft, status)
+
+
+class AsgiTarget:
+    """
+    Posts turns to the Quart app (asgi.py) through its test client, all on one event loop.
+    """
+
+    def __init__(self, stream, seed=0):
+        import asgi
+        self.app = asgi.app
+        self.path = "/chat/stream" if stream else "/chat"
+        self.stream = stream
+        self.double_send = 0.0  # Fraction of turns posted twice at once.
+        self._rng = random.Random(seed)
+
+    def run(self, conversations, concurrency, on_turn):
+        asyncio.run(self._run(conversations, concurrency, on_turn))
+
+    async def _run(self, conversations, concurrency, on_turn):
+        semaphore = asyncio.Semaphore(concurrency)
+        async with self.app.test_app() as test_app:
+            client = test_app.test_client()
+
+            async def converse(scenario):
+                async with semaphore:
+                    session_id = f"loadtest-{uuid.uuid4().hex}"
+                    for i, turn in enumerate(scenario["turns"]):
+                        body = {"message": turn["user"], "session_id": session_id}
+                        sends = 2 if self._rng.random() < self.double_send else 1
+                        started = time.perf_counter()
+                        responses = await asyncio.gather(*(client.post(self.path, json=body) for _ in range(sends)))
+                        data = await responses[0].get_data()
+                        status = responses[0].status_code
+                        if status == 429 or b"retry_after" in data:
+                            outcome = "rejected"
+                        else:
+                            outcome = "ok" if status == 200 and b"event: error" not in data else "error"
+                        on_turn(scenario["name"], i, time.perf_counter() - started, None, outcome)
+
+            await asyncio.gather(*(converse(c) for c in conversations))
+
+
+TARGETS = {"flask": FlaskTarget, "asgi": AsgiTarget}
+
+
+# --- MEASUREMENT ---
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5 - 1e-9)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(samples):
+    ms = [s * 1000 for s in samples]
+    return {
+        "p50_ms": round(percentile(ms, 50), 1),
+        "p95_ms": round(percentile(ms, 95), 1),
+        "p99_ms": round(percentile(ms, 99), 1),
+        "mean_ms": round(statistics.fmean(ms), 1),
+        "max_ms": round(max(ms), 1),
+    }
+
+
+def profile_turns(target, scenarios, counter):
+    """
+    Plays each scenario once, alone, and returns the external calls made by every turn.
+    """
+    rows = []
+    for scenario in scenarios:
+        before = [counter.snapshot()]
+
+        def on_turn(name, index, seconds, ttft, status):
+            after = counter.snapshot()
+            rows.append({
+                "scenario": name,
+                "turn": index + 1,
+                "ok": status == "ok",
+                "ms": round(seconds * 1000, 1),
+                "calls": counter.diff(after, before[0]),
+            })
+            before[0] = after
+
+        target.run([scenario], 1, on_turn)
+    return rows
+
+
+def run_load(target, scenarios, counter, conversations, concurrency, seed):
+    rng = random.Random(seed)
+    picked = rng.choices(scenarios, weights=[s.get("weight", 1) for s in scenarios], k=conversations)
+
+    lock = threading.Lock()
+    turns = []
+
+    def on_turn(name, index, seconds, ttft, status):
+        with lock:
+            turns.append((name, index, seconds, ttft, status))
+
+    before = counter.snapshot()
+    started = time.perf_counter()
+    target.run(picked, concurrency, on_turn)
+    elapsed = time.perf_counter() - started
+    calls = counter.diff(counter.snapshot(), before)
+
+    result = {
+        "conversations": conversations,
+        "concurrency": concurrency,
+        "turns": len(turns),
+        "errors": sum(1 for t in turns if t[4] == "error"),
+        "rejected": sum(1 for t in turns if t[4] == "rejected"),
+        "elapsed_s": round(elapsed, 2),
+        "rps": round(len(turns) / elapsed, 1),
+        "latency": latency_summary([t[2] for t in turns]),
+        "calls_per_turn": {k: round(v / len(turns), 2) for k, v in sorted(calls.items())},
+        "by_scenario": {},
+    }
+    ttfts = [t[3] for t in turns if t[3] is not None]
+    if ttfts:
+        result["time_to_first_token"] = latency_summary(ttfts)
+    for scenario in scenarios:
+        samples = [t[2] for t in turns if t[0] == scenario["name"]]
+        if samples:
+            result["by_scenario"][scenario["name"]] = {"turns": len(samples), **latency_summary(samples)}
+    return result
+
+
+# --- REPORTING ---
+def print_profile(rows):
+    print("External calls per turn (each scenario played alone):")
+    print(f"  {'scenario':<20} {'turn':>4} {'ms':>8}  {'llm':>3} {'cal':>3} {'redis':>5}  detail")
+    for row in rows:
+        calls = row["calls"]
+        detail = ", ".join(f"{k}={v}" for k, v in sorted(calls.items()) if "." in k)
+        flag = "" if row["ok"] else "  ERROR"
+        print(
+            f"  {row['scenario']:<20} {row['turn']:>4} {row['ms']:>8.1f}  {calls.get('llm', 0):>3} "
+            f"{calls.get('calendar', 0):>3} {calls.get('redis', 0):>5}  {detail}{flag}"
+        )
+
+
+def print_load(result, target_name, path):
+    latency = result["latency"]
+    print(
+        f"\nLoad: {result['conversations']} conversations, {result['turns']} turns on {target_name} {path} "
+        f"at concurrency {result['concurrency']} in {result['elapsed_s']}s"
+    )
+    print(f"  throughput   {result['rps']:.1f} turns/s   errors: {result['errors']}   rejected: {result['rejected']}")
+    print(f"  latency      p50 {latency['p50_ms']:.1f} ms   p95 {latency['p95_ms']:.1f} ms   p99 {latency['p99_ms']:.1f} ms   max {latency['max_ms']:.1f} ms")
+    if "time_to_first_token" in result:
+        ttft = result["time_to_first_token"]
+        print(f"  first token  p50 {ttft['p50_ms']:.1f} ms   p95 {ttft['p95_ms']:.1f} ms   p99 {ttft['p99_ms']:.1f} ms")
+    print("  calls/turn   " + "   ".join(f"{k} {v}" for k, v in result["calls_per_turn"].items()))
+    for name, stats in result["by_scenario"].items():
+        print(f"  {name:<20} {stats['turns']:>5} turns   p50 {stats['p50_ms']:8.1f} ms   p95 {stats['p95_ms']:8.1f} ms")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=sorted(TARGETS), default="flask")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream instead of /chat")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS_PATH)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="simulated Gemini latency per call")
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--llm-chunk-ms", type=float, default=5.0, help="delay between streamed chunks")
+    parser.add_argument("--calendar-latency-ms", type=float, default=120.0, help="simulated Calendar API round trip")
+    parser.add_argument("--bookings-per-day", type=int, default=4, help="existing bookings seeded on the fake calendar")
+    parser.add_argument("--engineers", type=int, default=1, help="engineer calendars on the fake calendar")
+    parser.add_argument("--double-send", type=float, default=0.0, help="fraction of turns posted twice at once")
+    parser.add_argument("--redis-url", help="use this Redis server instead of fakeredis (its data is written to!)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the full result to this file")
+    parser.add_argument("--record", action="store_true", help=f"append the result to {os.path.relpath(RESULTS_PATH, BACKEND_DIR)}")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenarios)
+    counter = install_fakes(args, scenarios)
+
+    target = TARGETS[args.target](args.stream, seed=args.seed)
+    profile = profile_turns(target, scenarios, counter)
+    target.double_send = args.double_send  # The profile plays each turn once.
+    load = run_load(target, scenarios, counter, args.conversations, args.concurrency, args.seed)
+
+    print()
+    print_profile(profile)
+    print_load(load, args.target, target.path)
+
+    result = {
+        "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "target": args.target,
+        "path": target.path,
+        "settings": {
+            "llm_latency_ms": args.llm_latency_ms,
+            "calendar_latency_ms": args.calendar_latency_ms,
+            "redis": "server" if args.redis_url else "fakeredis",
+            "double_send": args.double_send,
+            "scenarios": os.path.basename(args.scenarios),
+        },
+        "profile": profile,
+        "load": load,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.record:
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        with open(RESULTS_PATH, "a") as f:
+            f.write(json.dumps(result) + "\n")
+        print(f"\nRecorded to {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
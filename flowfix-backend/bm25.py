@@ -0,0 +1,56 @@
+import collections
+import heapq
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Words too common in plumbing questions to say anything about which chunk is relevant.
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from have how i if in is it me my of on or our "
+    "the this to we what when where which who will with you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process Okapi BM25 over a fixed list of texts.
+
+    Built once per knowledge base build from an inverted index (term -> [(doc, term count)]),
+    so a search only touches the postings of the query's terms.
+    """
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+        self._lengths = []
+        self._postings = collections.defaultdict(list)
+        for i, text in enumerate(texts):
+            counts = collections.Counter(tokenize(text))
+            self._lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self._postings[term].append((i, count))
+        self._average_length = (sum(self._lengths) / self.size) if self.size else 0.0
+        self._idf = {
+            term: math.log(1 + (self.size - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def search(self, query, k=10):
+        """
+        Returns up to k (text index, score) pairs, best first. Texts sharing no term with the query are left out.
+        """
+        scores = collections.defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, count in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / self._average_length)
+                scores[i] += idf * count * (self.k1 + 1) / (count + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,147 @@
+import datetime
+import os.path
+import threading
+import time
+
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+
+import tracing
+from stats import LatencyStats
+
+# Refresh the OAuth token this many seconds before it actually expires.
+REFRESH_MARGIN_SECONDS = 300
+# How long to wait before retrying after a failed background refresh.
+REFRESH_RETRY_SECONDS = 30
+HTTP_TIMEOUT_SECONDS = 20
+
+
+class CalendarClient:
+    """
+    A long-lived, thread-safe Google Calendar client shared by the whole worker process.
+
+    The credentials and the discovery-built service object are created once. Every thread gets
+    its own authorised HTTP connection (httplib2 is not thread-safe), which is then reused across
+    calls. A daemon thread refreshes the OAuth token shortly before it expires, so requests never
+    pay for a refresh inline.
+    """
+
+    def __init__(self, token_path, credentials_path, scopes):
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.scopes = scopes
+
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._creds = None
+        self._service = None
+        self._refresher = None
+        self._stop = threading.Event()
+
+        self._stats = LatencyStats()
+
+    # --- CREDENTIALS ---
+    def _load_credentials(self):
+        """
+        Loads credentials from token.json, refreshing or running the OAuth flow if required.
+        """
+        creds = None
+        if os.path.exists(self.token_path):
+            creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
+                creds = flow.run_local_server(port=0)
+            self._save_credentials(creds)
+        return creds
+
+    def _save_credentials(self, creds):
+        with open(self.token_path, "w") as token:
+            token.write(creds.to_json())
+
+    def _refresh_credentials(self):
+        with self._lock:
+            self._creds.refresh(Request())
+            self._save_credentials(self._creds)
+
+    def _seconds_until_refresh(self):
+        expiry = self._creds.expiry
+        if expiry is None:
+            return None
+        # google-auth stores the expiry as a naive UTC datetime.
+        remaining = (expiry - datetime.datetime.utcnow()).total_seconds()
+        return max(0, remaining - REFRESH_MARGIN_SECONDS)
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            wait = self._seconds_until_refresh()
+            if wait is None:
+                return
+            if self._stop.wait(wait):
+                return
+            try:
+                self._refresh_credentials()
+            except Exception as e:
+                print(f"Background calendar token refresh failed: {e}")
+                self._stop.wait(REFRESH_RETRY_SECONDS)
+
+    def _start_refresher(self):
+        if self._refresher and self._refresher.is_alive():
+            return
+        if not self._creds.refresh_token:
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="calendar-token-refresh", daemon=True)
+        self._refresher.start()
+
+    # --- SERVICE AND CONNECTIONS ---
+    def service(self):
+        """
+        Returns the shared service object, building it on first use.
+        """
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._creds = self._load_credentials()
+                    self._service = build(
+                        "calendar", "v3",
+                        http=self._new_http(),
+                        cache_discovery=False,
+                    )
+                    self._start_refresher()
+        return self._service
+
+    def _new_http(self):
+        return AuthorizedHttp(self._creds, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._new_http()
+            self._local.http = http
+        return http
+
+    def execute(self, name, request):
+        """
+        Executes a prepared API request on this thread's pooled connection and records its latency.
+        """
+        start = time.perf_counter()
+        try:
+            with tracing.span("calendar", name):
+                return request.execute(http=self._http())
+        finally:
+            self._stats.record(name, time.perf_counter() - start)
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self):
+        """
+        Returns per-call latency figures for the API calls made through this client.
+        """
+        return self._stats.snapshot()
@@ -3,137 +3,199 @@ import os.path
 import json
 import pytz  # <-- NEW: Import pytz library
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+import availability
+import engineers
+from calendar_client import CalendarClient
+from emergency_watcher import EmergencyWatcher, all_engineers_blocked, block_intervals
+from freebusy_cache import FreeBusyCache
+
 # --- GET ABSOLUTE PATHS ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CREDENTIALS_PATH = os.path.join(BASE_DIR, 'credentials.json')
 TOKEN_PATH = os.path.join(BASE_DIR, 'token.json')
+CONFIG_PATH = os.path.join(BASE_DIR, 'config.json')
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
 # Load configuration from config.json
-with open('config.json', 'r') as f:
+with open(CONFIG_PATH, 'r') as f:
     config = json.load(f)
 BUSINESS_HOURS_START = datetime.time.fromisoformat(config['business_hours']['start'])
 BUSINESS_HOURS_END = datetime.time.fromisoformat(config['business_hours']['end'])
 EMERGENCY_BLOCK_SUMMARY = config['emergency_info']['block_event_summary']
 
+EMERGENCY_POLL_SECONDS = 60
+EMERGENCY_HORIZON_HOURS = 6
+EMERGENCY_STALE_SECONDS = 180
+SLOT_STEP_MINUTES = 30
+MAX_AVAILABILITY_DAYS = 31
+FREEBUSY_CACHE_TTL_SECONDS = 120
+FREEBUSY_PREFETCH_DAYS = 7
+# Google accepts at most this many calendars in one freebusy query.
+FREEBUSY_MAX_ITEMS = 50
+# Google accepts at most this many calls in one batch request.
+EVENTS_BATCH_MAX = 50
+
+# The engineers whose calendars are searched and booked, and how a booking picks one of them.
+ENGINEERS = engineers.load_engineers(config)
+ASSIGNMENT_STRATEGY = config.get("assignment_strategy", "earliest")
+
+
+# --- SHARED CALENDAR CLIENT ---
+# One client per worker process. Credentials, the discovery document and HTTP connections
+# are reused across tool calls instead of being rebuilt every time.
+calendar_client = CalendarClient(TOKEN_PATH, CREDENTIALS_PATH, SCOPES)
+
 
 def get_calendar_service():
     """
-    Authenticates with the Google Calendar API and returns a service object.
-    Handles the OAuth2 flow and stores/refreshes credentials.
-    """
-    creds = None
-    if os.path.exists(TOKEN_PATH):
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
-
+    Returns the process-wide Google Calendar service object.
+    """
     try:
-        service = build("calendar", "v3", credentials=creds)
-        return service
+        return calendar_client.service()
     except HttpError as error:
         print(f"An error occurred: {error}")
         return None
 
-def find_available_slots(start_date_str, duration_minutes=60):
+def query_busy_intervals(calendar_ids, time_min, time_max):
     """
-    Finds available 1-hour slots within business hours for a given day,
-    using the Europe/London timezone consistently.
+    Runs one freebusy query for all the given calendars (in batches of FREEBUSY_MAX_ITEMS)
+    and returns {calendar_id: busy intervals}.
     """
     service = get_calendar_service()
     if not service:
-        return ["Error connecting to calendar."]
-
-    # --- START OF FIX ---
-    # 1. Define the correct, non-changing timezone
-    london_tz = pytz.timezone("Europe/London")
+        raise ConnectionError("Error connecting to calendar.")
 
-    # 2. Create a "naive" datetime object at midnight
-    naive_day_start = datetime.datetime.fromisoformat(f"{start_date_str}T00:00:00")
-    
-    # 3. Make the datetime "aware" by localizing it to the London timezone
-    day_start = london_tz.localize(naive_day_start)
-    day_end = day_start + datetime.timedelta(days=1)
-    # --- END OF FIX ---
-
-    try:
-        free_busy_response = (
-            service.freebusy()
-            .query(
+    busy = {}
+    for i in range(0, len(calendar_ids), FREEBUSY_MAX_ITEMS):
+        batch = calendar_ids[i:i + FREEBUSY_MAX_ITEMS]
+        free_busy_response = calendar_client.execute(
+            "freebusy.query",
+            service.freebusy().query(
                 body={
-                    # --- FIX: Use timezone-aware isoformat strings and specify London timezone
-                    "timeMin": day_start.isoformat(),
-                    "timeMax": day_end.isoformat(),
-                    "timeZone": "Europe/London", 
-                    "items": [{"id": "primary"}],
+                    "timeMin": time_min.isoformat(),
+                    "timeMax": time_max.isoformat(),
+                    "timeZone": "Europe/London",
+                    "items": [{"id": calendar_id} for calendar_id in batch],
                 }
-            )
-            .execute()
+            ),
         )
+        for calendar_id in batch:
+            result = free_busy_response["calendars"].get(calendar_id, {})
+            if result.get("errors"):
+                # A calendar we can't read must not look free: treat the whole window as busy.
+                print(f"Could not read calendar {calendar_id}: {result['errors']}")
+                busy[calendar_id] = [{"start": time_min.isoformat(), "end": time_max.isoformat()}]
+            else:
+                busy[calendar_id] = result.get("busy", [])
+    return busy
+
+# --- FREE/BUSY CACHE ---
+# Busy intervals are cached per day (in Redis when REDIS_URL is set) and fetched a week at a time.
+freebusy_cache = FreeBusyCache(
+    query_busy_intervals,
+    pytz.timezone("Europe/London"),
+    ttl_seconds=FREEBUSY_CACHE_TTL_SECONDS,
+    prefetch_days=FREEBUSY_PREFETCH_DAYS,
+)
+
+def get_call_stats():
+    """
+    Returns per-call latency stats for the Google Calendar API calls made by this process.
+    """
+    return calendar_client.stats()
+
+def get_engineer_busy(start_date, days=1):
+    """
+    Returns {Engineer: merged busy (start, end) timestamps} for every engineer, from the
+    free/busy cache or a single freebusy query for all of them.
+    """
+    try:
+        busy_by_calendar = freebusy_cache.get_busy_many([e.calendar_id for e in ENGINEERS], start_date, days)
     except HttpError as error:
         print(f"An error occurred checking free/busy times: {error}")
-        return [f"Could not check calendar availability. Error: {error}"]
+        raise ConnectionError(f"Could not check calendar availability. Error: {error}")
+    return {e: availability.parse_busy_intervals(busy_by_calendar[e.calendar_id]) for e in ENGINEERS}
 
-    busy_intervals = free_busy_response["calendars"]["primary"]["busy"]
-    available_slots = []
-    
-    # --- FIX: Ensure potential slots are also created in the London timezone
-    potential_slot_start = day_start.replace(
-        hour=BUSINESS_HOURS_START.hour, 
-        minute=BUSINESS_HOURS_START.minute, 
-        second=0, 
-        microsecond=0
-    )
-    
-    business_day_end = day_start.replace(
-        hour=BUSINESS_HOURS_END.hour, 
-        minute=BUSINESS_HOURS_END.minute,
-        second=0,
-        microsecond=0
-    )
+def find_engineer_slots(start_date_str, duration_minutes=60, end_date_str=None, limit=None):
+    """
+    Finds the slots within business hours from start_date_str to end_date_str (inclusive,
+    defaulting to the same day) when at least one engineer is free, using the Europe/London
+    timezone consistently. Returns up to `limit` (slot start, [free engineers]) pairs, earliest first.
+    """
+    service = get_calendar_service()
+    if not service:
+        raise ConnectionError("Error connecting to calendar.")
 
-    while potential_slot_start < business_day_end:
-        potential_slot_end = potential_slot_start + datetime.timedelta(minutes=duration_minutes)
-        
-        if potential_slot_end > business_day_end:
-            break
+    london_tz = pytz.timezone("Europe/London")
+    start_date = datetime.date.fromisoformat(start_date_str)
+    end_date = datetime.date.fromisoformat(end_date_str) if end_date_str else start_date
+    days = (end_date - start_date).days + 1
+    if days < 1:
+        return []
+    if days > MAX_AVAILABILITY_DAYS:
+        raise ValueError(f"Availability can only be searched {MAX_AVAILABILITY_DAYS} days at a time.")
 
-        is_free = True
-        for busy_period in busy_intervals:
-            # Google API returns timezone-aware ISO strings, fromisoformat handles them correctly
-            busy_start = datetime.datetime.fromisoformat(busy_period["start"])
-            busy_end = datetime.datetime.fromisoformat(busy_period["end"])
-            
-            # All comparisons are now between timezone-aware datetimes
-            if potential_slot_start < busy_end and potential_slot_end > busy_start:
-                is_free = False
-                break
-        
-        if is_free:
-            available_slots.append(potential_slot_start.isoformat())
+    # Never offer a slot that has already started.
+    now = datetime.datetime.now(london_tz)
+    slots_by_engineer = {
+        engineer: availability.find_free_slots(
+            busy,
+            london_tz,
+            start_date,
+            end_date,
+            BUSINESS_HOURS_START,
+            BUSINESS_HOURS_END,
+            duration_minutes=duration_minutes,
+            step_minutes=SLOT_STEP_MINUTES,
+            # The first `limit` combined slots are always among each engineer's first `limit`.
+            limit=limit,
+            not_before=now,
+        )
+        for engineer, busy in get_engineer_busy(start_date, days).items()
+    }
+    slots = engineers.merge_slots(slots_by_engineer)
+    return slots[:limit] if limit else slots
 
-        potential_slot_start += datetime.timedelta(minutes=30) 
+def find_available_slots(start_date_str, duration_minutes=60, end_date_str=None, limit=None):
+    """
+    Finds available slots (at least one engineer free) within business hours from start_date_str
+    to end_date_str (inclusive, defaulting to the same day).
+    Returns up to `limit` slot start times as ISO strings, earliest first.
+    """
+    slots = find_engineer_slots(start_date_str, duration_minutes, end_date_str, limit)
+    return [slot.isoformat() for slot, _ in slots]
+
+def assign_engineer(start_time_str, end_time_str, strategy=None, distance_to=None):
+    """
+    Returns the engineer to book for [start, end), chosen by `strategy` (ASSIGNMENT_STRATEGY by
+    default) among those free for the whole job, or None if nobody is free then.
+    `distance_to(engineer)` gives the miles to the customer, for the "nearest" strategy.
+    """
+    london_tz = pytz.timezone("Europe/London")
+    start = _localized(start_time_str, london_tz)
+    end = _localized(end_time_str, london_tz)
+    first_day = start.astimezone(london_tz).date()
+    last_day = (end - datetime.timedelta(microseconds=1)).astimezone(london_tz).date()
+    busy_by_engineer = get_engineer_busy(first_day, (last_day - first_day).days + 1)
 
-    return available_slots
+    candidates = []
+    booked_minutes = {}
+    for engineer, busy in busy_by_engineer.items():
+        if any(b_start < end.timestamp() and b_end > start.timestamp() for b_start, b_end in busy):
+            continue
+        candidates.append(engineer)
+        booked_minutes[engineer] = sum(b_end - b_start for b_start, b_end in busy) / 60
+    return engineers.choose_engineer(candidates, strategy or ASSIGNMENT_STRATEGY, booked_minutes, distance_to)
 
-def create_appointment(summary, description, start_time_str, end_time_str, customer_name, customer_phone):
+def create_appointment(summary, description, start_time_str, end_time_str, customer_name, customer_phone, engineer=None):
     """
-    Creates a new event on the primary Google Calendar.
+    Creates a new event on the given engineer's Google Calendar (the first engineer's by default).
     """
+    engineer = engineer or ENGINEERS[0]
     service = get_calendar_service()
     if not service:
         return "Error: Could not connect to Google Calendar."
@@ -152,39 +214,116 @@ def create_appointment(summary, description, start_time_str, end_time_str, custo
     }
     
     try:
-        created_event = service.events().insert(calendarId="primary", body=event).execute()
-        return f"Booking confirmed! I've added the appointment to the calendar for you. Event ID: {created_event.get('id')}"
+        created_event = calendar_client.execute(
+            "events.insert",
+            service.events().insert(calendarId=engineer.calendar_id, body=event),
+        )
+        _record_booking_in_cache(engineer.calendar_id, start_time_str, end_time_str)
+        confirmation = "Booking confirmed! I've added the appointment to the calendar for you."
+        if len(ENGINEERS) > 1:
+            confirmation += f" {engineer.name} will be attending."
+        return f"{confirmation} Event ID: {created_event.get('id')}"
     except HttpError as error:
         print(f"An error occurred creating the event: {error}")
         return "Sorry, I was unable to create the appointment. Please try again."
 
-def check_for_emergency_blocks(hours_to_check=3):
+def _record_booking_in_cache(calendar_id, start_time_str, end_time_str):
+    """
+    Patches the cached free/busy data straight away so a just-booked slot is never offered again.
     """
-    Checks if there are any events with the emergency block summary in the next few hours.
+    london_tz = pytz.timezone("Europe/London")
+    start = _localized(start_time_str, london_tz)
+    end = _localized(end_time_str, london_tz)
+    try:
+        freebusy_cache.add_busy(calendar_id, start, end)
+    except Exception as e:
+        # The event exists, so fall back to dropping the cached day rather than failing the booking.
+        print(f"Could not update the free/busy cache, invalidating instead: {e}")
+        try:
+            freebusy_cache.invalidate(calendar_id, start.astimezone(london_tz).date())
+        except Exception as e:
+            print(f"Could not invalidate the free/busy cache: {e}")
+
+def _localized(value, tz):
+    moment = datetime.datetime.fromisoformat(value)
+    return tz.localize(moment) if moment.tzinfo is None else moment
+
+def list_emergency_blocks(time_min, time_max):
+    """
+    Returns the emergency block events overlapping [time_min, time_max) on each engineer's calendar,
+    as {calendar_id: [{"start", "end"} ISO strings]}. The searches go out in batch requests of
+    EVENTS_BATCH_MAX calendars. Raises on connection errors so callers can decide how to fail.
     """
     service = get_calendar_service()
     if not service:
-        return True
+        raise ConnectionError("Error connecting to calendar.")
 
-    now = datetime.datetime.utcnow()
-    time_max = now + datetime.timedelta(hours=hours_to_check)
+    calendar_ids = [engineer.calendar_id for engineer in ENGINEERS]
+    blocks = {}
 
-    try:
-        events_result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=now.isoformat() + "Z", # Use UTC for this check
-                timeMax=time_max.isoformat() + "Z", # Use UTC for this check
-                q=EMERGENCY_BLOCK_SUMMARY,
-                singleEvents=True,
-                orderBy="startTime",
+    def collect(calendar_id, response, exception):
+        if exception is not None:
+            # A calendar we can't read must not look free: treat the whole window as blocked.
+            print(f"Could not read calendar {calendar_id}: {exception}")
+            blocks[calendar_id] = [{"start": time_min.isoformat(), "end": time_max.isoformat()}]
+            return
+        blocks[calendar_id] = [
+            {"start": _event_time(event["start"]), "end": _event_time(event["end"])}
+            for event in response.get("items", [])
+        ]
+
+    for i in range(0, len(calendar_ids), EVENTS_BATCH_MAX):
+        batch = service.new_batch_http_request(callback=collect)
+        for calendar_id in calendar_ids[i:i + EVENTS_BATCH_MAX]:
+            batch.add(
+                service.events().list(
+                    calendarId=calendar_id,
+                    timeMin=time_min.isoformat(),
+                    timeMax=time_max.isoformat(),
+                    q=EMERGENCY_BLOCK_SUMMARY,
+                    singleEvents=True,
+                    orderBy="startTime",
+                ),
+                request_id=calendar_id,
             )
-            .execute()
-        )
-        events = events_result.get("items", [])
-        return len(events) > 0
-    
-    except HttpError as error:
+        calendar_client.execute("events.list", batch)
+    return blocks
+
+def _event_time(value):
+    # Timed events have a dateTime; all-day events only have a date.
+    if "dateTime" in value:
+        return value["dateTime"]
+    london_tz = pytz.timezone("Europe/London")
+    return london_tz.localize(datetime.datetime.fromisoformat(value["date"])).isoformat()
+
+# --- EMERGENCY WATCHER ---
+# Keeps a warm snapshot of upcoming emergency blocks; started by the app.
+emergency_watcher = EmergencyWatcher(
+    list_emergency_blocks,
+    poll_seconds=EMERGENCY_POLL_SECONDS,
+    horizon_hours=EMERGENCY_HORIZON_HOURS,
+    stale_seconds=EMERGENCY_STALE_SECONDS,
+)
+
+def check_for_emergency_blocks(hours_to_check=3):
+    """
+    Checks whether every engineer has an emergency block in the next few hours; while any one
+    of them is free, emergency capacity is available.
+    Answers from the watcher's snapshot, and only queries the calendar live when it is stale.
+    """
+    blocked = emergency_watcher.is_blocked(hours_to_check)
+    if blocked is not None:
+        return blocked
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    time_max = now + datetime.timedelta(hours=hours_to_check)
+    try:
+        blocks = list_emergency_blocks(now, time_max)
+    except (HttpError, ConnectionError) as error:
         print(f"An error occurred checking for emergency blocks: {error}")
-        return True
\ No newline at end of file
+        return True
+    return all_engineers_blocked(
+        {calendar_id: block_intervals(found) for calendar_id, found in blocks.items()},
+        now.timestamp(),
+        time_max.timestamp(),
+    )
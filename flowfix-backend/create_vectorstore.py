@@ -1,55 +1,147 @@
 import os
+import glob
 from dotenv import load_dotenv
 
 # LangChain components
 from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.vectorstores import FAISS
 
-print("Starting vector store creation process...")
-
-# --- PROXY CONFIGURATION FOR PYTHONANYWHERE ---
-# Required to make the API call from a PythonAnywhere console
-proxy_url = 'http://proxy.server:3128'
-os.environ['HTTP_PROXY'] = proxy_url
-os.environ['HTTPS_PROXY'] = proxy_url
-
-# --- Load API Key ---
-load_dotenv()
-if not os.getenv("GOOGLE_API_KEY"):
-    raise ValueError("GOOGLE_API_KEY not found in .env file")
+import embedding_backends
+import index_builds
 
 # --- Define Paths ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 KNOWLEDGE_BASE_PATH = os.path.join(BASE_DIR, 'knowledge_base.md')
+# Extra documents: any .md files in this folder are indexed alongside knowledge_base.md
+KNOWLEDGE_BASE_DIR = os.path.join(BASE_DIR, 'knowledge_base')
 FAISS_INDEX_PATH = os.path.join(BASE_DIR, "faiss_index")
+EMBEDDING_CACHE_PATH = os.path.join(BASE_DIR, "embedding_cache.sqlite")
+
+EMBED_BATCH_SIZE = 100
 
-try:
-    # 1. Initialize the embeddings model
-    print("Initializing Google Generative AI Embeddings...")
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    
-    # 2. Load the knowledge base document
-    print(f"Loading knowledge base from: {KNOWLEDGE_BASE_PATH}")
-    loader = TextLoader(KNOWLEDGE_BASE_PATH)
-    documents = loader.load()
-    
-    # 3. Split the document into chunks
-    print("Splitting documents into chunks...")
+
+def load_chunks():
+    """
+    Loads and splits every knowledge base document, returning {chunk_hash: Document}.
+    """
+    paths = [KNOWLEDGE_BASE_PATH] + sorted(glob.glob(os.path.join(KNOWLEDGE_BASE_DIR, "**", "*.md"), recursive=True))
     text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    docs = text_splitter.split_documents(documents)
-    print(f"Created {len(docs)} document chunks.")
-    
-    # 4. Create embeddings and the FAISS vector store
-    print("Creating FAISS vector store from documents (this may take a moment)...")
-    vector_store = FAISS.from_documents(docs, embeddings)
-    
-    # 5. Save the vector store locally
-    print(f"Saving FAISS index to: {FAISS_INDEX_PATH}")
-    vector_store.save_local(FAISS_INDEX_PATH)
-    
-    print("\nSUCCESS: The FAISS vector store has been created and saved successfully.")
-    
-except Exception as e:
-    print(f"\nERROR: An error occurred during the process: {e}")
\ No newline at end of file
+
+    chunks = {}
+    for path in paths:
+        print(f"Loading knowledge base from: {path}")
+        documents = TextLoader(path).load()
+        for doc in text_splitter.split_documents(documents):
+            source = os.path.relpath(path, BASE_DIR)
+            doc.metadata["source"] = source
+            # Identical chunks (e.g. repeated boilerplate) collapse to one entry.
+            chunks[index_builds.chunk_hash(source, doc.page_content)] = doc
+    return chunks
+
+
+def embed_chunks(embeddings, cache, chunks, model_id):
+    """
+    Returns {chunk_hash: vector}, reusing cached vectors and embedding the rest in batches.
+    """
+    hashes = list(chunks)
+    vectors = cache.get_many(model_id, hashes)
+    missing = [h for h in hashes if h not in vectors]
+    print(f"{len(vectors)} embeddings reused from cache, {len(missing)} to embed.")
+
+    for i in range(0, len(missing), EMBED_BATCH_SIZE):
+        batch = missing[i:i + EMBED_BATCH_SIZE]
+        batch_vectors = embeddings.embed_documents([chunks[h].page_content for h in batch])
+        new_vectors = dict(zip(batch, batch_vectors))
+        cache.put_many(model_id, new_vectors)
+        vectors.update(new_vectors)
+        print(f"Embedded {min(i + EMBED_BATCH_SIZE, len(missing))}/{len(missing)} new chunks.")
+    return vectors
+
+
+def main():
+    print("Starting vector store creation process...")
+
+    # --- PROXY CONFIGURATION FOR PYTHONANYWHERE ---
+    # Required to make the API call from a PythonAnywhere console
+    proxy_url = 'http://proxy.server:3128'
+    os.environ['HTTP_PROXY'] = proxy_url
+    os.environ['HTTPS_PROXY'] = proxy_url
+
+    # --- Load API Key ---
+    load_dotenv()
+    # Only the Gemini backend needs an API key; fastembed runs locally.
+    if embedding_backends.configured()[0] == "google" and not os.getenv("GOOGLE_API_KEY"):
+        raise ValueError("GOOGLE_API_KEY not found in .env file")
+
+    try:
+        # 1. Initialize the embeddings model and the persistent embedding cache
+        backend, model = embedding_backends.configured()
+        model_id = embedding_backends.model_id(backend, model)
+        print(f"Initializing {backend} embeddings ({model})...")
+        embeddings = embedding_backends.create(backend, model)
+        cache = index_builds.EmbeddingCache(EMBEDDING_CACHE_PATH)
+
+        # 2. Load and split the knowledge base documents into content-hashed chunks
+        chunks = load_chunks()
+        print(f"Created {len(chunks)} document chunks.")
+        if not chunks:
+            # An empty index would answer every question with nothing: keep the live build instead.
+            print("\nERROR: The knowledge base documents are empty, so there is nothing to index. "
+                  "The live FAISS build has been left in place.")
+            return
+
+        # 3. Compare against the manifest of the live build
+        previous_dir = index_builds.current_build_dir(FAISS_INDEX_PATH)
+        previous = index_builds.load_manifest(previous_dir)
+        incremental = bool(previous) and previous.get("model") == model_id
+        previous_hashes = set(previous["chunks"]) if incremental else set()
+
+        added = [h for h in chunks if h not in previous_hashes]
+        removed = [h for h in previous_hashes if h not in chunks]
+        print(f"{len(added)} chunks added or changed, {len(removed)} removed.")
+
+        if incremental and not added and not removed:
+            print("\nSUCCESS: The FAISS vector store is already up to date.")
+        else:
+            # 4. Embed only the new or changed chunks
+            vectors = embed_chunks(embeddings, cache, {h: chunks[h] for h in added}, model_id)
+
+            # 5. Update the previous index in place, or build from scratch
+            if incremental:
+                print(f"Updating FAISS index from build: {previous_dir}")
+                vector_store = FAISS.load_local(previous_dir, embeddings, allow_dangerous_deserialization=True)
+                if removed:
+                    vector_store.delete(removed)
+            else:
+                print("Creating FAISS vector store from scratch...")
+                vector_store = None
+
+            if added:
+                text_embeddings = [(chunks[h].page_content, vectors[h]) for h in added]
+                metadatas = [chunks[h].metadata for h in added]
+                if vector_store is None:
+                    vector_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=added)
+                else:
+                    vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=added)
+
+            # 6. Save as a new build and swap it in atomically; a running app.py picks it up
+            build_id, build_dir = index_builds.new_build_dir(FAISS_INDEX_PATH)
+            print(f"Saving FAISS index to: {build_dir}")
+            vector_store.save_local(build_dir)
+            index_builds.save_manifest(build_dir, {
+                "build_id": build_id,
+                "model": model_id,
+                "chunks": {h: {"source": doc.metadata["source"]} for h, doc in chunks.items()},
+            })
+            index_builds.publish_build(FAISS_INDEX_PATH, build_id)
+            index_builds.prune_builds(FAISS_INDEX_PATH)
+
+            print(f"\nSUCCESS: FAISS build {build_id} has been created and is now live.")
+
+    except Exception as e:
+        print(f"\nERROR: An error occurred during the process: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+# --- EMBEDDING BACKENDS ---
+# The model that embeds the knowledge base chunks (create_vectorstore.py) and the questions
+# asked about them (the app). Both sides read EMBEDDING_BACKEND / EMBEDDING_MODEL, so they agree.
+#   google     - Gemini embeddings API: one network round trip per question.
+#   fastembed  - a small ONNX model run on the CPU in-process (pip install -r requirements-fastembed.txt).
+#                The model is downloaded once and cached; FASTEMBED_CACHE_DIR sets where.
+BACKENDS = {
+    "google": "models/embedding-001",
+    "fastembed": "BAAI/bge-small-en-v1.5",
+}
+DEFAULT_BACKEND = "google"
+
+
+def configured():
+    """
+    Returns (backend, model) from the environment.
+    """
+    backend = os.getenv("EMBEDDING_BACKEND", DEFAULT_BACKEND).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}', expected one of {', '.join(BACKENDS)}.")
+    return backend, os.getenv("EMBEDDING_MODEL") or BACKENDS[backend]
+
+
+def model_id(backend, model):
+    """
+    The name recorded in build manifests and the embedding cache. Gemini models keep their bare
+    name, so builds and cached vectors made before the backend was configurable stay valid.
+    """
+    return model if backend == "google" else f"{backend}:{model}"
+
+
+def create(backend, model):
+    """
+    Creates the embeddings client for a backend. Imports its dependencies on demand.
+    """
+    if backend == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(model=model)
+    if backend == "fastembed":
+        from langchain_community.embeddings import FastEmbedEmbeddings
+        return FastEmbedEmbeddings(model_name=model, cache_dir=os.getenv("FASTEMBED_CACHE_DIR"))
+    raise ValueError(f"Unknown embedding backend '{backend}'.")
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Creates the real client on the first embed call, so the FAISS index can be loaded in a
+    preforking master without opening a gRPC channel (or an ONNX runtime session) that the
+    child processes would inherit.
+    """
+
+    def __init__(self, backend, model):
+        self.backend = backend
+        self.model = model
+        self.model_id = model_id(backend, model)
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _embeddings(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = create(self.backend, self.model)
+        return self._client
+
+    def embed_documents(self, texts):
+        return self._embeddings().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._embeddings().embed_query(text)
@@ -0,0 +1,135 @@
+import datetime
+import json
+import threading
+import time
+import uuid
+
+import redis_clients
+
+SNAPSHOT_KEY = "emergency:snapshot"
+LOCK_KEY = "emergency:watcher-lock"
+
+
+def block_intervals(blocks):
+    """
+    Converts [{"start": iso, "end": iso}, ...] into [[start_ts, end_ts], ...].
+    """
+    return [
+        [datetime.datetime.fromisoformat(b["start"]).timestamp(), datetime.datetime.fromisoformat(b["end"]).timestamp()]
+        for b in blocks
+    ]
+
+
+def all_engineers_blocked(intervals_by_calendar, window_start, window_end):
+    """
+    True when every calendar in {calendar_id: [[start_ts, end_ts], ...]} has an emergency block
+    overlapping the window. One free engineer is enough to take an emergency call-out.
+    """
+    return bool(intervals_by_calendar) and all(
+        any(start < window_end and end > window_start for start, end in intervals)
+        for intervals in intervals_by_calendar.values()
+    )
+
+
+class EmergencyWatcher:
+    """
+    Keeps the "EMERGENCY BLOCK" state for the next few hours warm, so an emergency question
+    is answered from a snapshot instead of a live Calendar search.
+
+    A daemon thread polls the engineers' calendars every `poll_seconds` and stores each one's
+    blocks found in the next `horizon_hours` (in Redis when REDIS_URL is set, so all workers
+    share one snapshot). Emergency capacity is gone only while every engineer is blocked.
+    With Redis, a short lock makes sure only one worker polls per interval.
+    """
+
+    def __init__(self, fetch_blocks, poll_seconds=60, horizon_hours=6, stale_seconds=180, redis_url=None):
+        # fetch_blocks(time_min, time_max) -> {calendar_id: [{"start": iso, "end": iso}, ...]} for emergency blocks
+        self.fetch_blocks = fetch_blocks
+        self.poll_seconds = poll_seconds
+        self.horizon_hours = horizon_hours
+        self.stale_seconds = stale_seconds
+        self.redis_url = redis_url
+
+        self._snapshot = None
+        self._token = uuid.uuid4().hex
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _redis(self):
+        return redis_clients.get_client(self.redis_url)
+
+    # --- POLLING ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="emergency-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._should_poll():
+                    self.poll()
+            except Exception as e:
+                print(f"Emergency watcher poll failed: {e}")
+            self._stop.wait(self.poll_seconds)
+
+    def _should_poll(self):
+        client = self._redis()
+        if client is None:
+            return True
+        # Whoever takes the lock polls for this interval; the others just read the snapshot.
+        return bool(client.set(LOCK_KEY, self._token, nx=True, ex=max(1, self.poll_seconds - 1)))
+
+    def poll(self):
+        """
+        Fetches the emergency blocks for the watch horizon and publishes a fresh snapshot.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        horizon_end = now + datetime.timedelta(hours=self.horizon_hours)
+        blocks = self.fetch_blocks(now, horizon_end)
+        snapshot = {
+            "checked_at": now.timestamp(),
+            "horizon_end": horizon_end.timestamp(),
+            "blocks": {calendar_id: block_intervals(found) for calendar_id, found in blocks.items()},
+        }
+        client = self._redis()
+        if client is not None:
+            client.set(SNAPSHOT_KEY, json.dumps(snapshot), ex=self.stale_seconds)
+        else:
+            self._snapshot = snapshot
+        return snapshot
+
+    # --- READING ---
+    def snapshot(self):
+        client = self._redis()
+        if client is None:
+            return self._snapshot
+        raw = client.get(SNAPSHOT_KEY)
+        return json.loads(raw) if raw else None
+
+    def is_blocked(self, hours_to_check):
+        """
+        Returns True/False from the snapshot, or None if the snapshot is missing, stale,
+        or doesn't cover the requested window (the caller should then query live).
+        """
+        try:
+            snapshot = self.snapshot()
+        except Exception as e:
+            print(f"Could not read the emergency snapshot: {e}")
+            return None
+        if not snapshot:
+            return None
+
+        now = time.time()
+        window_end = now + hours_to_check * 3600
+        if now - snapshot["checked_at"] > self.stale_seconds or window_end > snapshot["horizon_end"]:
+            return None
+        if not isinstance(snapshot["blocks"], dict):
+            # A snapshot written before blocks were kept per engineer: query live instead.
+            return None
+        return all_engineers_blocked(snapshot["blocks"], now, window_end)
@@ -0,0 +1,65 @@
+from typing import NamedTuple, Optional
+
+# How a booking is given to one of the engineers free at the requested time:
+#   earliest      - the first free engineer in config order (the order doubles as a priority list)
+#   least_loaded  - the engineer with the fewest booked minutes that day
+#   nearest       - the engineer based closest to the customer's postcode
+STRATEGIES = ("earliest", "least_loaded", "nearest")
+
+
+class Engineer(NamedTuple):
+    name: str
+    calendar_id: str
+    base_postcode: Optional[str] = None
+
+
+def load_engineers(config):
+    """
+    Reads the "engineers" list from config.json. Without one, the business has a single
+    engineer working from the primary calendar.
+    """
+    engineers = [
+        Engineer(e["name"], e["calendar_id"], e.get("base_postcode"))
+        for e in config.get("engineers", [])
+    ]
+    return engineers or [Engineer(config["business_name"], "primary", config.get("base_postcode"))]
+
+
+def merge_slots(slots_by_engineer):
+    """
+    Combines per-engineer free slots, {Engineer: [slot start, ...]} each in time order, into one
+    time-ordered list of (slot start, [engineers free then]). Engineers keep their given order.
+    """
+    free_at = {}
+    for engineer, slots in slots_by_engineer.items():
+        for slot in slots:
+            free_at.setdefault(slot, []).append(engineer)
+    return sorted(free_at.items(), key=lambda item: item[0])
+
+
+def choose_engineer(candidates, strategy="earliest", booked_minutes=None, distance_to=None):
+    """
+    Picks one of `candidates` (engineers free for the whole job, in config order).
+
+    `booked_minutes` maps engineer -> minutes already booked that day (for least_loaded), and
+    `distance_to(engineer)` returns miles to the customer or None (for nearest). Ties, and
+    engineers whose distance is unknown, fall back to the least loaded and then to config order.
+    """
+    if not candidates:
+        return None
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown assignment strategy '{strategy}', expected one of {', '.join(STRATEGIES)}.")
+    if strategy == "earliest":
+        return candidates[0]
+
+    load = booked_minutes or {}
+    order = {engineer: i for i, engineer in enumerate(candidates)}
+
+    def key(engineer):
+        by_load = (load.get(engineer, 0), order[engineer])
+        if strategy == "nearest":
+            miles = distance_to(engineer) if distance_to else None
+            return (miles is None, miles or 0) + by_load
+        return by_load
+
+    return min(candidates, key=key)
@@ -0,0 +1,323 @@
+import datetime
+import json
+import threading
+import time
+
+import redis_clients
+
+# A marker stored as the first element of every cached day, so a day with no busy
+# periods can still be told apart from a day that has never been fetched.
+FETCHED_MARKER = ""
+KEY_PREFIX = "freebusy"
+BOOKINGS_KEY_PREFIX = "freebusy_bookings"
+
+# Bookings kept per calendar to re-apply on read (see FreeBusyCache); far more than are made in a TTL.
+MAX_RECENT_BOOKINGS = 100
+
+
+class _MemoryBackend:
+    """
+    In-process store used when no Redis server is configured.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days = {}
+        self._bookings = {}
+
+    def get_many(self, keys, booking_keys=()):
+        now = time.monotonic()
+        with self._lock:
+            result = []
+            for key in keys:
+                entry = self._days.get(key)
+                if entry and entry[0] > now:
+                    result.append(list(entry[1]))
+                else:
+                    result.append(None)
+            bookings = []
+            for key in booking_keys:
+                entry = self._bookings.get(key)
+                bookings.append(list(entry[1]) if entry and entry[0] > now else [])
+            return result, bookings
+
+    def set_many(self, items, ttl):
+        expires = time.monotonic() + ttl
+        with self._lock:
+            for key, intervals in items.items():
+                self._days[key] = (expires, list(intervals))
+
+    def add_booking(self, booking_key, day_keys, interval, keep_seconds):
+        now = time.monotonic()
+        with self._lock:
+            for key in day_keys:
+                entry = self._days.get(key)
+                if entry and entry[0] > now:
+                    entry[1].append(interval)
+            entry = self._bookings.get(booking_key)
+            recent = entry[1] if entry and entry[0] > now else []
+            self._bookings[booking_key] = (now + keep_seconds, (recent + [interval])[-MAX_RECENT_BOOKINGS:])
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._days.pop(key, None)
+
+
+class _RedisBackend:
+    """
+    Shared store so every worker process sees the same cached availability.
+    Each day is a Redis list: the fetched marker followed by one JSON busy interval per entry.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def get_many(self, keys, booking_keys=()):
+        pipe = self._client.pipeline(transaction=False)
+        for key in list(keys) + list(booking_keys):
+            pipe.lrange(key, 0, -1)
+        values = pipe.execute()
+        result = []
+        for day in values[:len(keys)]:
+            if not day:
+                result.append(None)
+            else:
+                result.append([json.loads(v) for v in day[1:]])
+        return result, [[json.loads(v) for v in bookings] for bookings in values[len(keys):]]
+
+    def set_many(self, items, ttl):
+        pipe = self._client.pipeline(transaction=True)
+        for key, intervals in items.items():
+            pipe.delete(key)
+            pipe.rpush(key, FETCHED_MARKER, *[json.dumps(i) for i in intervals])
+            pipe.expire(key, ttl)
+        pipe.execute()
+
+    def add_booking(self, booking_key, day_keys, interval, keep_seconds):
+        value = json.dumps(interval)
+        pipe = self._client.pipeline(transaction=False)
+        # RPUSHX only appends when the day is already cached, so a booking can never
+        # create a partial entry that hides the rest of that day's busy periods.
+        for key in day_keys:
+            pipe.rpushx(key, value)
+        pipe.rpush(booking_key, value)
+        pipe.ltrim(booking_key, -MAX_RECENT_BOOKINGS, -1)
+        pipe.expire(booking_key, keep_seconds)
+        pipe.execute()
+
+    def delete(self, keys):
+        if keys:
+            self._client.delete(*keys)
+
+
+class FreeBusyCache:
+    """
+    Caches busy intervals per calendar and per day.
+
+    A miss fetches a whole window of days (a week by default) in a single freebusy query,
+    so neighbouring dates in the same conversation, and other users asking about the same
+    week, are answered from the cache until the TTL expires. Several calendars (one per
+    engineer) are read from the cache in one round trip and fetched together in that same query.
+    Misses in this process within `gather_seconds` of each other (the tool calls of one agent
+    step) share one query spanning up to `max_fetch_days`, and a miss whose days a running
+    query already covers waits for it instead of querying again.
+
+    A fetch that started before a booking can store the week without it, after add_busy has
+    patched the cache. So bookings are also kept per calendar for a little longer than the TTL
+    and re-applied on every read, in the same round trip.
+    """
+
+    def __init__(self, fetch_busy, tz, ttl_seconds=120, prefetch_days=7, redis_url=None,
+                 gather_seconds=0.005, max_fetch_days=31):
+        # fetch_busy(calendar_ids, time_min, time_max) -> {calendar_id: list of {"start": iso, "end": iso}}
+        self.fetch_busy = fetch_busy
+        self.tz = tz
+        self.ttl_seconds = ttl_seconds
+        self.prefetch_days = prefetch_days
+        self.gather_seconds = gather_seconds
+        self.max_fetch_days = max_fetch_days
+        self.redis_url = redis_url
+        self._backend = redis_clients.LazyBackend(_RedisBackend, _MemoryBackend, redis_url)
+        self._inflight_lock = threading.Lock()
+        self._inflight = []  # _Fetch objects gathering or running in this process
+
+    def _get_backend(self):
+        return self._backend.get()
+
+    def _key(self, calendar_id, day):
+        return f"{KEY_PREFIX}:{calendar_id}:{day.isoformat()}"
+
+    def _bookings_key(self, calendar_id):
+        return f"{BOOKINGS_KEY_PREFIX}:{calendar_id}"
+
+    def _day_start(self, day):
+        return self.tz.localize(datetime.datetime.combine(day, datetime.time.min))
+
+    def get_busy(self, calendar_id, start_day, days=1):
+        """
+        Returns the busy intervals overlapping the given days, fetching any missing days in one query.
+        """
+        return self.get_busy_many([calendar_id], start_day, days)[calendar_id]
+
+    def get_busy_many(self, calendar_ids, start_day, days=1):
+        """
+        Returns {calendar_id: busy intervals} for the given days. Every calendar with missing days
+        is fetched in the same freebusy query, so the cost doesn't grow with the number of calendars.
+        """
+        wanted = [start_day + datetime.timedelta(days=i) for i in range(days)]
+        backend = self._get_backend()
+        keys = [self._key(calendar_id, d) for calendar_id in calendar_ids for d in wanted]
+        flat, bookings = backend.get_many(keys, [self._bookings_key(calendar_id) for calendar_id in calendar_ids])
+        cached = {calendar_id: flat[i * days:(i + 1) * days] for i, calendar_id in enumerate(calendar_ids)}
+
+        missing = {
+            calendar_id: [d for d, intervals in zip(wanted, cached[calendar_id]) if intervals is None]
+            for calendar_id in calendar_ids
+        }
+        missing = {calendar_id: missing_days for calendar_id, missing_days in missing.items() if missing_days}
+        if missing:
+            fetched = self._fetch_shared(missing)
+            for calendar_id in missing:
+                cached[calendar_id] = [fetched[calendar_id].get(d, c) for d, c in zip(wanted, cached[calendar_id])]
+
+        window_start = self._day_start(wanted[0])
+        window_end = self._day_start(wanted[-1] + datetime.timedelta(days=1))
+        busy = {}
+        for calendar_id, recent in zip(calendar_ids, bookings):
+            recent = [
+                b for b in recent
+                if datetime.datetime.fromisoformat(b["start"]) < window_end
+                and datetime.datetime.fromisoformat(b["end"]) > window_start
+            ]
+            busy[calendar_id] = _dedupe(cached[calendar_id] + [recent])
+        return busy
+
+    def _fetch_shared(self, missing):
+        """
+        Fetches the missing days, sharing the query with other misses in this process: a fetch
+        still gathering requests takes on their days, and one already sent that covers them is
+        waited for.
+        """
+        needed = {(calendar_id, d) for calendar_id, missing_days in missing.items() for d in missing_days}
+        with self._inflight_lock:
+            shared = None
+            for fetch in self._inflight:
+                if needed <= fetch.covered or (not fetch.sent and fetch.extend(missing, self.max_fetch_days)):
+                    shared = fetch
+                    break
+            if shared is None:
+                own = _Fetch(missing)
+                self._inflight.append(own)
+        if shared is not None:
+            fetched = shared.wait()
+            if fetched is not None:
+                return fetched
+            # The shared fetch failed; this request tries again on its own.
+            return self._fetch_shared(missing)
+
+        try:
+            # Tool calls of one agent step miss at nearly the same moment; let them join this query.
+            time.sleep(self.gather_seconds)
+            with self._inflight_lock:
+                own.sent = True
+                calendar_ids, first_day, last_day = list(own.calendar_ids), own.first_day, own.last_day
+                own.covered = {(c, d) for c in calendar_ids for d in self._window_days(first_day, last_day)}
+            own.result = self._fetch_window(calendar_ids, first_day, last_day)
+            return own.result
+        finally:
+            with self._inflight_lock:
+                self._inflight.remove(own)
+            own.done.set()
+
+    def _window_days(self, first_day, last_day):
+        span = max((last_day - first_day).days + 1, self.prefetch_days)
+        return [first_day + datetime.timedelta(days=i) for i in range(span)]
+
+    def _fetch_window(self, calendar_ids, first_day, last_day):
+        days = self._window_days(first_day, last_day)
+        window_start = self._day_start(days[0])
+        window_end = self._day_start(days[-1] + datetime.timedelta(days=1))
+        day_bounds = [
+            (day, self._day_start(day), self._day_start(day + datetime.timedelta(days=1))) for day in days
+        ]
+
+        busy_by_calendar = self.fetch_busy(calendar_ids, window_start, window_end)
+        by_calendar = {}
+        items = {}
+        for calendar_id in calendar_ids:
+            parsed = [
+                (datetime.datetime.fromisoformat(b["start"]), datetime.datetime.fromisoformat(b["end"]), b)
+                for b in busy_by_calendar.get(calendar_id, [])
+            ]
+            by_day = {}
+            for day, day_start, day_end in day_bounds:
+                by_day[day] = [b for start, end, b in parsed if start < day_end and end > day_start]
+                items[self._key(calendar_id, day)] = by_day[day]
+            by_calendar[calendar_id] = by_day
+
+        self._get_backend().set_many(items, self.ttl_seconds)
+        return by_calendar
+
+    def add_busy(self, calendar_id, start, end):
+        """
+        Write-through for a new booking: adds the interval to every cached day it overlaps and to
+        the calendar's recent bookings. Days that are not cached are left alone and will be fetched
+        fresh when next needed.
+        """
+        interval = {"start": start.isoformat(), "end": end.isoformat()}
+        day = start.astimezone(self.tz).date()
+        last_day = (end - datetime.timedelta(microseconds=1)).astimezone(self.tz).date()
+        day_keys = []
+        while day <= last_day:
+            day_keys.append(self._key(calendar_id, day))
+            day += datetime.timedelta(days=1)
+        # Kept for two TTLs: past any window fetched before the booking and stored after it.
+        self._get_backend().add_booking(self._bookings_key(calendar_id), day_keys, interval, 2 * self.ttl_seconds)
+
+    def invalidate(self, calendar_id, day):
+        self._get_backend().delete([self._key(calendar_id, day)])
+
+
+class _Fetch:
+    """
+    A freebusy query other requests can join or wait on. `result` stays None if it failed.
+    """
+
+    def __init__(self, missing):
+        self.calendar_ids = set(missing)
+        self.first_day = min(missing_days[0] for missing_days in missing.values())
+        self.last_day = max(missing_days[-1] for missing_days in missing.values())
+        self.covered = {(c, d) for c, missing_days in missing.items() for d in missing_days}
+        self.sent = False
+        self.done = threading.Event()
+        self.result = None
+
+    def extend(self, missing, max_days):
+        """
+        Adds the missing days to this query unless that would make it span more than `max_days`.
+        """
+        first_day = min([self.first_day] + [missing_days[0] for missing_days in missing.values()])
+        last_day = max([self.last_day] + [missing_days[-1] for missing_days in missing.values()])
+        if (last_day - first_day).days + 1 > max_days:
+            return False
+        self.calendar_ids.update(missing)
+        self.first_day, self.last_day = first_day, last_day
+        return True
+
+    def wait(self):
+        self.done.wait()
+        return self.result
+
+
+def _dedupe(days):
+    busy = []
+    seen = set()
+    for intervals in days:
+        for interval in intervals:
+            # An interval spanning midnight is cached under each day it touches.
+            marker = (interval["start"], interval["end"])
+            if marker not in seen:
+                seen.add(marker)
+                busy.append(interval)
+    return busy
@@ -0,0 +1,34 @@
+import gc
+import os
+
+import runtime
+
+# --- PREFORKED WORKERS ---
+# Run with:  gunicorn app:app -c gunicorn.conf.py
+# The app is loaded once in the master, which also imports LangChain/Gemini and loads the FAISS
+# index (runtime.warm_up). Workers are forked from it and share those pages copy-on-write, so a
+# new worker is ready almost immediately and doesn't hold its own copy of the index.
+bind = "0.0.0.0:5000"
+workers = 4
+threads = runtime.WORKER_THREADS  # The agent limits in runtime.py are derived from this.
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    runtime.warm_up()
+    # Move everything loaded so far out of the GC's reach, so collections in the workers don't
+    # touch (and un-share) the preloaded objects.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Background threads and network clients are per process; they start in each worker.
+    runtime.start_background_tasks()
+
+
+def child_exit(server, worker):
+    # With PROMETHEUS_MULTIPROC_DIR set, drop the exited worker's live gauges from /metrics.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
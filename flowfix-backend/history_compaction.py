@@ -0,0 +1,134 @@
+import re
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import service_area
+from router import PHONE_NUMBER_PATTERN, mentioned_services, service_keywords
+
+# Gemini averages roughly four characters per token on English chat; close enough for a budget.
+CHARS_PER_TOKEN = 4
+
+# Details the booking flow needs, pinned in the summary so they survive compaction.
+SLOTS = ("name", "phone", "postcode", "service", "date", "time")
+
+DATE_PATTERN = re.compile(
+    r"\b(\d{4}-\d{2}-\d{2}|today|tomorrow|(?:next |this )?(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)"
+    r"|next week)\b",
+    re.IGNORECASE,
+)
+TIME_PATTERN = re.compile(r"\b(\d{1,2}(?::\d{2})?\s?(?:am|pm)|\d{1,2}:\d{2})\b", re.IGNORECASE)
+NAME_PATTERN = re.compile(r"(?i:\b(?:my name is|my name's|name is)\s+)([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+)?)")
+# Only read as a name when the customer was asked for one; otherwise "This is Urgent" would be.
+ANSWERED_NAME_PATTERN = re.compile(r"(?i:\b(?:i'm|i am|it's|it is|this is)\s+)([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+)?)")
+CAPITALISED_NAME_PATTERN = re.compile(r"^([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+){0,2})[.!]?$")
+
+# Capitalised replies to "what's your name?" that aren't names.
+NOT_NAMES = {"yes", "no", "sure", "ok", "okay", "thanks", "thank you", "hi", "hello"}
+
+
+def estimate_tokens(messages):
+    return sum(len(str(m.content)) // CHARS_PER_TOKEN + 4 for m in messages)
+
+
+class HistoryCompactor:
+    """
+    Keeps the prompt's chat history within a token budget.
+
+    The last `keep_turns` exchanges are passed on verbatim. Older messages are folded into a
+    running summary: the booking details (name, phone, postcode, service, date, time) pulled out
+    of them and pinned, plus a capped list of what the customer said, shortened. If the
+    summary and the recent turns are still over `max_tokens`, the oldest recent exchanges are
+    folded as well, down to the latest one.
+
+    compact() is pure: the caller stores the returned state and drops the folded messages.
+    """
+
+    def __init__(self, config, keep_turns=6, max_tokens=2000, summary_max_tokens=150, line_chars=100):
+        self.keep_turns = keep_turns
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.line_chars = line_chars
+        self.price_list = config["price_list"]
+        self.service_keywords = service_keywords(self.price_list)
+
+    def compact(self, messages, state):
+        """
+        Returns (messages for the prompt, new state, number of oldest messages folded).
+        `state` is {"summary": [lines], "slots": {slot: value}}, empty for a new session.
+        """
+        state = {"summary": list(state.get("summary", [])), "slots": dict(state.get("slots", {}))}
+        keep = self.keep_turns * 2
+        folded = max(0, len(messages) - keep)
+        if folded:
+            self._fold(state, messages[:folded])
+
+        recent = messages[folded:]
+        while len(recent) > 2 and estimate_tokens(self._view(state, recent)) > self.max_tokens:
+            self._fold(state, recent[:2], previous=messages[folded - 1] if folded else None)
+            recent = recent[2:]
+            folded += 2
+
+        return self._view(state, recent), state, folded
+
+    def _view(self, state, recent):
+        if not state["summary"] and not state["slots"]:
+            return list(recent)
+        return [SystemMessage(content=self.summary_text(state))] + list(recent)
+
+    def summary_text(self, state):
+        lines = ["Earlier in this conversation (older messages are summarised here). You have already introduced yourself."]
+        if state["slots"]:
+            details = "; ".join(f"{slot}: {state['slots'][slot]}" for slot in SLOTS if slot in state["slots"])
+            lines.append(f"Details the customer has given: {details}.")
+        if state["summary"]:
+            lines.append("What the customer said earlier, oldest first:")
+            lines.extend(state["summary"])
+        return "\n".join(lines)
+
+    def _fold(self, state, messages, previous=None):
+        previous = " ".join(str(previous.content).split()) if previous is not None else None
+        for message in messages:
+            text = " ".join(str(message.content).split())
+            # The assistant's side is mostly questions and replies to these; only the customer's is kept.
+            if isinstance(message, HumanMessage) and text:
+                state["slots"].update(self.extract_slots(text, previous))
+                if len(text) > self.line_chars:
+                    text = text[:self.line_chars - 3].rstrip() + "..."
+                state["summary"].append(f"- {text}")
+            previous = text
+
+        # Rolling: drop the oldest lines once the summary is over its own budget.
+        while len(state["summary"]) > 1 and sum(len(l) for l in state["summary"]) // CHARS_PER_TOKEN > self.summary_max_tokens:
+            state["summary"].pop(0)
+
+    def extract_slots(self, text, previous=None):
+        """
+        Booking details in one customer message. `previous` is the assistant message it replies
+        to, so a bare "Sam Taylor" counts as a name when the customer was asked for one.
+        """
+        slots = {}
+        asked = (previous or "").lower()
+
+        phone = PHONE_NUMBER_PATTERN.search(text)
+        if phone:
+            slots["phone"] = phone.group(0).strip()
+        postcode = service_area.find_postcode(text)
+        if postcode and postcode.inward:
+            slots["postcode"] = str(postcode)
+        date = DATE_PATTERN.search(text)
+        if date:
+            slots["date"] = date.group(1)
+        time_match = TIME_PATTERN.search(PHONE_NUMBER_PATTERN.sub(" ", text))
+        if time_match:
+            slots["time"] = time_match.group(1)
+
+        name = NAME_PATTERN.search(text)
+        if not name and "name" in asked:
+            name = ANSWERED_NAME_PATTERN.search(text) or CAPITALISED_NAME_PATTERN.match(text)
+        if name and name.group(1).lower() not in NOT_NAMES and not DATE_PATTERN.fullmatch(name.group(1)):
+            slots["name"] = name.group(1)
+
+        services = mentioned_services(text, self.service_keywords)
+        if services:
+            slots["service"] = self.price_list[services[0]]["name"]
+        return slots
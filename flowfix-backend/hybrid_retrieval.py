@@ -0,0 +1,96 @@
+import contextlib
+import contextvars
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from bm25 import BM25Index
+
+# Retrieval modes: "hybrid" fuses FAISS and BM25 rankings, "dense" and "lexical" use one of them.
+MODES = ("hybrid", "dense", "lexical")
+
+# The usual reciprocal rank fusion constant: damps the difference between the top few ranks.
+RRF_K = 60
+
+
+_query_embedding = contextvars.ContextVar("flowfix_query_embedding", default=None)
+
+
+@contextlib.contextmanager
+def query_embedding(query, embedding):
+    """
+    Lets retrievals of `query` inside the block search FAISS with an embedding the caller already
+    has (the FAQ cache's), instead of embedding the query again.
+    """
+    token = _query_embedding.set((query, embedding) if embedding is not None else None)
+    try:
+        yield
+    finally:
+        _query_embedding.reset(token)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuses several best-first lists of keys into one, scoring each key sum(1 / (k + rank)).
+    Only ranks are used, so FAISS distances and BM25 scores never need to share a scale.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves knowledge base chunks from FAISS (by meaning) and an in-process BM25 index over the
+    same chunks (by wording, e.g. "Gas Safe", a postcode, a price), fused by reciprocal rank.
+    """
+
+    vector_store: Any
+    bm25: Any
+    documents: List[Document]
+    k: int = 3
+    fetch_k: int = 10
+    mode: str = "hybrid"
+
+    @classmethod
+    def from_vector_store(cls, vector_store, **kwargs):
+        """
+        Builds the BM25 index from the chunks already stored in a FAISS index (unless the mode
+        is "dense", which never uses it).
+        """
+        documents = [
+            vector_store.docstore.search(doc_id)
+            for _, doc_id in sorted(vector_store.index_to_docstore_id.items())
+        ]
+        return cls(
+            vector_store=vector_store,
+            bm25=BM25Index([doc.page_content for doc in documents]) if kwargs.get("mode") != "dense" else None,
+            documents=documents,
+            **kwargs,
+        )
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        rankings = []
+        by_key = {}
+        if self.mode in ("hybrid", "dense"):
+            known = _query_embedding.get()
+            if known is not None and known[0] == query:
+                scored = self.vector_store.similarity_search_with_score_by_vector(known[1], k=self.fetch_k)
+            else:
+                scored = self.vector_store.similarity_search_with_score(query, k=self.fetch_k)
+            dense = [doc for doc, _ in scored]
+            rankings.append([_key(doc) for doc in dense])
+            by_key.update((_key(doc), doc) for doc in dense)
+        if self.mode in ("hybrid", "lexical"):
+            lexical = [self.documents[i] for i, _ in self.bm25.search(query, k=self.fetch_k)]
+            rankings.append([_key(doc) for doc in lexical])
+            by_key.update((_key(doc), doc) for doc in lexical)
+        return [by_key[key] for key in reciprocal_rank_fusion(rankings)[:self.k]]
+
+
+def _key(doc):
+    return doc.id or doc.page_content
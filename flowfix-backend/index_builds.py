@@ -0,0 +1,147 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+import numpy as np
+
+# Layout of the index directory:
+#   faiss_index/CURRENT              -> name of the live build (swapped atomically)
+#   faiss_index/builds/<build_id>/   -> index.faiss, index.pkl, manifest.json
+# A faiss_index/ holding index.faiss directly (the original layout) is still loaded.
+CURRENT_FILE = "CURRENT"
+BUILDS_DIR = "builds"
+MANIFEST_FILE = "manifest.json"
+
+
+def current_build_dir(index_root):
+    """
+    Returns the directory of the live index build, or the legacy single-index directory.
+    """
+    current = _read_current(index_root)
+    if current:
+        return os.path.join(index_root, BUILDS_DIR, current)
+    return index_root
+
+
+def current_build_id(index_root):
+    """
+    Identifies the live index build, so caches can be dropped and the app can reload when it changes.
+    """
+    current = _read_current(index_root)
+    if current:
+        return current
+    # Legacy layout: derive an id from the index files themselves.
+    parts = []
+    for name in ("index.faiss", "index.pkl"):
+        try:
+            st = os.stat(os.path.join(index_root, name))
+            parts.append(f"{st.st_size}-{st.st_mtime_ns}")
+        except OSError:
+            parts.append("missing")
+    return hashlib.sha1(":".join(parts).encode()).hexdigest()[:12]
+
+
+def _read_current(index_root):
+    try:
+        with open(os.path.join(index_root, CURRENT_FILE), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def new_build_dir(index_root):
+    build_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-") + os.urandom(3).hex()
+    path = os.path.join(index_root, BUILDS_DIR, build_id)
+    os.makedirs(path)
+    return build_id, path
+
+
+def publish_build(index_root, build_id):
+    """
+    Makes a finished build live. os.replace is atomic, so a running app sees either the old
+    build or the new one, never a half-written index.
+    """
+    tmp_path = os.path.join(index_root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(build_id)
+    os.replace(tmp_path, os.path.join(index_root, CURRENT_FILE))
+
+
+def prune_builds(index_root, keep=3):
+    """
+    Deletes all but the newest `keep` builds, never touching the live one.
+    """
+    builds_root = os.path.join(index_root, BUILDS_DIR)
+    if not os.path.isdir(builds_root):
+        return
+    current = _read_current(index_root)
+    builds = sorted(os.listdir(builds_root), reverse=True)
+    for build_id in builds[keep:]:
+        if build_id != current:
+            shutil.rmtree(os.path.join(builds_root, build_id), ignore_errors=True)
+
+
+def load_manifest(build_dir):
+    try:
+        with open(os.path.join(build_dir, MANIFEST_FILE), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_manifest(build_dir, manifest):
+    with open(os.path.join(build_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def chunk_hash(source, text):
+    """
+    Content hash of one chunk; also used as its id in the FAISS docstore.
+    """
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model, chunk hash), stored in SQLite.
+    Unchanged chunks are never sent to the embeddings API twice, even across full rebuilds.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model, hashes):
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                )
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model, vectors):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in vectors.items()],
+            )
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import functools
+from typing import Any
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentStep
+
+import tool_memo
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    An AgentExecutor that runs the tool calls of one agent step concurrently and reuses the
+    session's memoized read-tool results.
+
+    When Gemini asks for several tools in one step (slots on two dates, or emergency availability
+    and a FAQ), the stock sync executor runs them one after another. Here they are run on
+    `tool_pool`, a bounded thread pool shared by every turn in the process, so the step takes as
+    long as its slowest call. The async path already gathers a step's tools; only the memo is added.
+
+    Calls answered from `memo` (tool_memo.ToolMemo, for the session set with tool_memo.session())
+    don't run the tool at all.
+    """
+
+    tool_pool: Any = None
+    memo: Any = None
+
+    # --- SYNC ---
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        # Deferred: _iter_next_step runs the step's actions together once it has them all.
+        return functools.partial(
+            super()._perform_agent_action, name_to_tool_map, color_mapping, agent_action, run_manager,
+        )
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        actions = []
+        pending = []
+        for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+            if isinstance(item, functools.partial):
+                pending.append(item)
+            else:
+                if isinstance(item, AgentAction):
+                    actions.append(item)
+                yield item
+        if not pending:
+            return
+
+        session_id = tool_memo.current_session()
+        remembered = self.memo.lookup(session_id, actions) if self.memo else [None] * len(actions)
+        steps = [None] * len(pending)
+        to_run = []
+        for i, (action, observation) in enumerate(zip(actions, remembered)):
+            if observation is not None:
+                if run_manager:
+                    run_manager.on_agent_action(action, color="green")
+                steps[i] = AgentStep(action=action, observation=observation)
+            else:
+                to_run.append(i)
+
+        if len(to_run) > 1 and self.tool_pool is not None:
+            # Each call gets its own copy of the context, so the turn's trace follows it into the pool.
+            futures = {i: self.tool_pool.submit(contextvars.copy_context().run, pending[i]) for i in to_run}
+            for i, future in futures.items():
+                steps[i] = future.result()
+        else:
+            for i in to_run:
+                steps[i] = pending[i]()
+
+        if self.memo:
+            self.memo.remember(session_id, [steps[i] for i in to_run])
+        yield from steps
+
+    # --- ASYNC ---
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        if self.memo and agent_action.tool in self.memo.ttls:
+            session_id = tool_memo.current_session()
+            [observation] = await asyncio.to_thread(self.memo.lookup, session_id, [agent_action])
+            if observation is not None:
+                if run_manager:
+                    await run_manager.on_agent_action(agent_action, color="green")
+                return _RememberedStep(action=agent_action, observation=observation)
+        return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        steps = []
+        async for item in super()._aiter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+            if isinstance(item, AgentStep) and not isinstance(item, _RememberedStep):
+                steps.append(item)
+            yield item
+        if self.memo:
+            # The step's tools have all finished, so a booking among them clears the memo after any reads are stored.
+            # Called even when every call was remembered, to close the step's lookups.
+            await asyncio.to_thread(self.memo.remember, tool_memo.current_session(), steps)
+
+
+class _RememberedStep(AgentStep):
+    """
+    A step answered from the memo rather than by running its tool.
+    """
@@ -0,0 +1,61 @@
+import os
+import threading
+
+import redis
+
+# --- SHARED REDIS CLIENT ---
+# Every sync Redis user in a process (chat history, session locks, the free/busy cache, the
+# tool memo, the emergency watcher) shares one connection pool per server URL, so the
+# process holds a single set of connections instead of one per component.
+DEFAULT_MAX_CONNECTIONS = 50
+
+_lock = threading.Lock()
+_clients = {}  # url -> redis.Redis on that URL's pool
+
+
+def redis_url(url=None):
+    """
+    The URL to use: `url` if given, else REDIS_URL. Read on each call so REDIS_URL can come from
+    a .env file loaded after import. None when no Redis server is configured.
+    """
+    return url or os.getenv("REDIS_URL")
+
+
+def get_client(url=None, max_connections=DEFAULT_MAX_CONNECTIONS):
+    """
+    Returns the process's shared client for `url` (default REDIS_URL), or None without Redis.
+    The pool is created by the first caller, with its `max_connections`.
+    """
+    url = redis_url(url)
+    if not url:
+        return None
+    client = _clients.get(url)
+    if client is None:
+        with _lock:
+            client = _clients.get(url)
+            if client is None:
+                pool = redis.ConnectionPool.from_url(url, max_connections=max_connections)
+                client = _clients[url] = redis.Redis(connection_pool=pool)
+    return client
+
+
+class LazyBackend:
+    """
+    A component's store, picked on first use: make_redis(client) on the shared client when Redis
+    is configured, otherwise make_memory() for an in-process one.
+    """
+
+    def __init__(self, make_redis, make_memory, url=None):
+        self.make_redis = make_redis
+        self.make_memory = make_memory
+        self.url = url
+        self._backend = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    client = get_client(self.url)
+                    self._backend = self.make_redis(client) if client is not None else self.make_memory()
+        return self._backend
@@ -0,0 +1,198 @@
+import json
+import threading
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, message_to_dict, messages_from_dict
+
+import history_compaction
+import redis_clients
+import tracing
+
+# Same layout as langchain_community's RedisChatMessageHistory (newest message first under
+# "message_store:<session_id>"), so existing sessions keep working.
+KEY_PREFIX = "message_store:"
+# Compacted sessions also keep their running summary and pinned details, as JSON.
+SUMMARY_KEY_PREFIX = "message_summary:"
+
+
+class RedisHistoryStore:
+    """
+    Reads and writes chat history on the process's shared Redis client (see redis_clients.py)
+    and counts round trips.
+
+    A turn costs two round trips: one pipelined read (LRANGE, the summary and a TTL refresh)
+    when the history is loaded, and one pipelined write (greeting if new, the human/AI pair,
+    any compaction and the TTL) when the turn is saved.
+
+    With a `compactor` (history_compaction.HistoryCompactor), the history handed to the agent is
+    the compacted view; folded messages are trimmed from Redis when the turn is saved.
+    """
+
+    def __init__(self, url, ttl=None, greeting=None, max_connections=50, compactor=None):
+        self.ttl = ttl
+        self.greeting = greeting
+        self.compactor = compactor
+        self.client = redis_clients.get_client(url, max_connections=max_connections)
+        if self.client is None:
+            raise ValueError("The chat history needs a Redis server: set REDIS_URL.")
+        self.pool = self.client.connection_pool
+
+        self._lock = threading.Lock()
+        self._round_trips = 0
+        self._turns = 0
+
+    def history(self, session_id, async_client=None):
+        """
+        Returns the history for one session. Pass a redis.asyncio client to serve the async API natively.
+        """
+        return PooledRedisChatMessageHistory(session_id, self, async_client=async_client)
+
+    def _count(self, round_trips=1, turns=0):
+        with self._lock:
+            self._round_trips += round_trips
+            self._turns += turns
+
+    def stats(self):
+        with self._lock:
+            return {
+                "round_trips": self._round_trips,
+                "turns": self._turns,
+                "round_trips_per_turn": round(self._round_trips / self._turns, 2) if self._turns else None,
+            }
+
+
+class PooledRedisChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat history for one session, read once per turn and written with a single pipeline.
+
+    The greeting for a new session is not written up front; it is returned as part of the
+    history and saved together with the first turn.
+    """
+
+    def __init__(self, session_id, store, async_client=None):
+        self.session_id = session_id
+        self.store = store
+        self.async_client = async_client
+        self._messages = None
+        self._pending_greeting = None
+        self._pending_compaction = None
+
+    @property
+    def key(self):
+        return KEY_PREFIX + self.session_id
+
+    @property
+    def summary_key(self):
+        return SUMMARY_KEY_PREFIX + self.session_id
+
+    def _queue_refresh(self, pipe):
+        # Reading the history counts as activity, so slide the TTL in the same round trip.
+        pipe.lrange(self.key, 0, -1)
+        pipe.get(self.summary_key)
+        if self.store.ttl:
+            pipe.expire(self.key, self.store.ttl)
+            pipe.expire(self.summary_key, self.store.ttl)
+
+    def _load(self, results):
+        items, summary = results[0], results[1]
+        messages = messages_from_dict([json.loads(m) for m in items[::-1]])
+        if not messages and self.store.greeting:
+            self._pending_greeting = AIMessage(content=self.store.greeting)
+            messages = [self._pending_greeting]
+        if self.store.compactor is not None:
+            messages = self._compact(messages, json.loads(summary) if summary else {})
+        self._messages = messages
+        return list(messages)
+
+    def _compact(self, messages, state):
+        compactor = self.store.compactor
+        with tracing.span("history", "compact") as attrs:
+            view, state, folded = compactor.compact(messages, state)
+            attrs.update(
+                messages=len(messages),
+                folded=folded,
+                tokens_full=history_compaction.estimate_tokens(messages),
+                tokens_sent=history_compaction.estimate_tokens(view),
+            )
+        tracing.HISTORY_TOKENS.labels("full").observe(attrs["tokens_full"])
+        tracing.HISTORY_TOKENS.labels("sent").observe(attrs["tokens_sent"])
+        if folded:
+            # Applied with the next save: the summary is stored and the folded messages trimmed.
+            self._pending_compaction = (state, len(messages) - folded)
+        return view
+
+    def _queue_append(self, pipe, messages):
+        messages = list(messages)
+        if self._pending_greeting is not None:
+            messages.insert(0, self._pending_greeting)
+            self._pending_greeting = None
+        for message in messages:
+            pipe.lpush(self.key, json.dumps(message_to_dict(message)))
+        if self._pending_compaction is not None:
+            state, kept = self._pending_compaction
+            self._pending_compaction = None
+            pipe.set(self.summary_key, json.dumps(state))
+            # Newest first, so this keeps the unfolded messages plus the ones just added.
+            pipe.ltrim(self.key, 0, kept + len(messages) - 1)
+        if self.store.ttl:
+            pipe.expire(self.key, self.store.ttl)
+            pipe.expire(self.summary_key, self.store.ttl)
+        if self._messages is not None:
+            self._messages.extend(messages)
+
+    # --- SYNC API ---
+    @property
+    def messages(self):
+        if self._messages is not None:
+            return list(self._messages)
+        pipe = self.store.client.pipeline(transaction=False)
+        self._queue_refresh(pipe)
+        with tracing.span("redis", "history.load"):
+            results = pipe.execute()
+        self.store._count()
+        return self._load(results)
+
+    def add_messages(self, messages):
+        pipe = self.store.client.pipeline(transaction=False)
+        self._queue_append(pipe, messages)
+        with tracing.span("redis", "history.save", messages=len(messages)):
+            pipe.execute()
+        self.store._count(turns=1)
+
+    def clear(self):
+        self.store.client.delete(self.key, self.summary_key)
+        self.store._count()
+        self._messages = None
+        self._pending_greeting = None
+        self._pending_compaction = None
+
+    # --- ASYNC API ---
+    async def aget_messages(self):
+        if self.async_client is None:
+            return await super().aget_messages()
+        if self._messages is not None:
+            return list(self._messages)
+        pipe = self.async_client.pipeline(transaction=False)
+        self._queue_refresh(pipe)
+        with tracing.span("redis", "history.load"):
+            results = await pipe.execute()
+        self.store._count()
+        return self._load(results)
+
+    async def aadd_messages(self, messages):
+        if self.async_client is None:
+            return await super().aadd_messages(messages)
+        pipe = self.async_client.pipeline(transaction=False)
+        self._queue_append(pipe, messages)
+        with tracing.span("redis", "history.save", messages=len(messages)):
+            await pipe.execute()
+        self.store._count(turns=1)
+
+    async def aclear(self):
+        if self.async_client is None:
+            return await super().aclear()
+        await self.async_client.delete(self.key, self.summary_key)
+        self.store._count()
+        self._messages = None
+        self._pending_greeting = None
+        self._pending_compaction = None
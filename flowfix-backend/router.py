@@ -0,0 +1,217 @@
+import datetime
+import re
+import threading
+
+import service_area
+
+# Anything about booking, availability or an emergency needs the agent, even if it also
+# mentions a price or the phone number.
+AGENT_ONLY_PATTERN = re.compile(
+    r"\b(book|booking|appointment|available|availability|slot|slots|schedule|reschedule|cancel"
+    r"|emergency|urgent|urgently|asap|burst|flood|flooding|leaking|no heating|no hot water"
+    r"|today|tomorrow|tonight|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b"
+)
+
+# Intents only match the way a customer asks us something, not the way they tell us something
+# while booking ("my phone number is ...", "no, the quote is fine").
+PRICE_PATTERN = re.compile(
+    r"\bhow much (do|does|would|will|is|are|to|for)\b|\bwhat (do|does|would) (you|it) charge\b|\bdo you charge\b"
+    r"|\bwhat (are|is) your (prices?|rates?|charges?|fees?|price list)\b|\byour (prices|rates|charges|fees|price list)\b"
+    r"|\b(price|prices|cost|costs) (of|for|to)\b|\bwhat does (a|an|it) .{0,40}\bcost\b"
+)
+# About the job in hand rather than our price list; the agent knows what has been discussed.
+JOB_PRICE_PATTERN = re.compile(r"\b(total|final|overall|whole|my|that|this|the) (cost|price|charge|quote|bill|amount)\b|\bgoing to (cost|be)\b")
+HOURS_PATTERN = re.compile(
+    r"\b(opening|business|working|office) hours\b|\byour hours\b|\bwhat time do you (open|close|start|finish)\b"
+    r"|\bwhen (are|do) you (open|close)\b|\bare you open\b"
+)
+PHONE_PATTERN = re.compile(
+    r"\byour (phone |telephone |contact |mobile )?(number|no)\b"
+    r"|\bhow (can|do) i (call|phone|ring|contact) you\b|\bnumber (to|can i|should i) (call|ring)\b"
+)
+AREA_PATTERN = re.compile(
+    r"\b(service area|areas? (do )?you (cover|serve)|do you (cover|serve|come to|work in)|which areas?"
+    r"|where do you (cover|work|operate))\b"
+)
+
+# A question joined to another one ("... and what are your hours?"); the agent answers both.
+FOLLOW_ON_QUESTION_PATTERN = re.compile(
+    r"\b(and|also|plus)\s+(what|what's|how|when|where|which|who|do|does|are|is|can|could|would|will|your)\b"
+)
+
+# Any mention of a topic, asked about or not; a message touching two of them ("phone number and
+# opening hours") asks more than one thing.
+TOPIC_MENTION_PATTERNS = {
+    "price": re.compile(r"\b(price|prices|pricing|cost|costs|charge|charges|how much|quote|estimate|rates?)\b"),
+    "hours": re.compile(r"\b(hours|open|opening|close|closing)\b"),
+    "phone": re.compile(r"\b(phone|telephone|mobile|contact) (number|no)\b|\b(call|ring) you\b|\byour number\b"),
+    "area": AREA_PATTERN,
+}
+
+# A UK phone number, e.g. 07700 900123 or +44 24 7600 1234.
+PHONE_NUMBER_PATTERN = re.compile(r"(?<!\d)(?:\+44\s?|0)\d(?:[\s-]?\d){8,9}(?!\d)")
+
+# The assistant's last message asked the customer for a booking detail, so the reply is an answer, not a question.
+DETAILS_REQUEST_PATTERN = re.compile(
+    r"\b(your|the) (full |first |last )?(name|phone|mobile|contact|number|postcode|post code|address|email)\b"
+    r"|\b(phone|mobile|contact) number\b|\b(what|which) (date|day|time)\b|\blook correct\b|\bconfirm\b"
+)
+
+# Words in price_list names that don't identify a service on their own.
+GENERIC_SERVICE_WORDS = {"repair", "installation", "fitting", "leaky", "blocked"}
+
+
+def service_keywords(price_list):
+    """
+    The words that identify each price_list service: {key: {word, ...}}.
+    """
+    return {
+        key: {w for w in re.findall(r"[a-z]+", item["name"].lower()) if w not in GENERIC_SERVICE_WORDS}
+        for key, item in price_list.items()
+    }
+
+
+def mentioned_services(text, keywords):
+    """
+    The keys of the services a message mentions, singular or plural, in price_list order.
+    """
+    words = set(re.findall(r"[a-z]+", text.lower()))
+    words |= {w[:-1] for w in words if w.endswith("s")}
+    return [key for key, service_words in keywords.items() if service_words & words]
+
+# Longer messages are usually more than a simple lookup.
+MAX_FAST_PATH_WORDS = 25
+
+
+class FastPathRouter:
+    """
+    Answers well-defined questions (prices, business hours, phone number, service area)
+    straight from config.json, without a Gemini call. route() returns None for anything
+    else, and the turn falls through to the agent.
+
+    Intents are matched with keyword and pattern rules. An optional `classifier`, e.g. a small
+    local model, is consulted only when no rule matches: it is called as classifier(text) and
+    must return (intent, confidence), with intent one of "price", "hours", "phone" or "area".
+    Service-area answers come from `coverage`, a service_area.CoverageIndex.
+
+    Messages that carry booking details (a phone number or full postcode), reply to the
+    assistant asking for them, or ask more than one thing always go to the agent.
+    """
+
+    def __init__(self, config, classifier=None, min_confidence=0.85, coverage=None):
+        self.config = config
+        # Without a centroid table only the core area is known; there are no travel zones.
+        self.coverage = coverage or service_area.CoverageIndex(config, {})
+        self.classifier = classifier
+        self.min_confidence = min_confidence
+        self.service_keywords = service_keywords(config["price_list"])
+        self.handlers = {
+            "price": self._answer_price,
+            "hours": self._answer_hours,
+            "phone": self._answer_phone,
+            "area": self._answer_area,
+        }
+
+        self._lock = threading.Lock()
+        self._counts = {"fell_through": 0}
+
+    def route(self, message, previous=None):
+        """
+        Returns the answer, or None. `previous` is the assistant's last message in the
+        conversation, if known.
+        """
+        text = " ".join(message.lower().split())
+        intent = self.intent(message)
+        if intent is not None and previous and DETAILS_REQUEST_PATTERN.search(previous.lower()):
+            intent = None
+        with self._lock:
+            key = intent or "fell_through"
+            self._counts[key] = self._counts.get(key, 0) + 1
+        if intent is None:
+            return None
+        return self.handlers[intent](message, text)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def intent(self, message):
+        """
+        The intent the message would be answered as, ignoring where the conversation is; None for the agent.
+        """
+        text = " ".join(message.lower().split())
+        if AGENT_ONLY_PATTERN.search(text) or len(text.split()) > MAX_FAST_PATH_WORDS:
+            return None
+        if PHONE_NUMBER_PATTERN.search(text) or text.count("?") > 1 or FOLLOW_ON_QUESTION_PATTERN.search(text):
+            return None
+        if sum(1 for pattern in TOPIC_MENTION_PATTERNS.values() if pattern.search(text)) > 1:
+            return None
+        postcode = service_area.find_postcode(message)
+        if postcode is not None and postcode.inward:
+            # A full postcode is usually the customer's address; "do you cover CV3?" still matches.
+            return None
+
+        matched = []
+        if PRICE_PATTERN.search(text) and not JOB_PRICE_PATTERN.search(text):
+            matched.append("price")
+        if HOURS_PATTERN.search(text):
+            matched.append("hours")
+        if PHONE_PATTERN.search(text):
+            matched.append("phone")
+        if AREA_PATTERN.search(text):
+            matched.append("area")
+
+        # Questions that touch several topics are left to the agent.
+        if len(matched) == 1:
+            return matched[0]
+        if not matched and self.classifier:
+            intent, confidence = self.classifier(text)
+            if intent in self.handlers and confidence >= self.min_confidence:
+                return intent
+        return None
+
+    # --- ANSWERS ---
+    def _answer_price(self, message, text):
+        services = mentioned_services(text, self.service_keywords)
+        price_list = self.config["price_list"]
+
+        if not services:
+            lines = [f"{item['name']}: {item['estimate'].rstrip('.')}." for item in price_list.values()]
+            return (
+                "Here are our typical prices. " + " ".join(lines) + " "
+                "Final prices depend on the job, and I can help you book an appointment if you'd like."
+            )
+
+        lines = [f"{price_list[key]['name']} is usually {price_list[key]['estimate'].rstrip('.')}." for key in services]
+        return " ".join(lines) + " Would you like me to check availability for an appointment?"
+
+    def _answer_hours(self, message, text):
+        hours = self.config["business_hours"]
+        start = _format_time(hours["start"])
+        end = _format_time(hours["end"])
+        return (
+            f"Our business hours are {start} to {end}. For emergencies outside those hours, "
+            f"please call {self.config['business_phone_number']}."
+        )
+
+    def _answer_phone(self, message, text):
+        return f"You can reach {self.config['business_name']} on {self.config['business_phone_number']}."
+
+    def _answer_area(self, message, text):
+        areas = ", ".join(self.config["service_area_postcodes"])
+        postcode = service_area.find_postcode(message)
+        if postcode is None:
+            return f"We cover the {areas} postcode areas. What's your postcode?"
+        area = self.coverage.lookup_postcode(postcode)
+        if area.zone == "core":
+            return f"Yes, {area.postcode} is within our service area. How can we help?"
+        if area.covered:
+            return (
+                f"{area.postcode} is just outside our main area (about {area.distance_miles:g} miles away), "
+                f"but we can come out for larger jobs with {area.surcharge or 'a travel surcharge'}. How can we help?"
+            )
+        return f"I'm sorry, {area.postcode} is outside our service area, which covers {areas}."
+
+
+def _format_time(value):
+    return datetime.time.fromisoformat(value).strftime("%I:%M %p").lstrip("0")
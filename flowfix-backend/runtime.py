@@ -0,0 +1,405 @@
+import functools
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import index_builds
+from stats import LatencyStats
+
+# --- LAZY APPLICATION COMPONENTS ---
+# Importing this module is cheap: LangChain, Gemini, FAISS and the Google API client are only
+# imported and built the first time a component is needed. Web workers therefore come up in a
+# fraction of a second, and a worker that only serves fast-path answers never loads the agent.
+#
+# Preforking servers (gunicorn --preload, see gunicorn.conf.py) can call warm_up() in the master
+# so the heavy modules and the FAISS index are loaded once and shared copy-on-write by every child.
+
+# --- GET ABSOLUTE PATHS ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(BASE_DIR, 'config.json')
+FAISS_INDEX_PATH = os.path.join(BASE_DIR, "faiss_index")
+CENTROIDS_PATH = os.path.join(BASE_DIR, "postcode_centroids.csv")
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+
+with open(CONFIG_PATH, 'r') as f:
+    config = json.load(f)
+
+# The greeting the chat widget shows before the user has typed anything.
+INITIAL_GREETING = "Hi! I am Vern, the FlowFix AI assistant. How can I help with your plumbing today?"
+HISTORY_TTL_SECONDS = 7200
+
+# The agent sees the last HISTORY_KEEP_TURNS exchanges verbatim; older ones are folded into a
+# running summary with the booking details pinned, and the history is kept under this many tokens.
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+
+# create_vectorstore.py publishes new builds atomically; check for one at most this often.
+KNOWLEDGE_BASE_RELOAD_INTERVAL_SECONDS = 10
+
+# Knowledge base answers only change when the index is rebuilt, so repeat and paraphrased
+# questions are answered from a semantic cache instead of another retrieval + Gemini call.
+FAQ_CACHE_SIMILARITY = float(os.getenv("FAQ_CACHE_SIMILARITY", "0.92"))
+
+# Admission control (see admission.py). The agent limits are per worker process. Under gunicorn
+# each worker has WORKER_THREADS request threads (gunicorn.conf.py reads it from here), and a
+# queued agent turn holds one of them, so by default all but two threads may run the agent and
+# one may wait in the queue: the last thread is always free for fast-path turns, and a turn past
+# that gets a 429. Under the ASGI app turns don't hold threads; raise both limits there.
+# A turn waits up to SESSION_LOCK_WAIT_SECONDS for the previous turn of its session, and up to
+# AGENT_QUEUE_TIMEOUT_SECONDS in the agent queue.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "8"))
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", str(max(1, WORKER_THREADS - 2))))
+AGENT_MAX_QUEUE = int(os.getenv("AGENT_MAX_QUEUE", str(max(1, WORKER_THREADS - AGENT_MAX_CONCURRENCY - 1))))
+AGENT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AGENT_QUEUE_TIMEOUT_SECONDS", "20"))
+SESSION_LOCK_WAIT_SECONDS = float(os.getenv("SESSION_LOCK_WAIT_SECONDS", "30"))
+
+# The agent's step-by-step console output; per-turn traces and /metrics cover this in production.
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE") == "1"
+
+# How long each component took to build in this process.
+startup_stats = LatencyStats()
+
+
+def lazy(factory):
+    """
+    Turns a zero-argument factory into a getter that builds the component once, on first use.
+    Concurrent first calls wait for the same build. getter.is_built() reports whether it has run.
+    """
+    lock = threading.Lock()
+    built = []
+
+    @functools.wraps(factory)
+    def getter():
+        if not built:
+            with lock:
+                if not built:
+                    started = time.perf_counter()
+                    built.append(factory())
+                    startup_stats.record(factory.__name__, time.perf_counter() - started)
+        return built[0]
+
+    getter.is_built = lambda: bool(built)
+    return getter
+
+
+# --- MODELS ---
+@lazy
+def get_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.6)
+
+
+@lazy
+def get_embeddings():
+    """
+    Embeddings for the knowledge base, from the backend set by EMBEDDING_BACKEND (see
+    embedding_backends.py). The client behind them is only created on the first embed call.
+    """
+    import embedding_backends
+    return embedding_backends.LazyEmbeddings(*embedding_backends.configured())
+
+
+# --- KNOWLEDGE BASE (RAG) ---
+# "dense" searches FAISS only; "hybrid" fuses it with an in-process BM25 index over the same chunks
+# and "lexical" uses BM25 alone. Measure with benchmarks/bench_retrieval.py before switching.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+
+_knowledge_base_lock = threading.Lock()
+_vector_store = None
+_vector_store_loaded = False
+_retriever = None
+_retriever_store = None
+_rag_chain = None
+_rag_chain_store = None
+knowledge_base_version = None
+_knowledge_base_checked_at = 0.0
+
+
+def load_vector_store():
+    """
+    Loads the live FAISS build.
+    """
+    from langchain_community.vectorstores import FAISS
+    build_dir = index_builds.current_build_dir(FAISS_INDEX_PATH)
+    embeddings = get_embeddings()
+    manifest = index_builds.load_manifest(build_dir)
+    model_id = getattr(embeddings, "model_id", None)
+    if manifest and model_id and manifest.get("model") != model_id:
+        print(f"WARNING: the knowledge base was built with {manifest.get('model')} but questions are embedded with "
+              f"{model_id}. Set EMBEDDING_BACKEND/EMBEDDING_MODEL to match, or rebuild with create_vectorstore.py.")
+    return FAISS.load_local(build_dir, embeddings, allow_dangerous_deserialization=True)
+
+
+def get_vector_store():
+    """
+    Returns the live FAISS index, loading it on first use and hot-reloading it when
+    create_vectorstore.py has published a new build. None if it could not be loaded.
+    """
+    global _vector_store, _vector_store_loaded, knowledge_base_version, _knowledge_base_checked_at
+    if _vector_store_loaded and time.monotonic() - _knowledge_base_checked_at < KNOWLEDGE_BASE_RELOAD_INTERVAL_SECONDS:
+        return _vector_store
+    with _knowledge_base_lock:
+        if _vector_store_loaded and time.monotonic() - _knowledge_base_checked_at < KNOWLEDGE_BASE_RELOAD_INTERVAL_SECONDS:
+            return _vector_store
+        _knowledge_base_checked_at = time.monotonic()
+        latest = index_builds.current_build_id(FAISS_INDEX_PATH)
+        if _vector_store_loaded and latest == knowledge_base_version:
+            return _vector_store
+        started = time.perf_counter()
+        try:
+            _vector_store = load_vector_store()
+            print(f"Knowledge base loaded from local faiss_index (build {latest}).")
+        except Exception as e:
+            if _vector_store is None:
+                print(f"CRITICAL Error loading knowledge base from local index: {e}")
+            else:
+                print(f"Error reloading knowledge base build {latest}, keeping the current one: {e}")
+                return _vector_store
+        startup_stats.record("load_vector_store", time.perf_counter() - started)
+        reloaded = _vector_store_loaded
+        _vector_store_loaded = True
+        knowledge_base_version = latest
+        if reloaded and get_faq_cache.is_built():
+            get_faq_cache().set_version(latest)
+        return _vector_store
+
+
+@lazy
+def get_rag_prompt():
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_template("""Answer the user's question based only on the following context. If the context doesn't contain the answer, say you don't have that information.
+
+Context:
+{context}
+
+Question: {input}""")
+
+
+def get_retriever():
+    """
+    Returns the retriever over the live knowledge base build, or None if there is no index.
+    The BM25 index is rebuilt from the FAISS docstore whenever a new build is loaded.
+    """
+    global _retriever, _retriever_store
+    vector_store = get_vector_store()
+    if vector_store is None:
+        return None
+    if vector_store is not _retriever_store:
+        from hybrid_retrieval import HybridRetriever, MODES
+        if RETRIEVAL_MODE not in MODES:
+            raise ValueError(f"Unknown RETRIEVAL_MODE '{RETRIEVAL_MODE}', expected one of {', '.join(MODES)}.")
+        _retriever = HybridRetriever.from_vector_store(vector_store, k=3, mode=RETRIEVAL_MODE)
+        _retriever_store = vector_store
+    return _retriever
+
+
+def get_rag_chain():
+    """
+    Returns a retrieval chain over the live knowledge base build, or None if there is no index.
+    """
+    global _rag_chain, _rag_chain_store
+    retriever = get_retriever()
+    if retriever is None:
+        return None
+    if retriever is not _rag_chain_store:
+        from langchain.chains import create_retrieval_chain
+        from langchain.chains.combine_documents import create_stuff_documents_chain
+        question_answer_chain = create_stuff_documents_chain(get_llm(), get_rag_prompt())
+        _rag_chain, _rag_chain_store = create_retrieval_chain(retriever, question_answer_chain), retriever
+    return _rag_chain
+
+
+@lazy
+def get_faq_cache():
+    from semantic_cache import SemanticCache
+    get_vector_store()  # Settles knowledge_base_version first.
+    return SemanticCache(
+        get_embeddings().embed_query,
+        threshold=FAQ_CACHE_SIMILARITY,
+        max_entries=500,
+        ttl_seconds=24 * 3600,
+        version=knowledge_base_version,
+    )
+
+
+# --- AGENT SETUP ---
+# Tool calls the model makes together in one step run concurrently on a pool of this many threads
+# per process. Results of the read-only tools are reused within a session for these many seconds
+# (see tool_memo.py); a booking clears them.
+TOOL_THREAD_POOL_SIZE = int(os.getenv("TOOL_THREAD_POOL_SIZE", "16"))
+TOOL_MEMO_TTLS = {
+    "get_general_information": 300,
+    "find_available_appointment_slots": 60,
+    "check_emergency_availability": 30,
+}
+
+
+@lazy
+def get_tools():
+    from agent_tools import TOOLS
+    return TOOLS
+
+
+@lazy
+def get_agent_prompt():
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages([
+        ("system", """
+    Your Persona: You are Vern, a helpful and friendly AI assistant for FlowFix Plumbers.
+
+    Your Goal: Help users get information, check availability, and book appointments. Be conversational and clear.
+
+     Interaction Rules:
+    1.  **One Question at a Time:** When you need information from a user (like their name, phone number, or a date), you MUST ask for only ONE piece of information at a time. Do not ask multiple questions in a single message. However approaching each question with conversational aspects in encouraged.
+    2.  **Confirm Before Action:** Before you use the `book_appointment` tool, you MUST first state what service you believe the user wants. Then, you MUST summarize all the other details (date, time, name, phone number) and ask the user for a final confirmation, like "Does all of that look correct?". Only proceed with the booking after the user confirms.
+    3.  **No Repeat Introductions:** You MUST introduce yourself in your very first message. In all subsequent messages, you MUST NOT introduce yourself or mention that you are an AI. Get straight to the point.
+    4. **All Natural Language Responses:** All responses you give to the user must be in natural language format, ie no asterics (*) to be inclued in your answers.
+    5. **Emergency Situations:** If a user mentions an emergency (like a burst pipe or no heating), first you must always clarify whether the situation is an emergency, if the user specifies it is a non emergency then you are to go about the normal booking procedure. However if the user specifies it is an emergency you MUST use the `check_emergency_availability` tool to check if the plumber is available. If they are, you MUST instruct the user to call the emergency phone number immediately. If they are not available, you MUST apologize and inform the user that they will need to try another service or wait until a plumber is available, and give them the closest possible appointment time.
+    """),
+        ("placeholder", "{chat_history}"),
+        ("human", "{input}"),
+        ("placeholder", "{agent_scratchpad}"),
+    ])
+
+
+@lazy
+def get_tool_pool():
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=TOOL_THREAD_POOL_SIZE, thread_name_prefix="flowfix-tools")
+
+
+@lazy
+def get_tool_memo():
+    from tool_memo import ToolMemo
+    return ToolMemo(
+        TOOL_MEMO_TTLS,
+        invalidated_by=("book_appointment",),
+        calendar_tools=("find_available_appointment_slots", "check_emergency_availability"),
+        redis_url=REDIS_URL,
+    )
+
+
+@lazy
+def get_agent_executor():
+    from langchain.agents import create_tool_calling_agent
+    from parallel_agent import ParallelAgentExecutor
+    tools = get_tools()
+    agent = create_tool_calling_agent(get_llm(), tools, get_agent_prompt())
+    return ParallelAgentExecutor(
+        agent=agent, tools=tools, verbose=AGENT_VERBOSE, tool_pool=get_tool_pool(), memo=get_tool_memo(),
+    )
+
+
+# --- REDIS-BACKED MEMORY MANAGEMENT ---
+# All worker processes connect to the same Redis server, so the history is shared.
+# The store keeps one connection pool per process and batches each turn into two round trips.
+@lazy
+def get_history_store():
+    from history_compaction import HistoryCompactor
+    from redis_history import RedisHistoryStore
+    return RedisHistoryStore(
+        REDIS_URL,
+        ttl=HISTORY_TTL_SECONDS,
+        greeting=INITIAL_GREETING,
+        compactor=HistoryCompactor(config, keep_turns=HISTORY_KEEP_TURNS, max_tokens=HISTORY_TOKEN_BUDGET),
+    )
+
+
+def get_redis_session_history(session_id: str):
+    """
+    Gets the chat history for a given session ID from the central Redis store.
+    A new session starts with the AI's initial greeting, so the agent knows it has
+    already introduced itself and won't repeat the greeting.
+    """
+    return get_history_store().history(session_id)
+
+
+@lazy
+def get_conversational_agent():
+    from langchain_core.runnables.history import RunnableWithMessageHistory
+    # This wraps our agent and connects it to the Redis history function
+    return RunnableWithMessageHistory(
+        get_agent_executor(),
+        get_redis_session_history,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+    )
+
+
+# --- ADMISSION CONTROL ---
+# One lock per session in Redis (shared by every worker) and a bounded agent queue per process.
+@lazy
+def get_session_turns():
+    from admission import SessionTurns
+    return SessionTurns(wait_seconds=SESSION_LOCK_WAIT_SECONDS)
+
+
+@lazy
+def get_agent_slots():
+    from admission import AgentSlots
+    return AgentSlots(
+        max_active=AGENT_MAX_CONCURRENCY, max_queue=AGENT_MAX_QUEUE, max_wait=AGENT_QUEUE_TIMEOUT_SECONDS,
+    )
+
+
+# --- SERVICE AREA ---
+# Postcode coverage (core area, travel zones, distance from base), precomputed once per process.
+@lazy
+def get_coverage_index():
+    import service_area
+    return service_area.CoverageIndex(config, service_area.load_centroids(CENTROIDS_PATH))
+
+
+# --- FAST PATH ---
+# Prices, business hours, the phone number and service-area questions are answered straight
+# from config.json. Only open-ended or booking turns go through the agent (and Gemini).
+@lazy
+def get_fast_path_router():
+    from router import FastPathRouter
+    return FastPathRouter(config, coverage=get_coverage_index())
+
+
+# --- PROCESS LIFECYCLE ---
+_background_lock = threading.Lock()
+_background_pid = None
+
+
+def warm_up():
+    """
+    Imports the heavy modules and loads the FAISS index and prompts, without creating any
+    network clients (Gemini, Redis, Google Calendar). Safe to call in a preforking master.
+    """
+    started = time.perf_counter()
+    import calendar_utils  # noqa: F401 (googleapiclient, pytz)
+    import langchain.agents  # noqa: F401
+    import langchain_google_genai  # noqa: F401
+    import redis_history  # noqa: F401
+    get_retriever()
+    get_rag_prompt()
+    get_agent_prompt()
+    get_tools()
+    get_coverage_index()
+    get_fast_path_router()
+    startup_stats.record("warm_up", time.perf_counter() - started)
+
+
+def start_background_tasks():
+    """
+    Starts this process's background threads. Threads don't survive a fork, so this runs once
+    per worker process (on its first request, or from a post_fork hook), never in a master.
+    """
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        import calendar_utils
+        # Keeps the emergency-block snapshot warm so check_emergency_availability doesn't query the calendar.
+        calendar_utils.emergency_watcher.start()
+        _background_pid = os.getpid()
@@ -0,0 +1,135 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _normalise_text(text):
+    return re.sub(r"[^a-z0-9 ]", "", " ".join(text.lower().split()))
+
+
+class SemanticCache:
+    """
+    Caches answers by the meaning of the question.
+
+    A lookup first tries an exact match on the normalised text (no embedding needed), then
+    compares the query embedding against every cached question; a cosine similarity at or above
+    `threshold` is a hit. Entries are evicted least-recently-used beyond `max_entries` and expire
+    after `ttl_seconds`. Changing the version (e.g. a new knowledge base build) empties the cache.
+    """
+
+    def __init__(self, embed_query, threshold=0.92, max_entries=500, ttl_seconds=86400, version=None):
+        self.embed_query = embed_query
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = version
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalised question -> (unit vector, answer, stored at)
+        self._matrix = None
+        self._matrix_keys = []
+
+        self._hits = 0
+        self._exact_hits = 0
+        self._misses = 0
+        self._miss_seconds = 0.0
+        self._hit_seconds = 0.0
+
+    def set_version(self, version):
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._entries.clear()
+                self._matrix = None
+
+    def lookup(self, query):
+        """
+        Returns (answer, query_vector). The answer is None on a miss; pass the vector to store(),
+        with the version read before this lookup.
+        On a miss the vector is the query's embedding as embed_query returned it, so retrieval
+        can reuse it instead of embedding the query again.
+        """
+        started = time.perf_counter()
+        key = _normalise_text(query)
+
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._record_hit(started, exact=True)
+                return entry[1], entry[0]
+
+        embedding = self.embed_query(query)
+        vector = self._unit(embedding)
+
+        with self._lock:
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries)
+                    self._matrix = np.stack([self._entries[k][0] for k in self._matrix_keys])
+                scores = self._matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    best_key = self._matrix_keys[best]
+                    self._entries.move_to_end(best_key)
+                    self._record_hit(started, exact=False)
+                    return self._entries[best_key][1], vector
+        return None, embedding
+
+    def store(self, query, vector, answer, elapsed_seconds, version):
+        """
+        Caches a freshly generated answer. `elapsed_seconds` is how long it took to produce,
+        which is used to report the latency saved by later hits. `version` is the cache's version
+        read before the lookup: if set_version() has changed it since, the answer came from the
+        old knowledge base and is not cached.
+        """
+        with self._lock:
+            self._misses += 1
+            self._miss_seconds += elapsed_seconds
+            if vector is None or version != self.version:
+                return
+            self._entries[_normalise_text(query)] = (self._unit(vector), answer, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            avg_miss = self._miss_seconds / self._misses if self._misses else 0.0
+            avg_hit = self._hit_seconds / self._hits if self._hits else 0.0
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "exact_hits": self._exact_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else None,
+                "avg_hit_ms": round(avg_hit * 1000, 1),
+                "avg_miss_ms": round(avg_miss * 1000, 1),
+                "saved_ms": round(self._hits * max(avg_miss - avg_hit, 0) * 1000, 1),
+            }
+
+    def _record_hit(self, started, exact):
+        self._hits += 1
+        if exact:
+            self._exact_hits += 1
+        self._hit_seconds += time.perf_counter() - started
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [k for k, (_, _, stored_at) in self._entries.items() if stored_at < cutoff]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._matrix = None
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
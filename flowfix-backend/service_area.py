@@ -0,0 +1,163 @@
+import csv
+import math
+import re
+from typing import NamedTuple, Optional
+
+# --- POSTCODE PARSING ---
+# A UK postcode is an outward code (area letters + district, e.g. "CV3", "CV10", "B9", "W1A")
+# optionally followed by an inward code (sector digit + unit letters, e.g. "5FB").
+POSTCODE_PATTERN = re.compile(r"^([A-Z]{1,2}\d[A-Z\d]?)(\d[A-Z]{2})?$")
+POSTCODE_IN_TEXT_PATTERN = re.compile(r"\b([A-Z]{1,2}\d[A-Z\d]?)(?:\s*(\d[A-Z]{2}))?\b")
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+class Postcode(NamedTuple):
+    outward: str
+    inward: Optional[str] = None
+
+    @property
+    def area(self):
+        return re.match(r"[A-Z]+", self.outward).group(0)
+
+    @property
+    def sector(self):
+        return f"{self.outward} {self.inward[0]}" if self.inward else None
+
+    def __str__(self):
+        return f"{self.outward} {self.inward}" if self.inward else self.outward
+
+
+def parse_postcode(text):
+    """
+    Parses a full postcode ("cv3 5fb") or an outward code alone ("CV3"). Returns None if it isn't one.
+    """
+    match = POSTCODE_PATTERN.match("".join((text or "").upper().split()))
+    if not match:
+        return None
+    return Postcode(match.group(1), match.group(2))
+
+
+def find_postcode(text):
+    """
+    Returns the first postcode or outward code mentioned in free text, or None.
+    """
+    for match in POSTCODE_IN_TEXT_PATTERN.finditer((text or "").upper()):
+        postcode = parse_postcode(match.group(1) + (match.group(2) or ""))
+        if postcode:
+            return postcode
+    return None
+
+
+# --- CENTROIDS ---
+def load_centroids(path):
+    """
+    Loads the offline table of outward-code centroids: {outward: (latitude, longitude)}.
+    """
+    with open(path, "r", newline="") as f:
+        return {row["outward"].strip().upper(): (float(row["latitude"]), float(row["longitude"])) for row in csv.DictReader(f)}
+
+
+def distance_miles(a, b):
+    """
+    Great-circle (haversine) distance between two (latitude, longitude) points.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(h))
+
+
+# --- COVERAGE INDEX ---
+class Coverage(NamedTuple):
+    postcode: str
+    outward: str
+    covered: bool
+    zone: Optional[str]
+    surcharge: Optional[str]
+    emergency: bool
+    distance_miles: Optional[float]
+
+
+class CoverageIndex:
+    """
+    Answers "do we cover this postcode, in which zone, and how far is it from base?" with a
+    couple of dictionary lookups.
+
+    Everything is precomputed when the index is built: the core service area from config.json
+    ("service_area_postcodes", which may list areas like "CV", districts like "CV3" or sectors
+    like "CV3 5") and, for every outward code in the centroid table, its distance from the base
+    postcode and the travel zone it falls in ("travel_zones", by max_miles). A lookup then tries
+    the sector, the district and the area, most specific first.
+    """
+
+    def __init__(self, config, centroids):
+        self.centroids = centroids
+        self.core = [code.upper() for code in config["service_area_postcodes"]]
+        self.travel_zones = sorted(config.get("travel_zones", []), key=lambda z: z["max_miles"])
+        base = parse_postcode(config.get("base_postcode") or self.core[0])
+        self.base = centroids.get(base.outward) if base else None
+
+        self._by_code = {}
+        # Distances and travel zones first, so the core area overrides them below.
+        for outward, point in centroids.items():
+            miles = distance_miles(self.base, point) if self.base else None
+            zone = self._travel_zone(miles)
+            self._by_code[outward] = (
+                zone is not None,
+                zone["name"] if zone else None,
+                zone.get("surcharge") if zone else None,
+                bool(zone and zone.get("emergency", False)),
+                round(miles, 1) if miles is not None else None,
+            )
+        for code in self.core:
+            code = " ".join(code.split())
+            # A whole area ("CV") covers every district of it, including ones in the centroid table.
+            keys = [code]
+            if code.isalpha():
+                keys += [outward for outward in centroids if re.match(r"[A-Z]+", outward).group(0) == code]
+            for key in keys:
+                miles = self._by_code.get(key.split()[0], (None,) * 5)[4]
+                self._by_code[key] = (True, "core", None, True, miles)
+
+    def _travel_zone(self, miles):
+        if miles is None:
+            return None
+        for zone in self.travel_zones:
+            if miles <= zone["max_miles"]:
+                return zone
+        return None
+
+    def lookup(self, text):
+        """
+        Returns the Coverage for a postcode or outward code, or None if `text` doesn't contain one.
+        A postcode given as part of an address ("12 High Street, CV3 5FB") is found too.
+        """
+        postcode = parse_postcode(text) or find_postcode(text)
+        if postcode is None:
+            return None
+        return self.lookup_postcode(postcode)
+
+    def lookup_postcode(self, postcode):
+        entry = None
+        for key in (postcode.sector, postcode.outward, postcode.area):
+            if key and key in self._by_code:
+                entry = self._by_code[key]
+                break
+        if entry is None:
+            return Coverage(str(postcode), postcode.outward, False, None, None, False, None)
+        covered, zone, surcharge, emergency, miles = entry
+        if miles is None and postcode.outward in self._by_code:
+            miles = self._by_code[postcode.outward][4]
+        return Coverage(str(postcode), postcode.outward, covered, zone, surcharge, emergency, miles)
+
+    def distance_between(self, a, b):
+        """
+        Miles between the centroids of two postcodes' districts, or None if either is unknown.
+        """
+        points = [self.centroids.get(p.outward) if p else None for p in (parse_postcode(a), parse_postcode(b))]
+        if None in points:
+            return None
+        return round(distance_miles(*points), 1)
+
+    def describe_core_area(self):
+        return ", ".join(self.core)
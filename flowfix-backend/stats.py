@@ -0,0 +1,35 @@
+import threading
+
+
+class LatencyStats:
+    """
+    Thread-safe count/average/max/last latency figures, keyed by operation name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, seconds):
+        elapsed_ms = seconds * 1000
+        with self._lock:
+            stat = self._stats.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+            stat["count"] += 1
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+            stat["last_ms"] = elapsed_ms
+
+    def snapshot(self):
+        """
+        Returns e.g. {"freebusy.query": {"count": 3, "avg_ms": 180.2, "max_ms": 240.0, "last_ms": 150.3}}.
+        """
+        with self._lock:
+            return {
+                name: {
+                    "count": s["count"],
+                    "avg_ms": round(s["total_ms"] / s["count"], 1),
+                    "max_ms": round(s["max_ms"], 1),
+                    "last_ms": round(s["last_ms"], 1),
+                }
+                for name, s in self._stats.items()
+            }
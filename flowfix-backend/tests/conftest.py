@@ -0,0 +1,27 @@
+import importlib
+import json
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def config():
+    with open(os.path.join(BACKEND_DIR, "config.json")) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def flowfix(monkeypatch):
+    """
+    The Flask app module. It needs REDIS_URL and sets the PythonAnywhere proxy; both are undone after the test.
+    """
+    import runtime
+    monkeypatch.setattr(runtime, "REDIS_URL", "redis://localhost:6379/0")
+    monkeypatch.setenv("HTTP_PROXY", "")
+    monkeypatch.setenv("HTTPS_PROXY", "")
+    return importlib.import_module("app")
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import admission
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class ScriptedRedis:
+    """
+    Records EVAL calls; fakeredis can only run Lua with lupa installed.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def eval(self, script, numkeys, *args):
+        self.calls.append((script, args[:numkeys], args[numkeys:]))
+        return 1
+
+
+def test_release_is_one_script_call():
+    client = ScriptedRedis()
+    turns = admission.SessionTurns(dedupe_seconds=10)
+    turn = admission.SessionTurn("s1", "digest", token="abc")
+    turn.response = "Hello"
+
+    turns.release(client, turn)
+
+    assert client.calls == [
+        (admission.RELEASE_SCRIPT, ("chat_lock:s1", "chat_result:abc"), ("abc ", "1", "Hello", 10)),
+    ]
+
+
+def test_duplicate_takes_the_answer_of_the_turn_in_flight():
+    client = fakeredis.FakeRedis()
+    turns = admission.SessionTurns(wait_seconds=5)
+    answers = []
+
+    def send():
+        with turns.turn(client, "s1", "Hello") as turn:
+            if turn.duplicate is not None:
+                answers.append(turn.duplicate)
+                return
+            time.sleep(0.2)
+            turn.response = "Hi there"
+            answers.append(turn.response)
+
+    threads = [threading.Thread(target=send) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert answers == ["Hi there"] * 3
+    assert turns.stats()["duplicates"] == 2
+    assert not client.exists("chat_lock:s1")
+
+
+def test_lock_is_extended_while_the_turn_runs():
+    client = fakeredis.FakeRedis()
+    turns = admission.SessionTurns(lock_ttl=0.3)
+
+    with turns.turn(client, "s1", "Hello"):
+        time.sleep(0.7)
+        assert client.exists("chat_lock:s1")
+    assert not client.exists("chat_lock:s1")
+
+
+def test_lock_is_extended_while_the_async_turn_runs():
+    client = fakeredis.aioredis.FakeRedis()
+    turns = admission.SessionTurns(lock_ttl=0.3)
+
+    async def run():
+        async with turns.aturn(client, "s1", "Hello"):
+            await asyncio.sleep(0.7)
+            assert await client.exists("chat_lock:s1")
+        assert not await client.exists("chat_lock:s1")
+
+    asyncio.run(run())
@@ -0,0 +1,22 @@
+import pytest
+import redis
+
+import agent_tools
+import calendar_utils
+
+
+class RefreshError(Exception):
+    """Stands in for google.auth.exceptions.RefreshError."""
+
+
+@pytest.mark.parametrize("error", [ConnectionError("no calendar"), RefreshError("token expired"), redis.RedisError("connection refused")])
+def test_booking_reports_assignment_failures_instead_of_raising(monkeypatch, error):
+    def fail(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(calendar_utils, "assign_engineer", fail)
+    result = agent_tools.book_appointment.invoke({
+        "date": "2026-11-02", "time": "10:00 AM", "service_needed": "Leaky tap",
+        "customer_name": "Sam Taylor", "customer_phone": "07700 900123",
+    })
+    assert result.startswith("Sorry, I couldn't check the calendar to make the booking")
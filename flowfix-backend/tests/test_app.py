@@ -0,0 +1,66 @@
+import threading
+import time
+import types
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import admission
+import runtime
+
+
+@pytest.mark.parametrize("args, error", [
+    ({}, "No start date provided"),
+    ({"start": "2026-11-02", "duration": "0"}, "duration must be a positive number of minutes"),
+    ({"start": "2026-11-02", "limit": "0"}, "limit must be a positive number of slots"),
+    ({"start": "2026-11-02", "limit": "-1"}, "limit must be a positive number of slots"),
+])
+def test_availability_rejects_bad_arguments(flowfix, args, error):
+    assert flowfix.availability_response(MultiDict(args)) == ({"error": error}, 400)
+
+
+class BlockingAgent:
+    """
+    An agent whose turns run until `release` is set.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def invoke(self, inputs, config=None):
+        self.release.wait(5)
+        return {"output": "Sure."}
+
+
+def test_agent_turns_past_the_limit_are_queued_then_refused(flowfix, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    agent = BlockingAgent()
+    slots = admission.AgentSlots(max_active=1, max_queue=1, max_wait=5)
+    monkeypatch.setattr(runtime, "get_history_store", lambda: types.SimpleNamespace(client=fakeredis.FakeRedis()))
+    monkeypatch.setattr(runtime, "get_agent_slots", lambda: slots)
+    monkeypatch.setattr(runtime, "get_conversational_agent", lambda: agent)
+    monkeypatch.setattr(runtime, "start_background_tasks", lambda: None)
+    client = flowfix.create_app().test_client()
+    statuses = {}
+
+    def chat(session_id):
+        statuses[session_id] = client.post("/chat", json={"message": "My boiler is leaking", "session_id": session_id}).status_code
+
+    running = [threading.Thread(target=chat, args=(session_id,)) for session_id in ("s1", "s2")]
+    for started, thread in enumerate(running, start=1):
+        thread.start()
+        while slots.stats().get("admitted", 0) + slots.stats().get("queued", 0) < started:
+            time.sleep(0.01)
+
+    refused = client.post("/chat", json={"message": "My boiler is leaking", "session_id": "s3"})
+    agent.release.set()
+    for thread in running:
+        thread.join()
+
+    assert slots.stats()["queued"] == 1
+    assert refused.status_code == 429 and int(refused.headers["Retry-After"]) >= 1
+    assert statuses == {"s1": 200, "s2": 200}
+
+
+def test_default_agent_limits_leave_a_request_thread_free():
+    assert runtime.AGENT_MAX_CONCURRENCY + runtime.AGENT_MAX_QUEUE < runtime.WORKER_THREADS
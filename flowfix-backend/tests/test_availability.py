@@ -0,0 +1,106 @@
+import datetime
+import random
+
+import pytest
+import pytz
+
+import availability
+
+TZ = pytz.timezone("Europe/London")
+OPEN = datetime.time(9, 0)
+CLOSE = datetime.time(17, 0)
+
+
+def reference_slots(busy, start_date, end_date, business_start, business_end, duration_minutes=60,
+                    step_minutes=30, limit=None, not_before=None):
+    """
+    Brute force: every candidate on the step grid from opening time, checked against every raw
+    busy interval with aware datetimes. No sorting, merging or timestamps.
+    """
+    duration = datetime.timedelta(minutes=duration_minutes)
+    step = datetime.timedelta(minutes=step_minutes)
+    intervals = [(datetime.datetime.fromisoformat(b["start"]), datetime.datetime.fromisoformat(b["end"])) for b in busy]
+    slots = []
+    day = start_date
+    while day <= end_date:
+        candidate = TZ.localize(datetime.datetime.combine(day, business_start))
+        closes = TZ.localize(datetime.datetime.combine(day, business_end))
+        while candidate + duration <= closes:
+            clash = any(candidate < end and candidate + duration > start for start, end in intervals)
+            if not clash and (not_before is None or candidate >= not_before):
+                slots.append(candidate)
+            candidate += step
+        day += datetime.timedelta(days=1)
+    return slots[:limit] if limit else slots
+
+
+def random_busy(rng, start_date, days, events):
+    """
+    Random bookings over the whole day (not only business hours), overlapping freely, written
+    with either a UTC or a London offset like Google can return them.
+    """
+    first = TZ.localize(datetime.datetime.combine(start_date, datetime.time.min))
+    busy = []
+    for _ in range(events):
+        start = first + datetime.timedelta(minutes=5 * rng.randrange(days * 24 * 12))
+        end = start + datetime.timedelta(minutes=5 * rng.randrange(1, 25))
+        tz = rng.choice([pytz.utc, TZ])
+        busy.append({"start": tz.normalize(start.astimezone(tz)).isoformat(), "end": tz.normalize(end.astimezone(tz)).isoformat()})
+    return busy
+
+
+def engine_slots(busy, start_date, end_date, business_start, business_end, **kwargs):
+    return availability.find_free_slots(
+        availability.parse_busy_intervals(busy), TZ, start_date, end_date, business_start, business_end, **kwargs
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_brute_force_on_random_calendars(seed):
+    rng = random.Random(seed)
+    start_date = datetime.date(2026, 11, 2)
+    days = rng.randint(1, 7)
+    end_date = start_date + datetime.timedelta(days=days - 1)
+    busy = random_busy(rng, start_date, days, days * rng.choice([0, 2, 5, 10]))
+    kwargs = {
+        "duration_minutes": rng.choice([30, 60, 90, 135]),
+        "step_minutes": rng.choice([15, 30, 45]),
+        "limit": rng.choice([None, None, 3]),
+        "not_before": rng.choice([None, TZ.localize(datetime.datetime.combine(start_date, datetime.time(11, 7)))]),
+    }
+    assert engine_slots(busy, start_date, end_date, OPEN, CLOSE, **kwargs) == \
+        reference_slots(busy, start_date, end_date, OPEN, CLOSE, **kwargs)
+
+
+@pytest.mark.parametrize("day", [datetime.date(2026, 10, 25), datetime.date(2026, 3, 29)], ids=["clocks-back", "clocks-forward"])
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_brute_force_across_a_dst_change(day, seed):
+    # Opening hours that span the 01:00-02:00 change, so the day has 25 or 23 hours.
+    rng = random.Random(seed)
+    busy = random_busy(rng, day - datetime.timedelta(days=1), 3, 30)
+    for opens, closes in [(datetime.time(0, 0), datetime.time(6, 0)), (OPEN, CLOSE)]:
+        assert engine_slots(busy, day, day, opens, closes, step_minutes=30) == \
+            reference_slots(busy, day, day, opens, closes, step_minutes=30)
+
+
+def test_clocks_back_day_offers_the_repeated_hour():
+    day = datetime.date(2026, 10, 25)
+    slots = engine_slots([], day, day, datetime.time(0, 0), datetime.time(4, 0))
+    # 00:00 to 04:00 London is five real hours on this day: 9 hourly slots on a 30-minute grid.
+    assert len(slots) == 9
+    assert [s.astimezone(pytz.utc).hour for s in slots[::2]] == [23, 0, 1, 2, 3]
+
+
+def test_matches_brute_force_on_a_dense_day():
+    # Like the benchmark's worst case: over a hundred overlapping bookings on one day, a few gaps left.
+    day = datetime.date(2026, 11, 2)
+    busy = random_busy(random.Random(7), day, 1, 150)
+    assert engine_slots(busy, day, day, datetime.time(0, 0), datetime.time(23, 59), step_minutes=5, duration_minutes=5) == \
+        reference_slots(busy, day, day, datetime.time(0, 0), datetime.time(23, 59), step_minutes=5, duration_minutes=5)
+
+
+def test_fully_booked_day_has_no_slots():
+    day = datetime.date(2026, 11, 2)
+    busy = [{"start": TZ.localize(datetime.datetime.combine(day, OPEN)).isoformat(),
+             "end": TZ.localize(datetime.datetime.combine(day, CLOSE)).isoformat()}]
+    assert engine_slots(busy, day, day, OPEN, CLOSE) == []
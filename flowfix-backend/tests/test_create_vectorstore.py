@@ -0,0 +1,26 @@
+import os
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import create_vectorstore
+import embedding_backends
+import index_builds
+
+
+def test_empty_knowledge_base_leaves_the_live_build_alone(monkeypatch, tmp_path, capsys):
+    index_root = tmp_path / "faiss_index"
+    index_root.mkdir()
+    (index_root / index_builds.CURRENT_FILE).write_text("build-1")
+    for name in ("HTTP_PROXY", "HTTPS_PROXY"):
+        monkeypatch.setenv(name, "")
+    monkeypatch.setenv("EMBEDDING_BACKEND", "fastembed")
+    monkeypatch.setattr(embedding_backends, "create", lambda backend, model: DeterministicFakeEmbedding(size=8))
+    monkeypatch.setattr(create_vectorstore, "FAISS_INDEX_PATH", str(index_root))
+    monkeypatch.setattr(create_vectorstore, "EMBEDDING_CACHE_PATH", str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(create_vectorstore, "load_chunks", lambda: {})
+
+    create_vectorstore.main()
+
+    assert "nothing to index" in capsys.readouterr().out
+    assert (index_root / index_builds.CURRENT_FILE).read_text() == "build-1"
+    assert os.listdir(index_root) == [index_builds.CURRENT_FILE]
@@ -0,0 +1,113 @@
+import datetime
+
+import pytest
+
+import calendar_utils
+import engineers
+from emergency_watcher import EmergencyWatcher
+
+NOW = datetime.datetime.now(datetime.timezone.utc)
+ENGINEERS = [engineers.Engineer("Alex", "alex@example.com"), engineers.Engineer("Bea", "bea@example.com"), engineers.Engineer("Cal", "cal@example.com")]
+
+
+class FakeEventsService:
+    """
+    Just enough of the Calendar service for events().list() inside batch requests.
+    `blocked` maps calendar id -> hours from now of an emergency block; `unreadable` calendars fail.
+    """
+
+    def __init__(self, blocked=(), unreadable=()):
+        self.blocked = dict(blocked)
+        self.unreadable = set(unreadable)
+        self.batches = []
+
+    def events(self):
+        return self
+
+    def list(self, calendarId, **kwargs):
+        return calendarId
+
+    def new_batch_http_request(self, callback):
+        service = self
+
+        class Batch:
+            def __init__(self):
+                self.ids = []
+
+            def add(self, request, request_id=None):
+                self.ids.append(request_id)
+
+            def execute(self, http=None):
+                service.batches.append(self.ids)
+                for calendar_id in self.ids:
+                    if calendar_id in service.unreadable:
+                        callback(calendar_id, None, RuntimeError("forbidden"))
+                        continue
+                    items = []
+                    if calendar_id in service.blocked:
+                        start = NOW + datetime.timedelta(hours=service.blocked[calendar_id])
+                        items.append({"start": {"dateTime": start.isoformat()}, "end": {"dateTime": (start + datetime.timedelta(hours=2)).isoformat()}})
+                    callback(calendar_id, {"items": items}, None)
+
+        return Batch()
+
+
+class FakeClient:
+    def __init__(self, service):
+        self._service = service
+
+    def service(self):
+        return self._service
+
+    def execute(self, name, request):
+        return request.execute()
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    def install(**kwargs):
+        service = FakeEventsService(**kwargs)
+        monkeypatch.setattr(calendar_utils, "calendar_client", FakeClient(service))
+        monkeypatch.setattr(calendar_utils, "ENGINEERS", ENGINEERS)
+        monkeypatch.setattr(calendar_utils.emergency_watcher, "is_blocked", lambda hours: None)
+        return service
+    return install
+
+
+def test_blocks_are_listed_per_engineer_calendar_in_batches(calendar, monkeypatch):
+    monkeypatch.setattr(calendar_utils, "EVENTS_BATCH_MAX", 2)
+    service = calendar(blocked={"bea@example.com": 0}, unreadable={"cal@example.com"})
+
+    blocks = calendar_utils.list_emergency_blocks(NOW, NOW + datetime.timedelta(hours=2))
+
+    assert service.batches == [["alex@example.com", "bea@example.com"], ["cal@example.com"]]
+    assert blocks["alex@example.com"] == []
+    assert len(blocks["bea@example.com"]) == 1
+    # An unreadable calendar counts as blocked for the whole window.
+    assert blocks["cal@example.com"] == [{"start": NOW.isoformat(), "end": (NOW + datetime.timedelta(hours=2)).isoformat()}]
+
+
+@pytest.mark.parametrize("blocked, expected", [
+    ({}, False),
+    ({"alex@example.com": 0, "bea@example.com": 0}, False),
+    ({"alex@example.com": 0, "bea@example.com": 0, "cal@example.com": 1}, True),
+    # Cal's block starts after the window, so Cal can still take the call-out.
+    ({"alex@example.com": 0, "bea@example.com": 0, "cal@example.com": 3}, False),
+])
+def test_emergency_capacity_is_available_while_any_engineer_is_free(calendar, blocked, expected):
+    calendar(blocked=blocked)
+    assert calendar_utils.check_for_emergency_blocks(hours_to_check=2) is expected
+
+
+@pytest.mark.parametrize("blocked, expected", [
+    ({"alex@example.com": 0, "bea@example.com": 0}, False),
+    ({"alex@example.com": 0, "bea@example.com": 0, "cal@example.com": 1}, True),
+])
+def test_watcher_snapshot_is_blocked_only_when_every_engineer_is(calendar, monkeypatch, blocked, expected):
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    calendar(blocked=blocked)
+    watcher = EmergencyWatcher(calendar_utils.list_emergency_blocks, horizon_hours=6)
+
+    watcher.poll()
+
+    assert watcher.is_blocked(2) is expected
@@ -0,0 +1,139 @@
+import datetime
+import threading
+import time
+
+import pytest
+import pytz
+
+import freebusy_cache
+from freebusy_cache import FreeBusyCache
+
+TZ = pytz.timezone("Europe/London")
+MONDAY = datetime.date(2026, 11, 2)
+
+
+def at(day, hour):
+    return TZ.localize(datetime.datetime.combine(day, datetime.time(hour)))
+
+
+class Calendar:
+    """
+    A freebusy query that counts its calls and can run something while it is "in flight".
+    """
+
+    def __init__(self, delay=0.0):
+        self.busy = {"eng1": []}
+        self.delay = delay
+        self.calls = 0
+        self.during = None
+
+    def __call__(self, calendar_ids, time_min, time_max):
+        self.calls += 1
+        answer = {calendar_id: list(self.busy.get(calendar_id, [])) for calendar_id in calendar_ids}
+        if self.during:
+            self.during()
+        time.sleep(self.delay)
+        return answer
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    if request.param == "memory":
+        return freebusy_cache._MemoryBackend()
+    fakeredis = pytest.importorskip("fakeredis")
+    return freebusy_cache._RedisBackend(fakeredis.FakeRedis())
+
+
+def make_cache(calendar, backend):
+    cache = FreeBusyCache(calendar, TZ)
+    cache._get_backend = lambda: backend
+    return cache
+
+
+def test_booking_made_during_a_fetch_is_not_lost(backend):
+    calendar = Calendar()
+    cache = make_cache(calendar, backend)
+    booked = {"start": at(MONDAY, 10).isoformat(), "end": at(MONDAY, 11).isoformat()}
+
+    def book():
+        # The event is created after the query has read the calendar, and before its result is cached.
+        calendar.busy["eng1"].append(booked)
+        cache.add_busy("eng1", at(MONDAY, 10), at(MONDAY, 11))
+
+    calendar.during = book
+    cache.get_busy("eng1", MONDAY)
+    calendar.during = None
+
+    assert cache.get_busy("eng1", MONDAY) == [booked]
+    assert cache.get_busy("eng1", MONDAY + datetime.timedelta(days=1)) == []
+    assert calendar.calls == 1
+
+
+def test_concurrent_misses_in_one_window_share_a_query(backend):
+    calendar = Calendar(delay=0.2)
+    cache = make_cache(calendar, backend)
+    results = {}
+
+    def read(day):
+        results[day] = cache.get_busy("eng1", day)
+
+    days = [MONDAY, MONDAY + datetime.timedelta(days=2)]
+    threads = [threading.Thread(target=read, args=(day,)) for day in days]
+    threads[0].start()
+    time.sleep(0.05)
+    threads[1].start()
+    for thread in threads:
+        thread.join()
+
+    assert calendar.calls == 1
+    assert results == {day: [] for day in days}
+
+
+def test_failed_shared_fetch_is_retried_by_the_waiter(backend):
+    calendar = Calendar(delay=0.2)
+    cache = make_cache(calendar, backend)
+    failures = []
+
+    def fail_first(calendar_ids, time_min, time_max):
+        if calendar.calls == 0:
+            calendar.calls += 1
+            time.sleep(0.2)
+            raise ConnectionError("calendar down")
+        return calendar(calendar_ids, time_min, time_max)
+
+    cache.fetch_busy = fail_first
+
+    def first():
+        try:
+            cache.get_busy("eng1", MONDAY)
+        except ConnectionError as e:
+            failures.append(e)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    time.sleep(0.05)
+    assert cache.get_busy("eng1", MONDAY) == []
+    thread.join()
+
+    assert len(failures) == 1
+    assert calendar.calls == 2
+
+
+@pytest.mark.parametrize("apart, queries", [(7, 1), (40, 2)])
+def test_misses_at_the_same_moment_share_a_query_when_close(backend, apart, queries):
+    calendar = Calendar(delay=0.05)
+    cache = make_cache(calendar, backend)
+    days = [MONDAY, MONDAY + datetime.timedelta(days=apart)]
+    barrier = threading.Barrier(len(days))
+
+    def read(day):
+        barrier.wait()
+        cache.get_busy("eng1", day)
+
+    threads = [threading.Thread(target=read, args=(day,)) for day in days]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calendar.calls == queries
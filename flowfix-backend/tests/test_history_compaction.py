@@ -0,0 +1,37 @@
+import pytest
+
+from history_compaction import HistoryCompactor
+
+
+@pytest.fixture
+def compactor(config):
+    return HistoryCompactor(config)
+
+
+@pytest.mark.parametrize("text", [
+    "This is Urgent, water is coming through the ceiling",
+    "I am Looking for someone to fix a leak",
+    "It's Broken again",
+])
+def test_phrases_that_are_not_names(compactor, text):
+    assert "name" not in compactor.extract_slots(text)
+
+
+@pytest.mark.parametrize("text, previous", [
+    ("My name is Sam Taylor", None),
+    ("It's Sam Taylor", "Great, can I take your name?"),
+    ("Sam Taylor", "And what's your full name?"),
+])
+def test_names(compactor, text, previous):
+    assert compactor.extract_slots(text, previous)["name"] == "Sam Taylor"
+
+
+def test_booking_details(compactor):
+    slots = compactor.extract_slots("Leaky taps at CV3 5FB, call me on 07700 900123 tomorrow at 10am")
+    assert slots == {
+        "phone": "07700 900123",
+        "postcode": "CV3 5FB",
+        "date": "tomorrow",
+        "time": "10am",
+        "service": "Leaky Tap Repair",
+    }
@@ -0,0 +1,53 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import hybrid_retrieval
+from semantic_cache import SemanticCache
+
+FAISS = pytest.importorskip("langchain_community.vectorstores").FAISS
+
+CHUNKS = [
+    "We are Gas Safe registered.",
+    "Our business hours are 9am to 5pm.",
+    "We cover Coventry CV1 to CV6.",
+]
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def embeddings():
+    return CountingEmbedding(size=16)
+
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid"])
+def test_cache_miss_embeds_the_question_once(embeddings, mode):
+    retriever = hybrid_retrieval.HybridRetriever.from_vector_store(FAISS.from_texts(CHUNKS, embeddings), k=2, mode=mode)
+    cache = SemanticCache(embeddings.embed_query)
+    query = "Are you Gas Safe?"
+    expected = retriever.invoke(query)
+    embeddings.calls = 0
+
+    answer, vector = cache.lookup(query)
+    with hybrid_retrieval.query_embedding(query, vector):
+        documents = retriever.invoke(query)
+
+    assert answer is None
+    assert embeddings.calls == 1
+    assert documents == expected
+
+
+def test_embedding_is_only_used_for_its_own_query(embeddings):
+    retriever = hybrid_retrieval.HybridRetriever.from_vector_store(FAISS.from_texts(CHUNKS, embeddings), mode="dense")
+    embeddings.calls = 0
+
+    with hybrid_retrieval.query_embedding("Are you Gas Safe?", embeddings.embed_documents(["x"])[0]):
+        retriever.invoke("When are you open?")
+
+    assert embeddings.calls == 1
@@ -0,0 +1,75 @@
+import pytest
+
+from router import FastPathRouter
+
+
+@pytest.fixture
+def router(config):
+    return FastPathRouter(config)
+
+
+@pytest.mark.parametrize("message", [
+    "What's your number?",
+    "what is your phone number",
+    "How can I call you?",
+])
+def test_phone_questions_are_answered(router, config, message):
+    assert config["business_phone_number"] in router.route(message)
+
+
+@pytest.mark.parametrize("message", [
+    "When are you open?",
+    "What are your opening hours?",
+])
+def test_hours_questions_are_answered(router, message):
+    assert router.route(message) is not None
+
+
+@pytest.mark.parametrize("message", [
+    "my phone number is 07700 900123",
+    "Sure, my mobile number is 07700900123",
+    "John Smith, contact number 024 7600 1234",
+    "Sure, my mobile number is",
+    "John Smith, contact number",
+])
+def test_customer_details_go_to_the_agent(router, message):
+    assert router.route(message) is None
+
+
+@pytest.mark.parametrize("message", [
+    "what is the total cost going to be?",
+    "no the quote is fine",
+])
+def test_price_of_the_job_in_hand_goes_to_the_agent(router, message):
+    assert router.route(message) is None
+
+
+def test_message_with_a_full_postcode_goes_to_the_agent(router):
+    assert router.route("It's 12 High Street, CV3 5FB") is None
+    assert router.route("what are your opening hours? I'm at CV1 2AB") is None
+
+
+@pytest.mark.parametrize("previous", [
+    "Great, can I take your name and phone number?",
+    "What's the best contact number to reach you on?",
+    "Please confirm the booking details below.",
+])
+def test_reply_to_a_request_for_details_goes_to_the_agent(router, previous):
+    assert router.route("What's your number?") is not None
+    assert router.route("What's your number?", previous=previous) is None
+
+
+@pytest.mark.parametrize("message", [
+    "phone number and opening hours",
+    "What's your number? And when are you open?",
+    "what's your phone number and what are your hours",
+    "How can I call you, and do you cover CV3?",
+])
+def test_more_than_one_question_goes_to_the_agent(router, message):
+    assert router.route(message) is None
+
+
+def test_fall_throughs_are_counted(router):
+    router.route("my phone number is 07700 900123")
+    router.route("What's your number?")
+    assert router.stats() == {"fell_through": 1, "phone": 1}
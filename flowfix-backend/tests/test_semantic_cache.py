@@ -0,0 +1,26 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from semantic_cache import SemanticCache
+
+
+def test_answer_from_before_a_new_build_is_not_cached():
+    cache = SemanticCache(DeterministicFakeEmbedding(size=16).embed_query, version="build-1")
+    version = cache.version
+    answer, vector = cache.lookup("Are you Gas Safe?")
+    assert answer is None
+
+    # The knowledge base is replaced while the old build is still answering.
+    cache.set_version("build-2")
+    cache.store("Are you Gas Safe?", vector, "Old answer.", 1.0, version)
+
+    assert cache.lookup("Are you Gas Safe?")[0] is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_answer_is_cached_when_the_version_is_unchanged():
+    cache = SemanticCache(DeterministicFakeEmbedding(size=16).embed_query, version="build-1")
+    version = cache.version
+    _, vector = cache.lookup("Are you Gas Safe?")
+    cache.store("Are you Gas Safe?", vector, "Yes.", 1.0, version)
+
+    assert cache.lookup("are you gas safe")[0] == "Yes."
@@ -0,0 +1,23 @@
+import pytest
+
+import runtime
+import service_area
+
+
+@pytest.fixture
+def coverage(config):
+    return service_area.CoverageIndex(config, service_area.load_centroids(runtime.CENTROIDS_PATH))
+
+
+@pytest.mark.parametrize("text, postcode", [
+    ("cv3 5fb", "CV3 5FB"),
+    ("CV1 2AB, Coventry", "CV1 2AB"),
+    ("12 High Street, CV3 5FB", "CV3 5FB"),
+])
+def test_lookup_finds_the_postcode_in_an_address(coverage, text, postcode):
+    area = coverage.lookup(text)
+    assert area is not None and area.postcode == postcode and area.covered
+
+
+def test_lookup_without_a_postcode(coverage):
+    assert coverage.lookup("12 High Street, Coventry") is None
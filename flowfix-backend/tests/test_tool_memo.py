@@ -0,0 +1,68 @@
+import pytest
+from langchain_core.agents import AgentAction, AgentStep
+
+import tool_memo
+from tool_memo import ToolMemo
+
+SLOTS = AgentAction("find_available_appointment_slots", {"date": "2026-11-02"}, "")
+FAQ = AgentAction("get_general_information", {"query": "Are you Gas Safe?"}, "")
+BOOKING = AgentAction("book_appointment", {"date": "2026-11-02", "time": "10:00"}, "")
+
+
+@pytest.fixture(params=["memory", "redis"])
+def memo(request):
+    memo = ToolMemo(
+        {"find_available_appointment_slots": 60, "get_general_information": 300},
+        invalidated_by=("book_appointment",),
+        calendar_tools=("find_available_appointment_slots",),
+    )
+    if request.param == "memory":
+        backend = tool_memo._MemoryBackend()
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        backend = tool_memo._RedisBackend(fakeredis.FakeRedis())
+    memo._get_backend = lambda: backend
+    return memo
+
+
+def run(memo, session_id, action, observation):
+    """
+    One agent step: look the call up, "run" it on a miss, and remember the result.
+    """
+    [remembered] = memo.lookup(session_id, [action])
+    memo.remember(session_id, [] if remembered is not None else [AgentStep(action=action, observation=observation)])
+    return remembered
+
+
+def test_results_are_reused_within_a_session(memo):
+    assert run(memo, "a", SLOTS, "9am, 10am") is None
+    assert run(memo, "a", SLOTS, "9am, 10am") == "9am, 10am"
+    assert run(memo, "b", SLOTS, "9am, 10am") is None
+
+
+def test_a_booking_in_one_session_invalidates_slots_in_every_session(memo):
+    answer = "Yes, we are Gas Safe registered."
+    run(memo, "a", SLOTS, "9am, 10am")
+    run(memo, "a", FAQ, answer)
+    run(memo, "b", FAQ, answer)
+
+    run(memo, "b", BOOKING, "Booking confirmed.")
+
+    assert run(memo, "a", SLOTS, "9am") is None
+    assert run(memo, "a", SLOTS, "9am") == "9am"
+    # Knowledge base answers don't depend on the calendar; only the booking session's own memo is cleared.
+    assert run(memo, "a", FAQ, answer) == answer
+    assert run(memo, "b", FAQ, answer) is None
+
+
+def test_slots_read_before_a_booking_and_stored_after_it_are_not_reused(memo):
+    [missed] = memo.lookup("a", [SLOTS])
+    run(memo, "b", BOOKING, "Booking confirmed.")
+    memo.remember("a", [AgentStep(action=SLOTS, observation="9am, 10am")])
+
+    assert run(memo, "a", SLOTS, "9am") is None
+
+
+def test_failures_are_not_remembered(memo):
+    run(memo, "a", SLOTS, "There was an error finding slots: timeout")
+    assert run(memo, "a", SLOTS, "9am") is None
@@ -0,0 +1,109 @@
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.agents import AgentActionMessageLog, AgentFinish
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+
+import tracing
+from parallel_agent import ParallelAgentExecutor
+
+
+@tool
+def check_slots(date: str) -> str:
+    """Free slots on a date."""
+    return f"9am on {date}"
+
+
+def plan(inputs):
+    if inputs["intermediate_steps"]:
+        return AgentFinish({"output": "done"}, "done")
+    return [
+        AgentActionMessageLog(tool="check_slots", tool_input={"date": date}, log="", message_log=[AIMessage(content="")])
+        for date in ("monday", "tuesday")
+    ]
+
+
+@pytest.fixture
+def tool_pool():
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+
+def _executor(tool_pool):
+    return ParallelAgentExecutor(agent=RunnableLambda(plan), tools=[check_slots], tool_pool=tool_pool)
+
+
+def test_parallel_executor_records_agent_iterations(tool_pool):
+    trace = tracing.Trace("/chat", "s1")
+    _executor(tool_pool).invoke({"input": "slots?"}, config={"callbacks": [trace.callback()]})
+
+    assert trace.iterations == 2
+    assert [s["iteration"] for s in trace.spans if s["kind"] == "agent_iteration"] == [1, 2]
+    assert [s["name"] for s in trace.spans if s["kind"] == "tool"] == ["check_slots", "check_slots"]
+
+
+def test_parallel_executor_records_agent_iterations_async(tool_pool):
+    trace = tracing.Trace("/chat", "s1")
+    asyncio.run(_executor(tool_pool).ainvoke({"input": "slots?"}, config={"callbacks": [trace.callback()]}))
+
+    assert trace.iterations == 2
+    assert len([s for s in trace.spans if s["kind"] == "agent_iteration"]) == 2
+
+
+def _model(input_tokens):
+    usage = {"input_tokens": input_tokens, "output_tokens": 1, "total_tokens": input_tokens + 1}
+    return GenericFakeChatModel(messages=itertools.repeat(AIMessage(content="ok", usage_metadata=usage)))
+
+
+@tool
+def ask_knowledge_base(question: str) -> str:
+    """Answers from the knowledge base with its own model call."""
+    return _model(7).invoke(question).content
+
+
+def test_tool_model_tokens_are_counted_apart_from_the_agents(tool_pool):
+    agent_model = _model(100)
+
+    def plan_with_model(inputs):
+        agent_model.invoke(inputs["input"])
+        if inputs["intermediate_steps"]:
+            return AgentFinish({"output": "done"}, "done")
+        return [AgentActionMessageLog(tool="ask_knowledge_base", tool_input={"question": "hours?"}, log="", message_log=[AIMessage(content="")])]
+
+    executor = ParallelAgentExecutor(agent=RunnableLambda(plan_with_model), tools=[ask_knowledge_base], tool_pool=tool_pool)
+    trace = tracing.Trace("/chat", "s1")
+    executor.invoke({"input": "opening hours?"}, config={"callbacks": [trace.callback()]})
+
+    assert trace.tokens == {"agent": {"input": 200, "output": 2}, "tools": {"input": 7, "output": 1}}
+
+
+def _turn_count(route):
+    return tracing.REGISTRY.get_sample_value("flowfix_turn_seconds_count", {"endpoint": "test_stream", "route": route}) or 0
+
+
+def test_closed_stream_is_recorded_as_disconnected_not_error():
+    def stream():
+        with tracing.turn("test_stream", "s1"):
+            yield "token"
+            yield "token"
+
+    before = _turn_count("disconnected"), _turn_count("error")
+    events = stream()
+    next(events)
+    events.close()  # What the server does when the client goes away mid-stream.
+
+    assert (_turn_count("disconnected"), _turn_count("error")) == (before[0] + 1, before[1])
+
+
+def test_failed_turn_is_recorded_as_error():
+    before = _turn_count("error")
+    with pytest.raises(RuntimeError):
+        with tracing.turn("test_stream", "s1"):
+            raise RuntimeError("boom")
+
+    assert _turn_count("error") == before + 1
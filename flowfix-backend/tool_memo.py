@@ -0,0 +1,233 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import threading
+import time
+
+import redis_clients
+import tracing
+
+KEY_PREFIX = "tool_memo:"
+# Bumped by every booking, in any session; results of calendar tools from an older one are stale.
+GENERATION_KEY = "tool_memo:calendar_generation"
+
+# Observations that report a failure rather than an answer; these are never reused.
+FAILURE_MARKERS = ("error", "not available")
+
+_current_session = contextvars.ContextVar("flowfix_tool_memo_session", default=None)
+
+
+@contextlib.contextmanager
+def session(session_id):
+    """
+    Makes `session_id` the session whose memo the agent's tool calls use until the block ends.
+    """
+    token = _current_session.set(session_id)
+    try:
+        yield
+    finally:
+        try:
+            _current_session.reset(token)
+        except ValueError:
+            # Streamed turns can be closed from a different context than the one that opened them.
+            pass
+
+
+def current_session():
+    return _current_session.get()
+
+
+def _normalise(value):
+    if isinstance(value, str):
+        return " ".join(value.split()).lower()
+    if isinstance(value, dict):
+        return {k: _normalise(v) for k, v in value.items()}
+    return value
+
+
+def call_key(tool, tool_input):
+    """
+    The memo field for one tool call. Arguments differing only in case or spacing share it.
+    """
+    args = json.dumps(_normalise(tool_input), sort_keys=True, default=str)
+    return f"{tool}:{hashlib.sha1(args.encode()).hexdigest()[:16]}"
+
+
+class _MemoryBackend:
+    """
+    In-process store used when no Redis server is configured.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # key -> (expires at, {field: value})
+        self._generation = 0
+
+    def get_many(self, key, fields):
+        """
+        Returns the fields' values and the current calendar generation.
+        """
+        with self._lock:
+            expires_at, entries = self._sessions.get(key, (0, {}))
+            if expires_at <= time.monotonic():
+                entries = {}
+            return [entries.get(field) for field in fields], self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+
+    def set_many(self, key, items, ttl):
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._sessions:
+                for expired in [k for k, (expires_at, _) in self._sessions.items() if expires_at <= now]:
+                    del self._sessions[expired]
+            expires_at, entries = self._sessions.get(key, (0, {}))
+            if expires_at <= now:
+                entries = {}
+            entries.update(items)
+            self._sessions[key] = (now + ttl, entries)
+
+    def delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+
+class _RedisBackend:
+    """
+    One Redis hash per session (call key -> JSON [expires at, observation]). Entries carry their
+    own expiry; the hash as a whole expires once the longest-lived one could have, and clearing
+    a session's memo is a single DEL.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def get_many(self, key, fields):
+        pipe = self._client.pipeline(transaction=False)
+        pipe.hmget(key, fields)
+        pipe.get(GENERATION_KEY)
+        with tracing.span("redis", "tool_memo.get", calls=len(fields)):
+            values, generation = pipe.execute()
+        return values, int(generation or 0)
+
+    def bump_generation(self):
+        with tracing.span("redis", "tool_memo.bump"):
+            self._client.incr(GENERATION_KEY)
+
+    def set_many(self, key, items, ttl):
+        pipe = self._client.pipeline(transaction=False)
+        pipe.hset(key, mapping=items)
+        pipe.expire(key, ttl)
+        with tracing.span("redis", "tool_memo.set", calls=len(items)):
+            pipe.execute()
+
+    def delete(self, key):
+        with tracing.span("redis", "tool_memo.clear"):
+            self._client.delete(key)
+
+
+class ToolMemo:
+    """
+    Remembers the results of read-only agent tools per session, for a few seconds to minutes,
+    so the agent asking for the same slots (or the same FAQ) again within a conversation doesn't
+    repeat the calendar query or the knowledge base chain. `ttls` maps each memoized tool to how
+    long its results are reused; calls to the tools in `invalidated_by` (a booking) clear the
+    session's memo, since they change what the read tools would now say.
+
+    A booking also changes the calendar every other session sees. Results of the tools in
+    `calendar_tools` are stored with the calendar generation read before they ran, which any
+    invalidating call bumps (shared through Redis), and are only reused while it is current.
+    """
+
+    def __init__(self, ttls, invalidated_by=(), calendar_tools=(), redis_url=None):
+        self.ttls = dict(ttls)
+        self.invalidated_by = set(invalidated_by)
+        self.calendar_tools = set(calendar_tools)
+        self.redis_url = redis_url
+        self._backend = redis_clients.LazyBackend(_RedisBackend, _MemoryBackend, redis_url)
+        self._lock = threading.Lock()
+        self._generations = {}  # session -> calendar generation read by its first lookup since the last remember()
+        self._hits = 0
+        self._misses = 0
+
+    def _get_backend(self):
+        return self._backend.get()
+
+    def lookup(self, session_id, actions):
+        """
+        Returns the remembered observation for each action (None where there is none).
+        """
+        wanted = [(i, call_key(a.tool, a.tool_input)) for i, a in enumerate(actions) if a.tool in self.ttls]
+        observations = [None] * len(actions)
+        if not session_id or not wanted:
+            return observations
+        try:
+            found, generation = self._get_backend().get_many(KEY_PREFIX + session_id, [field for _, field in wanted])
+        except Exception as e:
+            print(f"Tool memo lookup failed: {e}")
+            return observations
+        with self._lock:
+            self._generations.setdefault(session_id, generation)
+        now = time.time()
+        for (i, _), value in zip(wanted, found):
+            entry = json.loads(value) if value is not None else None
+            if entry and len(entry) == 3:
+                expires_at, stored_generation, observation = entry
+                if expires_at > now and stored_generation in (None, generation):
+                    observations[i] = observation
+            tracing.TOOL_MEMO.labels(actions[i].tool, "hit" if observations[i] is not None else "miss").inc()
+        with self._lock:
+            hits = sum(1 for i, _ in wanted if observations[i] is not None)
+            self._hits += hits
+            self._misses += len(wanted) - hits
+        return observations
+
+    def remember(self, session_id, steps):
+        """
+        Stores the read tools' new observations from one agent step, then clears the session's
+        memo if the step also ran a tool that invalidates it.
+        """
+        if not session_id:
+            return
+        with self._lock:
+            generation = self._generations.pop(session_id, None)
+        items = {}
+        now = time.time()
+        for step in steps:
+            tool = step.action.tool
+            if tool not in self.ttls or not _reusable(step.observation):
+                continue
+            if tool in self.calendar_tools:
+                if generation is None:
+                    continue  # Not known which calendar state it was read from.
+                value = [now + self.ttls[tool], generation, step.observation]
+            else:
+                value = [now + self.ttls[tool], None, step.observation]
+            items[call_key(tool, step.action.tool_input)] = json.dumps(value)
+        try:
+            if any(step.action.tool in self.invalidated_by for step in steps):
+                self._get_backend().bump_generation()
+                self._get_backend().delete(KEY_PREFIX + session_id)
+            elif items:
+                self._get_backend().set_many(KEY_PREFIX + session_id, items, max(self.ttls.values()))
+        except Exception as e:
+            print(f"Tool memo update failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else None,
+            }
+
+
+def _reusable(observation):
+    if not isinstance(observation, str):
+        return False
+    lowered = observation.lower()
+    return not any(marker in lowered for marker in FAILURE_MARKERS)
@@ -0,0 +1,203 @@
+import asyncio
+import contextlib
+import contextvars
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+# --- METRICS ---
+# Exposed on /metrics. Under a preforking server, set PROMETHEUS_MULTIPROC_DIR so every worker's
+# figures are aggregated (see gunicorn.conf.py).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+
+TURN_SECONDS = Histogram(
+    "flowfix_turn_seconds", "Time to answer one chat turn.", ["endpoint", "route"], buckets=LATENCY_BUCKETS,
+)
+SPAN_SECONDS = Histogram(
+    "flowfix_span_seconds",
+    "Time spent in one step of a turn: admission, redis, history, agent_iteration, llm, tool or calendar.",
+    ["kind", "name"],
+    buckets=LATENCY_BUCKETS,
+)
+SPAN_ERRORS = Counter("flowfix_span_errors_total", "Steps that raised an error.", ["kind", "name"])
+LLM_TOKENS = Counter("flowfix_llm_tokens_total", "Tokens sent to and received from the LLM.", ["name", "direction"])
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000)
+TURN_PROMPT_TOKENS = Histogram(
+    "flowfix_turn_prompt_tokens",
+    "Prompt (input) tokens sent to the LLM over one agent turn: by the agent itself (agent) "
+    "or by model calls inside its tools, such as the knowledge base chain (tools).",
+    ["source"],
+    buckets=TOKEN_BUCKETS,
+)
+HISTORY_TOKENS = Histogram(
+    "flowfix_history_tokens",
+    "Estimated tokens of chat history per turn: the whole session (full) and what the prompt gets after compaction (sent).",
+    ["stage"],
+    buckets=TOKEN_BUCKETS,
+)
+ADMISSION_REJECTIONS = Counter(
+    "flowfix_admission_rejections_total",
+    "Chat turns turned away: agent queue full (queue_full), waited too long for a slot (queue_timeout) "
+    "or for the session's previous turn (session_busy).",
+    ["reason"],
+)
+TOOL_MEMO = Counter(
+    "flowfix_tool_memo_total", "Read-tool calls answered from the session's memo (hit) or run (miss).", ["tool", "result"],
+)
+AGENT_ITERATIONS = Histogram(
+    "flowfix_agent_iterations", "Agent iterations (model call plus tool calls) per turn.",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15),
+)
+
+# Set to a directory to also write every turn's trace to <dir>/<session_id>.jsonl.
+TRACE_DIR = os.getenv("FLOWFIX_TRACE_DIR")
+
+_current_trace = contextvars.ContextVar("flowfix_trace", default=None)
+
+
+def metrics_response():
+    """
+    Returns (body, content type) for the /metrics endpoint.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+# --- TRACES ---
+class Trace:
+    """
+    The spans recorded during one chat turn, with start offsets and durations in milliseconds.
+    """
+
+    def __init__(self, endpoint, session_id):
+        self.trace_id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.session_id = session_id
+        self.route = "agent"
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        # "agent": the agent's own model calls; "tools": model calls made inside tools.
+        self.tokens = {source: {"input": 0, "output": 0} for source in ("agent", "tools")}
+        self.iterations = 0
+        self._lock = threading.Lock()
+
+    def add_span(self, kind, name, started, seconds, error=None, **attrs):
+        span = {
+            "kind": kind,
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 1),
+            "duration_ms": round(seconds * 1000, 1),
+            **attrs,
+        }
+        if error:
+            span["error"] = error
+        with self._lock:
+            self.spans.append(span)
+
+    def add_tokens(self, input_tokens, output_tokens, source="agent"):
+        with self._lock:
+            self.tokens[source]["input"] += input_tokens
+            self.tokens[source]["output"] += output_tokens
+
+    def callback(self):
+        """
+        A LangChain callback handler that records this turn's LLM calls, tool calls and agent iterations.
+        """
+        from tracing_callbacks import TracingCallbackHandler
+        return TracingCallbackHandler(self)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "session_id": self.session_id,
+                "endpoint": self.endpoint,
+                "route": self.route,
+                "started_at": datetime.datetime.fromtimestamp(self.started_at, datetime.timezone.utc).isoformat(),
+                "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "agent_iterations": self.iterations,
+                "llm_tokens": {source: dict(counts) for source, counts in self.tokens.items()},
+                "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+            }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def turn(endpoint, session_id):
+    """
+    Traces one chat turn: times it, makes it the current trace for span(), and writes it out
+    to TRACE_DIR when that is set. Set trace.route to "fast_path" for turns the agent didn't handle.
+    A streamed turn whose client went away is recorded as "disconnected", not as an error.
+    """
+    trace = Trace(endpoint, session_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except (GeneratorExit, asyncio.CancelledError):
+        # The SSE generator was closed (or its task cancelled) because the client disconnected.
+        trace.route = "disconnected"
+        raise
+    except Exception:
+        trace.route = "error"
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # Streamed turns can be closed from a different context than the one that opened them.
+            pass
+        TURN_SECONDS.labels(endpoint, trace.route).observe(time.perf_counter() - trace.started)
+        if trace.route == "agent":
+            AGENT_ITERATIONS.observe(trace.iterations)
+            for source, counts in trace.tokens.items():
+                TURN_PROMPT_TOKENS.labels(source).observe(counts["input"])
+        if TRACE_DIR:
+            _write_trace(trace)
+
+
+@contextlib.contextmanager
+def span(kind, name, **attrs):
+    """
+    Times one step (a Redis round trip, a Calendar call, ...) into the metrics and the current trace.
+    Yields the span's attributes, so figures only known at the end can be added to them.
+    """
+    started = time.perf_counter()
+    error = None
+    attrs = dict(attrs)
+    try:
+        yield attrs
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        SPAN_SECONDS.labels(kind, name).observe(seconds)
+        if error:
+            SPAN_ERRORS.labels(kind, name).inc()
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(kind, name, started, seconds, error=error, **attrs)
+
+
+def _write_trace(trace):
+    try:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        safe_session = "".join(c if c.isalnum() or c in "-_" else "_" for c in trace.session_id)[:100]
+        with open(os.path.join(TRACE_DIR, f"{safe_session}.jsonl"), "a") as f:
+            f.write(json.dumps(trace.to_dict()) + "\n")
+    except Exception as e:
+        print(f"Could not write trace {trace.trace_id}: {e}")
@@ -0,0 +1,130 @@
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tracing import LLM_TOKENS, SPAN_ERRORS, SPAN_SECONDS
+
+# Kept apart from tracing.py so the web app can import tracing without loading LangChain.
+
+# Run names of the agent executors whose iterations are traced.
+EXECUTOR_NAMES = {"AgentExecutor", "ParallelAgentExecutor"}
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Turns LangChain run events into spans: every LLM call (with token counts), every tool call,
+    and every agent iteration (one planning call plus the tools it asked for). Tokens of LLM
+    calls made inside a tool are counted apart from the agent's own.
+    """
+
+    # Run inline, so events are recorded in order even under the async APIs.
+    run_inline = True
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._runs = {}  # run_id -> (kind, name, started)
+        self._executors = {}  # AgentExecutor run_id -> start of its current iteration
+        self._in_tools = set()  # run_ids of running tools and of the runs nested inside them
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, kind, name, parent_run_id=None):
+        with self._lock:
+            self._runs[run_id] = (kind, name, time.perf_counter())
+            if kind == "tool" or parent_run_id in self._in_tools:
+                self._in_tools.add(run_id)
+
+    def _end(self, run_id, error=None, **attrs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            self._in_tools.discard(run_id)
+        if run is None:
+            return
+        kind, name, started = run
+        seconds = time.perf_counter() - started
+        SPAN_SECONDS.labels(kind, name).observe(seconds)
+        if error:
+            SPAN_ERRORS.labels(kind, name).inc()
+        self.trace.add_span(kind, name, started, seconds, error=error, **attrs)
+
+    def _end_iteration(self, executor_run_id):
+        started = self._executors.get(executor_run_id)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        SPAN_SECONDS.labels("agent_iteration", "agent").observe(seconds)
+        self.trace.add_span("agent_iteration", "agent", started, seconds, iteration=self.trace.iterations)
+
+    # --- Agent iterations ---
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        with self._lock:
+            if parent_run_id in self._in_tools:
+                # A chain run by a tool (e.g. the knowledge base's RAG chain).
+                self._in_tools.add(run_id)
+            elif name in EXECUTOR_NAMES:
+                self._executors[run_id] = None
+            elif parent_run_id in self._executors:
+                # The executor calls the agent once per iteration to plan the next step.
+                self._end_iteration(parent_run_id)
+                self._executors[parent_run_id] = time.perf_counter()
+                self.trace.iterations += 1
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        with self._lock:
+            self._in_tools.discard(run_id)
+            if run_id in self._executors:
+                self._end_iteration(run_id)
+                del self._executors[run_id]
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.on_chain_end(None, run_id=run_id)
+
+    # --- LLM calls ---
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "llm", kwargs.get("name") or (serialized or {}).get("name") or "llm", parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "llm", kwargs.get("name") or (serialized or {}).get("name") or "llm", parent_run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        input_tokens, output_tokens = _token_usage(response)
+        with self._lock:
+            run = self._runs.get(run_id)
+            source = "tools" if run_id in self._in_tools else "agent"
+        if run and (input_tokens or output_tokens):
+            LLM_TOKENS.labels(run[1], "input").inc(input_tokens)
+            LLM_TOKENS.labels(run[1], "output").inc(output_tokens)
+            self.trace.add_tokens(input_tokens, output_tokens, source)
+        self._end(run_id, input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+    # --- Tool calls ---
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "tool", kwargs.get("name") or (serialized or {}).get("name") or "tool", parent_run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+
+def _token_usage(response):
+    """
+    Input/output token counts of an LLMResult, from the message's usage_metadata when available.
+    """
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    if not (input_tokens or output_tokens):
+        usage = (response.llm_output or {}).get("usage_metadata") or (response.llm_output or {}).get("token_usage") or {}
+        input_tokens = usage.get("input_tokens", usage.get("prompt_tokens", 0)) or 0
+        output_tokens = usage.get("output_tokens", usage.get("completion_tokens", 0)) or 0
+    return input_tokens, output_tokens
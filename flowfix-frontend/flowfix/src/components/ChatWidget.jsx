@@ -10,6 +10,8 @@ function ChatWidget({ isOpen, onClose }) {
     const [input, setInput] = useState('');
     // State to show a "typing..." indicator while waiting for the backend
     const [isLoading, setIsLoading] = useState(false);
+    // Progress message from the backend, e.g. "Checking the calendar…"
+    const [statusText, setStatusText] = useState('');
 
     // --- NEW: SESSION ID STATE ---
     const [sessionId, setSessionId] = useState(null);
@@ -34,6 +36,14 @@ function ChatWidget({ isOpen, onClose }) {
         scrollToBottom();
     }, [messages]);
 
+    // Updates the text of the last message in the chat (the AI reply being streamed)
+    const updateLastMessage = (text) => {
+        setMessages(prevMessages => [
+            ...prevMessages.slice(0, -1),
+            { ...prevMessages[prevMessages.length - 1], text }
+        ]);
+    };
+
     // This function handles the form submission
     const handleSendMessage = async (e) => {
         e.preventDefault(); // Prevents the browser from reloading
@@ -45,10 +55,15 @@ function ChatWidget({ isOpen, onClose }) {
         setMessages(prevMessages => [...prevMessages, userMessage]);
         setInput('');
         setIsLoading(true); // Show the typing indicator
+        setStatusText('');
+
+        let replyText = '';
+        let replyStarted = false;
+        let busy = false;
 
         try {
-            // The 'fetch' call to our Python backend API
-            const response = await fetch('https://api.verndigital.com/chat', {
+            // The streaming endpoint sends the reply as Server-Sent Events while it is generated
+            const response = await fetch('https://api.verndigital.com/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -59,22 +74,84 @@ function ChatWidget({ isOpen, onClose }) {
                 }),
             });
 
-            if (!response.ok) {
+            // 429: the server is at capacity and asks us to try again shortly
+            if (response.status === 429) {
+                busy = true;
+                throw new Error('Server busy');
+            }
+            if (!response.ok || !response.body) {
                 throw new Error('Network response was not ok');
             }
 
-            const data = await response.json();
-            const aiMessage = { from: 'ai', text: data.response };
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            // Shows the reply so far, adding the AI message bubble on the first token.
+            // The typing indicator stays up below it until the turn is done, because the agent
+            // can still send status events (e.g. a calendar check) after it has started replying.
+            const showReply = (text) => {
+                if (!replyStarted) {
+                    replyStarted = true;
+                    setMessages(prevMessages => [...prevMessages, { from: 'ai', text }]);
+                } else {
+                    updateLastMessage(text);
+                }
+            };
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // Each event ends with a blank line
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+
+                for (const rawEvent of events) {
+                    let eventName = 'message';
+                    let data = '';
+                    for (const line of rawEvent.split('\n')) {
+                        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    }
+                    if (!data) continue;
+                    const payload = JSON.parse(data);
+
+                    if (eventName === 'token') {
+                        replyText += payload.text;
+                        setStatusText(''); // The last status is over once the reply moves on
+                        showReply(replyText);
+                    } else if (eventName === 'status') {
+                        setStatusText(payload.message);
+                    } else if (eventName === 'done') {
+                        // The final event carries the complete reply
+                        replyText = payload.response || replyText;
+                        showReply(replyText);
+                    } else if (eventName === 'error') {
+                        busy = payload.retry_after !== undefined;
+                        throw new Error(payload.error);
+                    }
+                }
+            }
 
-            // Add the AI's response to the chat
-            setMessages(prevMessages => [...prevMessages, aiMessage]);
+            if (!replyStarted) {
+                throw new Error('Empty response');
+            }
 
         } catch (error) {
             console.error("Error fetching AI response:", error);
-            const errorMessage = { from: 'ai', text: 'Sorry, I seem to be having trouble connecting. Please try again later.' };
-            setMessages(prevMessages => [...prevMessages, errorMessage]);
+            const errorText = busy
+                ? "Sorry, we're very busy right now. Please try again in a few seconds."
+                : 'Sorry, I seem to be having trouble connecting. Please try again later.';
+            if (replyStarted) {
+                updateLastMessage(errorText);
+            } else {
+                setMessages(prevMessages => [...prevMessages, { from: 'ai', text: errorText }]);
+            }
         } finally {
             setIsLoading(false); // Hide the typing indicator
+            setStatusText('');
         }
     };
 
@@ -98,6 +175,7 @@ function ChatWidget({ isOpen, onClose }) {
                 {isLoading && (
                     <div className="message ai-message typing-indicator">
                         <span></span><span></span><span></span>
+                        {statusText && <em className="typing-status">{statusText}</em>}
                     </div>
                 )}
                 {/* This empty div is the target for our auto-scrolling */}